@@ -63,11 +63,21 @@ else
     echo "⚠️ Fichier requirements.txt introuvable, installation des modules ignorée."
 fi
 
+# Saut des étapes à jour : automation/run_pipeline.py tient le manifeste des empreintes
+# (data/.stage_manifest.json) ; PIPELINE_FORCE=1 réexécute tout.
+STAGE_TOOL="automation/run_pipeline.py"
+stage_uptodate() { [ -f "$STAGE_TOOL" ] && $PYTHON_CMD "$STAGE_TOOL" --stage-uptodate "$1" > /dev/null 2>&1; }
+stage_record() { [ -f "$STAGE_TOOL" ] && $PYTHON_CMD "$STAGE_TOOL" --stage-record "$1" > /dev/null 2>&1; }
+
 PY_SCRIPTS=("script/oev_pipeline.py" "script/garden_pipeline.py" "script/muso_pipeline.py" "script/nutrition_pipeline.py" "script/call-pipeline.py" "script/ptme_pipeline.py")
 FAILED_PY=()
 
 for file in "${PY_SCRIPTS[@]}"; do
     if [ -f "$file" ]; then
+        if stage_uptodate "$file"; then
+            echo "⏭️ À jour (entrées inchangées) : $file"
+            continue
+        fi
         echo "⚙️ Exécution : $file"
         
         $PYTHON_CMD "$file"
@@ -77,6 +87,7 @@ for file in "${PY_SCRIPTS[@]}"; do
             FAILED_PY+=("$file")
         else
             echo "✅ Succès : $file"
+            stage_record "$file"
         fi
     else
         echo "⚠️ Fichier introuvable : $file - ignoré"
@@ -92,6 +103,10 @@ FAILED_QMD=()
 
 for file in "${QMD_FILES[@]}"; do
     if [ -f "$file" ]; then
+        if stage_uptodate "$file"; then
+            echo "⏭️ À jour (entrées inchangées) : $file"
+            continue
+        fi
         echo "📄 Rendu : $file"
         
         # Rendu direct sans nettoyage
@@ -109,9 +124,11 @@ for file in "${QMD_FILES[@]}"; do
                 FAILED_QMD+=("$file")
             else
                 echo "✅ Succès (2ème tentative) : $file"
+                stage_record "$file"
             fi
         else
             echo "✅ Succès : $file"
+            stage_record "$file"
         fi
     else
         echo "⚠️ Fichier introuvable : $file - ignoré"
@@ -1,8 +1,13 @@
 import os
+import re
 import sys
+import glob
+import json
+import hashlib
 import subprocess
 from datetime import datetime
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ===========================================================================
 # SCRIPT D'EXÉCUTION AUTOMATIQUE PYTHON
@@ -26,6 +31,59 @@ QMD_FILES = [
     "tracking-call.qmd", 
     "tracking-ptme.qmd"
 ]
+
+# Graphe de dépendances : chaque étape déclare les étapes dont elle dépend ("after")
+# et les fichiers/dossiers qu'elle lit ("inputs", {today} = date du jour) ou produit ("outputs").
+# Une étape démarre dès que ses dépendances sont terminées et que ses entrées existent.
+# "hash" : motifs glob ({today} = date du jour) hachés avec le fichier de l'étape et ses
+# "inputs" ; si l'empreinte est identique à la dernière exécution réussie, l'étape est sautée.
+# "live" : l'étape lit aussi une source distante (SQL, OData) invisible dans l'empreinte.
+COMMON_SOURCES = ["script/utils.py", "script/caris_fonctions.py", "input/*.xlsx"]
+# Partagés par tous les rapports : configuration du site, feuille de style, fonctions importées
+QMD_SOURCES = ["_quarto.yml", "styles.css", "script/utils.py", "input/*.xlsx"]
+STAGES = {
+    "oev":       {"file": "script/oev_pipeline.py",       "after": [], "inputs": [], "outputs": ["outputs/OEV"], "live": True,
+                  "hash": COMMON_SOURCES + ["data/All_child_PatientCode_CaseID {today}.xlsx"]},
+    "garden":    {"file": "script/garden_pipeline.py",    "after": [], "inputs": [], "outputs": ["outputs/all_gardens.xlsx"],
+                  "hash": COMMON_SOURCES + ["data/All Gardens {today}.xlsx"]},
+    "muso":      {"file": "script/muso_pipeline.py",      "after": [], "inputs": [], "outputs": ["../outputs/MUSO"],
+                  "hash": COMMON_SOURCES + ["data/muso_* {today}.xlsx", "data/MUSO - * {today}.xlsx"]},
+    "nutrition": {"file": "script/nutrition_pipeline.py", "after": [], "inputs": [], "outputs": ["outputs/NUTRITION"],
+                  "hash": COMMON_SOURCES + ["data/*NUTRITON* {today}.xlsx", "data/*Nutrition* {today}.xlsx",
+                                            "data/*nutrition* {today}.xlsx"]},
+    "call":      {"file": "script/call-pipeline.py",      "after": [], "inputs": [], "outputs": ["outputs/SERVICES/data_cleaned.xlsx"],
+                  "hash": COMMON_SOURCES + ["data/Caris Health Agent - Enfant - * {today}.xlsx",
+                                            "data/Caris Health Agent - Femme PMTE  - * {today}.xlsx"]},
+    "ptme":      {"file": "script/ptme_pipeline.py",      "after": [], "inputs": [], "outputs": ["outputs/PTME"], "live": True,
+                  "hash": COMMON_SOURCES + ["script/ptme_fonction.py", "sql/*.sql", "data/PTME WITH PATIENT CODE {today}.xlsx"]},
+    "tracking-oev":       {"file": "tracking-oev.qmd",       "after": ["oev"],       "inputs": ["outputs/OEV"],       "outputs": [], "live": True,
+                           "hash": QMD_SOURCES},
+    "tracking-gardening": {"file": "tracking-gardening.qmd", "after": ["garden"],    "inputs": [],                    "outputs": [], "live": True,
+                           "hash": QMD_SOURCES},
+    "tracking-muso":      {"file": "tracking-muso.qmd",      "after": ["muso"],      "inputs": ["../outputs/MUSO"],   "outputs": [],
+                           "hash": QMD_SOURCES},
+    "tracking-nutrition": {"file": "tracking-nutrition.qmd", "after": ["nutrition"], "inputs": ["outputs/NUTRITION"], "outputs": [],
+                           "hash": QMD_SOURCES},
+    "tracking-call":      {"file": "tracking-call.qmd",      "after": ["call"],      "inputs": ["outputs/SERVICES/data_cleaned.xlsx"], "outputs": [],
+                           "hash": QMD_SOURCES},
+    "tracking-ptme":      {"file": "tracking-ptme.qmd",      "after": ["ptme", "call"],
+                           "inputs": ["outputs/PTME", "outputs/SERVICES/data_cleaned.xlsx",
+                                      "data/PTME WITH PATIENT CODE {today}.xlsx", "data/household mother {today}.xlsx"],
+                           "outputs": [], "hash": QMD_SOURCES},
+}
+
+# Manifeste des empreintes (hors Git) ; PIPELINE_FORCE=1 ou --force réexécute tout.
+# Les étapes "live" ne sont sautées que si leur dernière exécution date de moins de
+# PIPELINE_LIVE_MAX_AGE secondes (0 par défaut : toujours réexécutées).
+STAGE_MANIFEST = os.getenv("PIPELINE_MANIFEST", os.path.join("data", ".stage_manifest.json"))
+FORCE_RUN = os.getenv("PIPELINE_FORCE", "0") in {"1", "true", "yes"} or "--force" in sys.argv
+LIVE_MAX_AGE = int(os.getenv("PIPELINE_LIVE_MAX_AGE", "0"))
+
+# Parallélisme : nombre d'étapes simultanées, et de rendus Quarto simultanés.
+# Les rendus d'un même projet écrivent dans le même _site/ (et .quarto/) : un seul à la fois,
+# les scripts Python continuent en parallèle pendant ce temps.
+MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", str(min(6, os.cpu_count() or 2))))
+QUARTO_MAX_PARALLEL = max(1, int(os.getenv("QUARTO_MAX_PARALLEL", "1")))
 # ---------------------
 
 def run_command(command, check=False, shell=False):
@@ -154,6 +212,219 @@ def render_quarto_files():
             
     return failed_qmd
 
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def load_manifest():
+    """Charge le manifeste des empreintes (vide s'il n'existe pas)"""
+    if os.path.exists(STAGE_MANIFEST):
+        with open(STAGE_MANIFEST, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}, "stages": {}}
+
+
+def save_manifest(manifest):
+    """Écrit le manifeste de façon atomique ; les empreintes des fichiers disparus sont retirées"""
+    # Les exports datés ({today}) changent de nom chaque jour : sans purge, le cache grossit sans fin
+    manifest["files"] = {p: v for p, v in manifest["files"].items() if os.path.exists(p)}
+    os.makedirs(os.path.dirname(STAGE_MANIFEST) or ".", exist_ok=True)
+    tmp = STAGE_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, STAGE_MANIFEST)
+
+
+def file_digest(path, cache):
+    """SHA-1 du contenu, recalculé seulement si la taille ou la date de modification a changé"""
+    st = os.stat(path)
+    hit = cache.get(path)
+    if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+        return hit[2]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    cache[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return cache[path][2]
+
+
+def expand_pattern(pattern):
+    """Remplace {today} par la date du jour dans un chemin ou motif glob"""
+    return pattern.format(today=datetime.now().strftime("%Y-%m-%d"))
+
+
+def stage_files(spec):
+    """Fichiers entrant dans l'empreinte d'une étape (fichier de l'étape, "hash" et "inputs")"""
+    files = {spec["file"]}
+    for pattern in spec.get("hash", []) + spec["inputs"]:
+        for path in glob.glob(expand_pattern(pattern)):
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files.update(os.path.join(root, n) for n in names if not n.startswith("~$"))
+            elif not os.path.basename(path).startswith("~$"):
+                files.add(path)
+    return files
+
+
+def stage_digest(spec, cache):
+    """Empreinte des entrées d'une étape ; la date du jour est retirée des noms de fichiers"""
+    h = hashlib.sha1()
+    for key, path in sorted((_DATE_RE.sub("", p), p) for p in stage_files(spec)):
+        h.update(key.encode("utf-8"))
+        h.update(file_digest(path, cache).encode("ascii"))
+    return h.hexdigest()
+
+
+def is_up_to_date(name, spec, digest, manifest):
+    """True si l'étape a déjà réussi avec les mêmes entrées et que ses sorties existent"""
+    if FORCE_RUN:
+        return False
+    entry = manifest["stages"].get(name)
+    if not entry or entry.get("digest") != digest:
+        return False
+    if not all(os.path.exists(p) for p in spec["outputs"]):
+        return False
+    if spec.get("live"):
+        age = (datetime.now() - datetime.fromisoformat(entry["finished_at"])).total_seconds()
+        return age < LIVE_MAX_AGE
+    return True
+
+
+def record_stage(name, digest, manifest, duration=None):
+    """Enregistre l'empreinte d'une exécution réussie"""
+    manifest["stages"][name] = {
+        "digest": digest,
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "duration": round(duration, 1) if duration is not None else None,
+    }
+
+
+def stage_by_file(file):
+    """Nom de l'étape correspondant à un chemin de script ou de rapport"""
+    for name, spec in STAGES.items():
+        if os.path.normpath(spec["file"]) == os.path.normpath(file):
+            return name
+    return None
+
+
+def run_stage(name, spec, python_cmd):
+    """Exécute une étape du graphe (script Python ou rendu Quarto) et retourne (succès, durée, erreur)"""
+    file = spec["file"]
+    t0 = time.time()
+    if file.endswith(".py"):
+        success, error_msg = run_command([python_cmd, file], check=True)
+    else:
+        success, error_msg = run_command(["quarto", "render", file, "--quiet"], check=True)
+        if not success:
+            print(f"Première tentative échouée pour {file}, nouvelle tentative...")
+            time.sleep(1)
+            success, error_msg = run_command(["quarto", "render", file, "--quiet"], check=True)
+    return success, time.time() - t0, error_msg
+
+
+def run_dag(python_cmd, stages=STAGES, max_workers=MAX_WORKERS):
+    """
+    Exécute les étapes du graphe en parallèle : une étape est lancée dès que toutes
+    les étapes de "after" sont terminées (succès ou échec, comme l'exécution
+    séquentielle qui rendait les rapports même après l'échec d'un script) et que
+    ses "inputs" existent. Le temps total tend vers celui du chemin critique.
+
+    Une étape dont l'empreinte des entrées est inchangée depuis sa dernière
+    exécution réussie est sautée (statut "skipped") et ses sorties réutilisées.
+
+    Returns:
+        dict: nom d'étape -> statut ("ok", "skipped", "failed", "missing", "blocked")
+    """
+    print(f"\n[1-2/3] Exécution du graphe ({len(stages)} étapes, {max_workers} en parallèle)...")
+    status, durations, digests = {}, {}, {}
+    pending = dict(stages)
+    running = {}
+    manifest = load_manifest()
+    t_start = time.time()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            quarto_running = sum(1 for n in running.values() if stages[n]["file"].endswith(".qmd"))
+            for name in list(pending):
+                spec = pending[name]
+                if not all(dep in status for dep in spec["after"]):
+                    continue
+                if not os.path.exists(spec["file"]):
+                    print(f"Fichier introuvable : {spec['file']} - ignoré")
+                    status[name] = "missing"
+                    del pending[name]
+                    continue
+                missing_inputs = [expand_pattern(p) for p in spec["inputs"] if not os.path.exists(expand_pattern(p))]
+                if missing_inputs:
+                    print(f"Entrées manquantes pour {spec['file']} : {', '.join(missing_inputs)}")
+                    status[name] = "blocked"
+                    del pending[name]
+                    continue
+                if name not in digests:
+                    digests[name] = stage_digest(spec, manifest["files"])
+                    if is_up_to_date(name, spec, digests[name], manifest):
+                        print(f"À jour (entrées inchangées) : {spec['file']} - sauté")
+                        status[name] = "skipped"
+                        del pending[name]
+                        continue
+                is_qmd = spec["file"].endswith(".qmd")
+                if is_qmd and quarto_running >= QUARTO_MAX_PARALLEL:
+                    continue
+                quarto_running += is_qmd
+                print(f"Démarrage : {spec['file']}")
+                running[pool.submit(run_stage, name, spec, python_cmd)] = name
+                del pending[name]
+
+            if not running:
+                # plus rien d'exécutable : dépendances inconnues dans le graphe
+                for name in pending:
+                    print(f"Dépendances introuvables pour {stages[name]['file']} : {stages[name]['after']}")
+                    status[name] = "blocked"
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                success, duration, error_msg = fut.result()
+                status[name] = "ok" if success else "failed"
+                durations[name] = duration
+                if success:
+                    print(f"Succès : {stages[name]['file']} ({duration:.0f}s)")
+                    record_stage(name, digests[name], manifest, duration)
+                    save_manifest(manifest)
+                else:
+                    print(f"Échec : {stages[name]['file']} ({duration:.0f}s)")
+                    # print(f"Détails de l'erreur:\n{error_msg}") # Optionnel pour plus de logs
+
+    save_manifest(manifest)
+    elapsed = time.time() - t_start
+    n_skipped = sum(1 for st in status.values() if st == "skipped")
+    print(f"Graphe terminé en {elapsed:.0f}s (somme des étapes : {sum(durations.values()):.0f}s, "
+          f"{n_skipped} étape(s) à jour sautée(s))")
+    return status
+
+
+def stage_cli(argv):
+    """
+    Points d'entrée pour run_all.sh :
+      --stage-uptodate FICHIER : code 0 si l'étape est à jour (à sauter), 1 sinon
+      --stage-record FICHIER   : enregistre l'empreinte après une exécution réussie
+    """
+    mode, file = argv[0], argv[1]
+    name = stage_by_file(file)
+    if name is None:
+        return 1
+    manifest = load_manifest()
+    digest = stage_digest(STAGES[name], manifest["files"])
+    if mode == "--stage-uptodate":
+        up_to_date = is_up_to_date(name, STAGES[name], digest, manifest)
+        save_manifest(manifest)  # conserve le cache des empreintes de fichiers
+        return 0 if up_to_date else 1
+    record_stage(name, digest, manifest)
+    save_manifest(manifest)
+    return 0
+
+
 def run_git_operations():
     """Exécute les opérations Git (pull, add, commit, push)"""
     print("\n[3/3] Opérations Git...")
@@ -239,6 +510,10 @@ def run_git_operations():
 def main():
     """Fonction principale du pipeline"""
     
+    for i, arg in enumerate(sys.argv[1:], start=1):
+        if arg in ("--stage-uptodate", "--stage-record") and i + 1 < len(sys.argv):
+            sys.exit(stage_cli(sys.argv[i:i + 2]))
+
     print("Début de l'exécution globale")
     print(f"Date : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("-------------------------------")
@@ -251,11 +526,18 @@ def main():
     if not install_dependencies(python_cmd):
         sys.exit(1)
 
-    # 2. Exécution des scripts Python
-    failed_py = execute_python_scripts(python_cmd)
-    
-    # 3. Rendu Quarto
-    failed_qmd = render_quarto_files()
+    if "--sequential" in sys.argv:
+        # 2. Exécution des scripts Python
+        failed_py = execute_python_scripts(python_cmd)
+
+        # 3. Rendu Quarto
+        failed_qmd = render_quarto_files()
+    else:
+        # 2-3. Scripts et rendus Quarto ordonnancés selon le graphe de dépendances
+        status = run_dag(python_cmd)
+        failed = [STAGES[n]["file"] for n, st in status.items() if st in ("failed", "blocked")]
+        failed_py = [f for f in failed if f.endswith(".py")]
+        failed_qmd = [f for f in failed if f.endswith(".qmd")]
     
     # 4. Opérations Git
     failed_git = run_git_operations()
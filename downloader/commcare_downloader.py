@@ -7,6 +7,13 @@ CommCare Smart Downloader — Version durcie
 - Regex nommage export tolérante + fallback par mtime
 - Aucune fuite de cookies/PII
 - stats.json écrit en fin d'exécution (pour CI)
+- Moteur HTTP direct (http_export_client) en premier, Selenium en fallback
+- Fin de téléchargement par événements système de fichiers (download_watcher), sans scrutation
+- Historique SQLite des tentatives (download_history) : rapport p50/p95 et échéance par base
+- Détection de blocage (partiel qui ne grossit plus) : abandon et remise en file immédiats
+- Archive adressée par contenu (export_archive) : empreinte, lignes et « inchangé depuis » par base
+- Fallback Selenium en pool de navigateurs headless (un dossier de téléchargement chacun),
+  exports les plus longs d'abord d'après les durées historiques (SQLite, sinon stats.json)
 """
 
 import os
@@ -16,6 +23,10 @@ import time
 import glob
 import logging
 import platform
+import threading
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
 from urllib.parse import urljoin
@@ -28,6 +39,9 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 from selenium.webdriver.common.action_chains import ActionChains
 
+import download_history
+import export_archive
+
 # -------------------------------------------------------------------
 # CONFIG
 # -------------------------------------------------------------------
@@ -115,13 +129,33 @@ MAX_RETRIES_PER_FILE = 2
 MAX_RETRIES_HEAVY = 3
 MAX_GLOBAL_PASSES = 2
 
-# Timeouts (secondes)
+# Timeouts (secondes) — plafonds ; l'échéance réelle vient de l'historique (download_history.timeout_for)
 VERIFICATION_TIMEOUT = 1800   # 30 min
 HEAVY_FILE_TIMEOUT    = 5400  # 90 min
 NUTRITION_TIMEOUT     = 5400  # 90 min
 
+# Détection de blocage pendant l'écriture disque
+STALL_SECONDS = int(os.getenv("COMMCARE_STALL_SECONDS", "180"))  # partiel qui ne grossit plus
+STALL_START_GRACE = 300   # aucun partiel ni fichier après le déclenchement
+STALL_CHECK_INTERVAL = 5
+MAX_STALL_REQUEUES = 1    # remises en file (même passe) après un blocage
+
 HEADLESS = os.getenv("HEADLESS", "false").lower() in {"1", "true", "yes"}
 
+# Moteur de téléchargement : "auto" (HTTP puis Selenium), "http" ou "selenium"
+DOWNLOAD_ENGINE = os.getenv("COMMCARE_ENGINE", "auto").lower()
+
+# Pool Selenium : nombre de navigateurs en parallèle (headless dès que > 1)
+SELENIUM_WORKERS = int(os.getenv("COMMCARE_SELENIUM_WORKERS", "3"))
+
+# Rapport CI et durées historiques (ordonnancement « plus long d'abord »)
+STATS_FILE = "stats.json"
+UNKNOWN_HEAVY_SECONDS = 1800   # estimation d'un gros fichier jamais téléchargé
+UNKNOWN_LIGHT_SECONDS = 120
+
+# Exécution courante dans l'historique (download_history)
+_RUN_ID: Optional[int] = None
+
 # -------------------------------------------------------------------
 # LOGGING
 # -------------------------------------------------------------------
@@ -151,7 +185,10 @@ def build_pattern_with_today(base: str) -> re.Pattern:
       Base YYYY-MM-DD.xlsx
       + suffixes (1)
     """
-    date = today_str()
+    return _pattern_for_day(base, today_str())
+
+@lru_cache(maxsize=256)
+def _pattern_for_day(base: str, date: str) -> re.Pattern:
     base_esc = re.escape(base)
     pat = rf"^{base_esc}\s*(?:\("
     pat += rf"created\s+\d{{4}}-\d{{2}}-\d{{2}}(?:\s+at\s+\d{{2}}\.\d{{2}})?"
@@ -165,24 +202,52 @@ def list_partial(folder: str) -> List[str]:
     # Chrome .crdownload ; Edge .partial
     return glob.glob(os.path.join(folder, "*.crdownload")) + glob.glob(os.path.join(folder, "*.partial"))
 
+def match_base_today(base: str, folder: str, name: str) -> int:
+    """2 : nom conforme au motif du jour ; 1 : même base en préfixe + mtime du jour ; 0 : sinon."""
+    if build_pattern_with_today(base).match(name):
+        return 2
+    if name.lower().startswith(base.lower()):
+        try:
+            ts = datetime.fromtimestamp(os.path.getmtime(os.path.join(folder, name))).strftime("%Y-%m-%d")
+            if ts == today_str():
+                return 1
+        except Exception:
+            pass
+    return 0
+
 def file_for_base_today(base: str, folder: str) -> Optional[str]:
-    pat = build_pattern_with_today(base)
+    watcher = _WATCHERS.get(os.path.abspath(folder))
+    if watcher is not None and base in watcher.bases:
+        return watcher.lookup(base)
     candidates = list_xlsx(folder)
-    # 1) match par regex
-    for f in candidates:
-        if pat.match(f):
-            return os.path.join(folder, f)
-    # 2) fallback: même base en préfixe + mtime du jour
+    # 1) match par regex, 2) fallback: même base en préfixe + mtime du jour
+    best, best_strength = None, 0
     for f in candidates:
-        if f.lower().startswith(base.lower()):
-            p = os.path.join(folder, f)
-            try:
-                ts = datetime.fromtimestamp(os.path.getmtime(p)).strftime("%Y-%m-%d")
-                if ts == today_str():
-                    return p
-            except Exception:
-                continue
-    return None
+        strength = match_base_today(base, folder, f)
+        if strength > best_strength:
+            best, best_strength = os.path.join(folder, f), strength
+            if strength == 2:
+                break
+    return best
+
+# -------------------------------------------------------------------
+# SURVEILLANCE DES DOSSIERS (index base → fichier du jour)
+# -------------------------------------------------------------------
+_WATCHERS: Dict[str, object] = {}
+
+def watch_folder(folder: str):
+    """Démarre (une fois) la surveillance d'un dossier ; file_for_base_today lit alors l'index."""
+    from download_watcher import DownloadWatcher
+    key = os.path.abspath(folder)
+    if key not in _WATCHERS:
+        _WATCHERS[key] = DownloadWatcher(key, EXPECTED_BASES, match_base_today).start()
+        log.info(f"👁️ Surveillance {_WATCHERS[key].backend}: {key}")
+    return _WATCHERS[key]
+
+def unwatch_folder(folder: str) -> None:
+    watcher = _WATCHERS.pop(os.path.abspath(folder), None)
+    if watcher is not None:
+        watcher.stop()
 
 def size_mb(path: str) -> float:
     try:
@@ -213,6 +278,56 @@ def cleanup_stuck_partials(folder: str, older_than_sec: int = 300) -> int:
             pass
     return removed
 
+def worker_dir(index: int) -> str:
+    """Dossier de téléchargement propre à un navigateur du pool (dans DOWNLOAD_DIR : même disque)."""
+    folder = ensure_dir(os.path.join(DOWNLOAD_DIR, f".selenium_worker_{index}"))
+    watch_folder(folder)
+    return folder
+
+def publish_download(path: str, dest_dir: str) -> str:
+    """Déplace atomiquement un fichier terminé vers le dossier partagé."""
+    final = os.path.join(dest_dir, os.path.basename(path))
+    if os.path.abspath(path) != os.path.abspath(final):
+        os.replace(path, final)
+    return final
+
+# -------------------------------------------------------------------
+# ORDONNANCEMENT (durées historiques)
+# -------------------------------------------------------------------
+def load_durations(path: str = STATS_FILE, engine: Optional[str] = None) -> Dict[str, float]:
+    """
+    Durée attendue par base : médiane de l'historique SQLite si disponible,
+    sinon dernière durée réussie de stats.json.
+    Avec `engine` ("http" ou "selenium"), seules les durées de ce moteur sont prises en compte.
+    """
+    durations: Dict[str, float] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if not engine:
+            # Durées cumulées tous moteurs confondus
+            durations.update(payload.get("durations") or {})
+        for base, s in (payload.get("per_file") or {}).items():
+            if s.get("status") == "downloaded" and s.get("seconds") \
+                    and (not engine or s.get("engine", "selenium") == engine):
+                durations[base] = s["seconds"]
+    except (OSError, ValueError):
+        pass
+    try:
+        durations.update(download_history.typical_durations(engine=engine))
+    except Exception as e:
+        log.warning(f"Historique des téléchargements illisible: {e}")
+    return durations
+
+def estimate_seconds(base: str, durations: Dict[str, float]) -> float:
+    if base in durations:
+        return float(durations[base])
+    return UNKNOWN_HEAVY_SECONDS if base in HEAVY_FILES else UNKNOWN_LIGHT_SECONDS
+
+def order_longest_first(bases: List[str], durations: Dict[str, float]) -> List[str]:
+    """Plus long d'abord : les gros exports démarrent tôt, les petits remplissent les trous."""
+    return sorted(bases, key=lambda b: estimate_seconds(b, durations), reverse=True)
+
 # -------------------------------------------------------------------
 # SELENIUM CORE (VM Knockout helpers)
 # -------------------------------------------------------------------
@@ -518,30 +633,70 @@ def commcare_login(driver, email: str, password: str, first_url: str):
 # -------------------------------------------------------------------
 # TÉLÉCHARGEMENT + VÉRIF (avec stats)
 # -------------------------------------------------------------------
-def wait_download_done(base: str, folder: str, timeout: int) -> Optional[str]:
+class DownloadStalled(Exception):
+    """Le téléchargement ne progresse plus (partiel figé ou jamais démarré)."""
+
+
+class StallDetector:
+    """Suit la taille cumulée des partiels d'un dossier et signale l'absence de croissance."""
+
+    def __init__(self, folder: str, stall_after: Optional[int] = None, start_grace: Optional[int] = None):
+        self.folder = folder
+        self.stall_after = STALL_SECONDS if stall_after is None else stall_after
+        self.start_grace = STALL_START_GRACE if start_grace is None else start_grace
+        self.started = time.time()
+        self.last_growth = self.started
+        self.last_size = -1
+        self.seen_partial = False
+
+    def check(self) -> None:
+        parts = list_partial(self.folder)
+        size = sum(size_mb(p) for p in parts)
+        now = time.time()
+        if parts:
+            self.seen_partial = True
+            if size > self.last_size:
+                self.last_size, self.last_growth = size, now
+            elif now - self.last_growth > self.stall_after:
+                raise DownloadStalled(f"partiel figé à {size:.1f} MB depuis {now - self.last_growth:.0f}s")
+        elif not self.seen_partial and now - self.started > self.start_grace:
+            raise DownloadStalled(f"aucun téléchargement démarré après {self.start_grace}s")
+
+
+def wait_download_done(base: str, folder: str, timeout: int, stall: Optional[StallDetector] = None) -> Optional[str]:
     """
     Attend la fin du téléchargement : pas de partials, fichier stable & pattern du jour match.
+    Lève DownloadStalled dès que `stall` détecte un téléchargement figé.
     """
+    watcher = _WATCHERS.get(os.path.abspath(folder))
     end = time.time() + timeout
     while time.time() < end:
-        # partials ?
-        parts = list_partial(folder)
-        if parts:
+        if watcher is not None and base in watcher.bases:
+            # Le renommage .crdownload → .xlsx marque la fin : pas de contrôle de stabilité
+            f = watcher.wait_for(base, min(STALL_CHECK_INTERVAL, max(0.0, end - time.time())))
+            if f:
+                return f
+        elif list_partial(folder):
             time.sleep(2)
-            continue
-
-        # fichier final du jour ?
-        f = file_for_base_today(base, folder)
-        if f and is_stable(f, 3.0):
-            return f
-        time.sleep(2)
+        else:
+            # fichier final du jour ?
+            f = file_for_base_today(base, folder)
+            if f and is_stable(f, 3.0):
+                return f
+            time.sleep(2)
+        if stall is not None:
+            stall.check()
     return None
 
-def download_one(base: str, driver, stats: dict) -> bool:
+def download_one(base: str, driver, stats: dict, folder: Optional[str] = None, pass_no: int = 1) -> bool:
     """
     Télécharge « 1 fois » si absent. Relance seulement si non terminé/échoué.
      - Utilise Knockout VM ou lien primaire pour déclencher le téléchargement quand prêt.
+     - `folder` : dossier de téléchargement du navigateur (pool) ; le fichier terminé est
+       ensuite déplacé atomiquement dans DOWNLOAD_DIR.
+     - Chaque tentative est ajoutée à l'historique (download_history).
     """
+    folder = folder or DOWNLOAD_DIR
     already = file_for_base_today(base, DOWNLOAD_DIR)
     if already:
         log.info(f"⏩ Déjà présent: {os.path.basename(already)}")
@@ -549,40 +704,62 @@ def download_one(base: str, driver, stats: dict) -> bool:
         return True
 
     # partial bloqué ?
-    cleanup_stuck_partials(DOWNLOAD_DIR, older_than_sec=300)
+    cleanup_stuck_partials(folder, older_than_sec=300)
 
     # timeouts selon type
     verify_to = VERIFICATION_TIMEOUT
     if base in HEAVY_FILES: verify_to = HEAVY_FILE_TIMEOUT
     if base == "Nutrition": verify_to = NUTRITION_TIMEOUT
+    # patience pour la phase “ready” + déclenchement
+    patience = 900
+    if base in HEAVY_FILES or base == "Nutrition":
+        patience = 3600
+    # Échéance d'une tentative (préparation + écriture) d'après les durées récentes de la base
+    deadline = download_history.timeout_for(base, patience + verify_to, engine="selenium")
 
     attempts = MAX_RETRIES_HEAVY if base in HEAVY_FILES else MAX_RETRIES_PER_FILE
 
     ok = False
+    stalled = False
     last_path = None
     t0 = time.time()
     for k in range(1, attempts + 1):
         log.info(f"📥 {base} — tentative {k}/{attempts}")
+        t_attempt = time.time()
         try:
             trigger_download(base, driver)
 
-            # patience pour la phase “ready” + déclenchement
-            patience = 900
-            if base in HEAVY_FILES or base == "Nutrition":
-                patience = 3600
-            if not click_download(driver, patience):
+            if not click_download(driver, min(patience, deadline)):
                 raise TimeoutException("Lien de téléchargement introuvable/inaccessible")
 
-            # attend la fin d'écriture disque
-            path = wait_download_done(base, DOWNLOAD_DIR, verify_to)
+            # attend la fin d'écriture disque (reste de l'échéance, abandon dès un blocage)
+            remaining = min(verify_to, max(STALL_SECONDS, deadline - (time.time() - t_attempt)))
+            path = wait_download_done(base, folder, int(remaining), StallDetector(folder))
             if path:
                 ok = True
-                last_path = path
+                last_path = publish_download(path, DOWNLOAD_DIR)
+                download_history.record_attempt(_RUN_ID, base, "selenium", "ok", time.time() - t_attempt,
+                                                os.path.getsize(last_path), pass_no=pass_no, attempt=k)
                 break
             else:
-                log.warning(f"⏰ Timeout d'attente fin du téléchargement ({verify_to}s)")
+                log.warning(f"⏰ Timeout d'attente fin du téléchargement ({remaining:.0f}s)")
+                download_history.record_attempt(_RUN_ID, base, "selenium", "timeout", time.time() - t_attempt,
+                                                reason=f"fin non détectée après {remaining:.0f}s",
+                                                pass_no=pass_no, attempt=k)
+        except DownloadStalled as e:
+            # Abandon immédiat : le navigateur passe à un autre export, la base est remise en file
+            log.warning(f"🧊 Téléchargement bloqué ({e}) — abandon et remise en file")
+            download_history.record_attempt(_RUN_ID, base, "selenium", "stalled", time.time() - t_attempt,
+                                            reason=str(e), pass_no=pass_no, attempt=k)
+            # Le partiel figé ne doit pas être pris pour la tentative suivante
+            cleanup_stuck_partials(folder, older_than_sec=0)
+            stalled = True
+            break
         except Exception as e:
             log.warning(f"⚠️ Tentative échouée: {e}")
+            status = "timeout" if isinstance(e, TimeoutException) else "error"
+            download_history.record_attempt(_RUN_ID, base, "selenium", status, time.time() - t_attempt,
+                                            reason=f"{type(e).__name__}: {e}", pass_no=pass_no, attempt=k)
 
         # backoff exponentiel
         sleep_sec = min(60, 5 * (2 ** (k - 1)))
@@ -590,7 +767,7 @@ def download_one(base: str, driver, stats: dict) -> bool:
         time.sleep(sleep_sec)
 
     # entre tentatives, on nettoie les partials bloqués
-    cleanup_stuck_partials(DOWNLOAD_DIR, older_than_sec=300)
+    cleanup_stuck_partials(folder, older_than_sec=300)
     time.sleep(2)
 
     dt = time.time() - t0
@@ -601,25 +778,213 @@ def download_one(base: str, driver, stats: dict) -> bool:
             "status": "downloaded",
             "size_mb": mb,
             "seconds": round(dt, 1),
-            "mbps": None if mbps is None else round(mbps, 3)
+            "mbps": None if mbps is None else round(mbps, 3),
+            "engine": "selenium",
         }
         log.info(
             f"🎉 OK {base} — {mb:.1f} MB en {dt:.1f}s (~{(mb/dt):.3f} MB/s)" if dt > 0 else f"🎉 OK {base}"
         )
         return True
     else:
-        stats[base] = {"status": "failed", "size_mb": None, "seconds": round(dt, 1), "mbps": None}
-        log.error(f"❌ Échec {base} après {attempts} tentative(s)")
+        stats[base] = {"status": "stalled" if stalled else "failed", "size_mb": None, "seconds": round(dt, 1), "mbps": None}
+        log.error(f"❌ Échec {base} après {k} tentative(s)" + (" (bloqué)" if stalled else ""))
         return False
 
+# -------------------------------------------------------------------
+# IDENTIFIANTS & RAPPORT
+# -------------------------------------------------------------------
+def load_credentials():
+    """EMAIL / PASSWORD : attributs du module (GUI) > variables d'env > variables/id_cc.env."""
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    load_dotenv("id_cc.env")
+    # Try module attributes first (set by GUI), then environment variables
+    email = getattr(sys.modules[__name__], "EMAIL", None) or os.getenv("EMAIL")
+    password = getattr(sys.modules[__name__], "PASSWORD", None) or os.getenv("PASSWORD") or os.getenv("PASSWORD_CC")
+    # If still missing, try variables/id_cc.env
+    if not email or not password:
+        env_path = Path("variables") / "id_cc.env"
+        if env_path.exists():
+            with env_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    if "=" in line:
+                        key, value = line.strip().split("=", 1)
+                        key = key.strip().lower()
+                        value = value.strip()
+                        if key == "email" and not email:
+                            email = value
+                        if key == "password" and not password:
+                            password = value
+        if not email or not password:
+            raise RuntimeError("Identifiants CommCare manquants (EMAIL / PASSWORD)")
+    return email, password
+
+def archive_downloads(stats: dict) -> None:
+    """
+    Archive les exports du jour (export_archive) et note empreinte, lignes et « inchangé depuis »
+    dans stats ; un export identique au précédent ne coûte qu'un hachage. Applique ensuite la
+    rétention (COMMCARE_ARCHIVE_KEEP contenus distincts par base).
+    """
+    for base in EXPECTED_BASES:
+        path = file_for_base_today(base, DOWNLOAD_DIR)
+        if not path:
+            continue
+        try:
+            entry = export_archive.archive_file(base, path)
+        except Exception as e:
+            log.warning(f"Archivage impossible pour {base}: {e}")
+            continue
+        if base in stats:
+            stats[base].update({k: entry[k] for k in ("sha256", "rows", "unchanged_since")})
+        if entry["unchanged_since"]:
+            log.info(f"🟰 {base} inchangé depuis {entry['unchanged_since']}")
+    try:
+        done = export_archive.prune()
+        if done["objects"]:
+            log.info(f"🧹 Archive : {done['objects']} ancien(s) export(s) supprimé(s) "
+                     f"({done['bytes'] / (1024 * 1024):.1f} MB)")
+    except Exception as e:
+        log.warning(f"Purge de l'archive impossible: {e}")
+
+def write_run_report(stats: dict) -> list:
+    """Journalise le rapport final et écrit stats.json (CI). Retourne les bases échouées."""
+    log.info("================= RAPPORT =================")
+    total = len(EXPECTED_BASES)
+    done_today = sum(1 for b in EXPECTED_BASES if file_for_base_today(b, DOWNLOAD_DIR))
+    failed = [b for b in EXPECTED_BASES if not file_for_base_today(b, DOWNLOAD_DIR)]
+    log.info(f"Fichiers attendus : {total}")
+    log.info(f"Téléchargés présents aujourd’hui : {done_today}")
+    log.info(f"Échoués : {len(failed)} — {failed if failed else ''}")
+
+    total_mb = 0.0
+    total_time = 0.0
+    for b, s in stats.items():
+        sz = s.get("size_mb") or 0.0
+        tm = s.get("seconds") or 0.0
+        total_mb += sz
+        total_time += tm
+        log.info(f" - {b:40s} | {s['status']:<10s} | {sz:6.1f} MB | {tm:6.1f} s | {('%.3f MB/s' % s['mbps']) if s['mbps'] else '-'}")
+
+    if total_mb > 0 and total_time > 0:
+        log.info(f"📊 Volume total: {total_mb:.1f} MB — Temps cumulé: {total_time:.1f} s — Débit moyen ~ {total_mb/total_time:.3f} MB/s")
+
+    # Écrire stats.json pour CI
+    run_summary = {
+        "expected": total,
+        "present_today": done_today,
+        "failed_count": len(failed),
+        "failed_list": failed,
+        "total_mb": round(total_mb, 2),
+        "total_time_sec": round(total_time, 1),
+        "avg_mbps": round((total_mb / total_time), 3) if total_time > 0 else None,
+        "run_date": datetime.now().isoformat(timespec="seconds")
+    }
+    # Durées conservées d'une exécution à l'autre (ordonnancement du prochain passage)
+    durations = load_durations()
+    durations.update({b: s["seconds"] for b, s in stats.items() if s.get("status") == "downloaded" and s.get("seconds")})
+    payload = {"per_file": stats, "run_summary": run_summary, "durations": durations}
+    try:
+        with open(STATS_FILE, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        log.warning(f"Impossible d'écrire stats.json: {e}")
+    return failed
+
 # -------------------------------------------------------------------
 # MAIN
 # -------------------------------------------------------------------
+def run_selenium(to_download: List[str], email: str, password: str, stats: dict,
+                 workers: Optional[int] = None, durations: Optional[Dict[str, float]] = None) -> None:
+    """
+    Fallback Selenium : pool de navigateurs, chacun avec son dossier de téléchargement.
+    File d'attente commune triée « plus long d'abord » : chaque navigateur libre prend l'export
+    suivant, si bien que les petits formulaires passent pendant les gros exports.
+    """
+    durations = load_durations(engine="selenium") if durations is None else durations
+    n = max(1, min(workers or SELENIUM_WORKERS, len(to_download)))
+    headless = HEADLESS or n > 1
+    lock = threading.Lock()
+    drivers: Dict[int, object] = {}
+    requeued: Dict[str, int] = {}
+    log.info(f"🧭 Pool Selenium: {n} navigateur(s){' headless' if headless else ''}")
+
+    def _worker(index: int, pending: deque, failed: list) -> None:
+        folder = worker_dir(index)
+        while True:
+            with lock:
+                if not pending:
+                    return
+                base = pending.popleft()
+            # Skip si le fichier est apparu entre-temps
+            existing = file_for_base_today(base, DOWNLOAD_DIR)
+            if existing:
+                log.info(f"⏩ Déjà présent (skip): {base}")
+                stats.setdefault(base, {"status": "present", "size_mb": size_mb(existing), "seconds": 0.0, "mbps": None})
+                continue
+            if index not in drivers:
+                try:
+                    drivers[index] = start_chrome(folder, headless)
+                    # Login sur le premier export pris par ce navigateur
+                    commcare_login(drivers[index], email, password, EXPORT_URLS[base])
+                except Exception as e:
+                    log.error(f"❌ Navigateur #{index} indisponible: {e}")
+                    with lock:
+                        failed.append(base)
+                    return
+            log.info(f"🧭 [#{index}] {base} (~{estimate_seconds(base, durations):.0f}s estimés)")
+            if not download_one(base, drivers[index], stats, folder=folder, pass_no=passes):
+                # On ne re-tentera que ceux réellement échoués (non présents)
+                if not file_for_base_today(base, DOWNLOAD_DIR):
+                    with lock:
+                        # Bloqué : remis en fin de file de la passe courante plutôt qu'à la suivante
+                        if stats.get(base, {}).get("status") == "stalled" and requeued.get(base, 0) < MAX_STALL_REQUEUES:
+                            requeued[base] = requeued.get(base, 0) + 1
+                            log.info(f"🔁 {base} remis en file ({requeued[base]}/{MAX_STALL_REQUEUES})")
+                            pending.append(base)
+                        else:
+                            failed.append(base)
+
+    passes = 0
+    try:
+        while to_download and passes < MAX_GLOBAL_PASSES:
+            passes += 1
+            log.info(f"================= PASSE #{passes} =================")
+            pending = deque(order_longest_first(to_download, durations))
+            next_round: List[str] = []
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                for fut in [pool.submit(_worker, i, pending, next_round) for i in range(1, n + 1)]:
+                    fut.result()
+            # Bases restées en file si tous les navigateurs sont tombés
+            to_download = next_round + list(pending)
+            if to_download and passes < MAX_GLOBAL_PASSES:
+                log.info("⏸️ Pause avant relance des échecs…")
+                time.sleep(20)
+    finally:
+        for driver in drivers.values():
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        for i in range(1, n + 1):
+            unwatch_folder(os.path.join(DOWNLOAD_DIR, f".selenium_worker_{i}"))
+            try:
+                os.rmdir(os.path.join(DOWNLOAD_DIR, f".selenium_worker_{i}"))
+            except OSError:
+                pass
+
 def main():
-    from dotenv import load_dotenv
     ensure_dir(DOWNLOAD_DIR)
+    watch_folder(DOWNLOAD_DIR)
+    try:
+        return run_downloads()
+    finally:
+        unwatch_folder(DOWNLOAD_DIR)
+
+def run_downloads() -> int:
     log.info("=" * 60)
     log.info(f"🚀 Téléchargements vers: {os.path.abspath(DOWNLOAD_DIR)}")
+    log.info(f"⚙️ Moteur: {DOWNLOAD_ENGINE}")
     log.info("=" * 60)
 
     # état initial : quoi manque aujourd’hui ?
@@ -631,118 +996,37 @@ def main():
 
     if not missing:
         log.info("✅ Rien à télécharger — tout est déjà présent.")
+        archive_downloads({})
         return 0
 
-    # Démarrage Selenium
-    driver = start_chrome(DOWNLOAD_DIR, HEADLESS)
+    global _RUN_ID
     stats: Dict[str, Dict] = {}
-    try:
-        load_dotenv("id_cc.env")
-        import sys
-        from pathlib import Path
-        # Try module attributes first (set by GUI), then environment variables
-        email = getattr(sys.modules[__name__], "EMAIL", None) or os.getenv("EMAIL")
-        password = getattr(sys.modules[__name__], "PASSWORD", None) or os.getenv("PASSWORD") or os.getenv("PASSWORD_CC")
-        # If still missing, try variables/id_cc.env
-        if not email or not password:
-            env_path = Path("variables") / "id_cc.env"
-            if env_path.exists():
-                with env_path.open("r", encoding="utf-8") as f:
-                    for line in f:
-                        if "=" in line:
-                            key, value = line.strip().split("=", 1)
-                            key = key.strip().lower()
-                            value = value.strip()
-                            if key == "email" and not email:
-                                email = value
-                            if key == "password" and not password:
-                                password = value
-            if not email or not password:
-                raise RuntimeError("Identifiants CommCare manquants (EMAIL / PASSWORD)")
-
-        # Login sur le premier export manquant
-        first_url = EXPORT_URLS[missing[0]]
-        commcare_login(driver, email, password, first_url)
-
-        total_ok = 0
-        passes = 0
-        to_download = list(missing)
-
-        while to_download and passes < MAX_GLOBAL_PASSES:
-            passes += 1
-            log.info(f"================= PASSE #{passes} =================")
-            next_round = []
-
-            for base in to_download:
-                # Skip si le fichier est apparu entre-temps
-                if file_for_base_today(base, DOWNLOAD_DIR):
-                    log.info(f"⏩ Déjà présent (skip): {base}")
-                    stats.setdefault(
-                        base,
-                        {"status": "present", "size_mb": size_mb(file_for_base_today(base, DOWNLOAD_DIR)), "seconds": 0.0, "mbps": None}
-                    )
-                    total_ok += 1
-                    continue
-
-                ok = download_one(base, driver, stats)
-                if ok:
-                    total_ok += 1
-                else:
-                    # On ne re-tentera que ceux réellement échoués (non présents)
-                    if not file_for_base_today(base, DOWNLOAD_DIR):
-                        next_round.append(base)
-
-            to_download = next_round
-            if to_download and passes < MAX_GLOBAL_PASSES:
-                log.info("⏸️ Pause avant relance des échecs…")
-                time.sleep(20)
-
-        # Rapport final
-        log.info("================= RAPPORT =================")
-        total = len(EXPECTED_BASES)
-        done_today = sum(1 for b in EXPECTED_BASES if file_for_base_today(b, DOWNLOAD_DIR))
-        failed = [b for b in EXPECTED_BASES if not file_for_base_today(b, DOWNLOAD_DIR)]
-        log.info(f"Fichiers attendus : {total}")
-        log.info(f"Téléchargés présents aujourd’hui : {done_today}")
-        log.info(f"Échoués : {len(failed)} — {failed if failed else ''}")
-
-        total_mb = 0.0
-        total_time = 0.0
-        for b, s in stats.items():
-            sz = s.get("size_mb") or 0.0
-            tm = s.get("seconds") or 0.0
-            total_mb += sz
-            total_time += tm
-            log.info(f" - {b:40s} | {s['status']:<10s} | {sz:6.1f} MB | {tm:6.1f} s | {('%.3f MB/s' % s['mbps']) if s['mbps'] else '-'}")
-
-        if total_mb > 0 and total_time > 0:
-            log.info(f"📊 Volume total: {total_mb:.1f} MB — Temps cumulé: {total_time:.1f} s — Débit moyen ~ {total_mb/total_time:.3f} MB/s")
-
-        # Écrire stats.json pour CI
-        run_summary = {
-            "expected": total,
-            "present_today": done_today,
-            "failed_count": len(failed),
-            "failed_list": failed,
-            "total_mb": round(total_mb, 2),
-            "total_time_sec": round(total_time, 1),
-            "avg_mbps": round((total_mb / total_time), 3) if total_time > 0 else None,
-            "run_date": datetime.now().isoformat(timespec="seconds")
-        }
-        payload = {"per_file": stats, "run_summary": run_summary}
-        try:
-            with open("stats.json", "w", encoding="utf-8") as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            log.warning(f"Impossible d'écrire stats.json: {e}")
+    email, password = load_credentials()
+    _RUN_ID = download_history.start_run(DOWNLOAD_ENGINE, len(EXPECTED_BASES))
+
+    # Plus longs d'abord, d'après les durées du moteur qui va télécharger
+    to_download = order_longest_first(
+        missing, load_durations(engine="selenium" if DOWNLOAD_ENGINE == "selenium" else "http"))
+
+    # 1) Moteur HTTP direct (parallèle, sans navigateur)
+    if DOWNLOAD_ENGINE in ("http", "auto"):
+        from http_export_client import download_bases
+        log.info(f"🌐 Téléchargement HTTP direct de {len(to_download)} export(s)…")
+        to_download = download_bases(
+            to_download, EXPORT_URLS, DOWNLOAD_DIR, email, password, stats,
+            on_result=lambda base, status, seconds, nbytes, reason: download_history.record_attempt(
+                _RUN_ID, base, "http", status, seconds, nbytes, reason)
+        )
 
-        return 0 if not failed else 1
+    # 2) Fallback Selenium pour ce qui reste
+    if to_download and DOWNLOAD_ENGINE in ("selenium", "auto"):
+        log.info(f"🧭 Fallback Selenium pour {len(to_download)} export(s)")
+        run_selenium(to_download, email, password, stats)
 
-    finally:
-        try:
-            driver.quit()
-        except Exception:
-            pass
+    archive_downloads(stats)
+    failed = write_run_report(stats)
+    download_history.finish_run(_RUN_ID, len(failed))
+    return 0 if not failed else 1
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Historique des téléchargements CommCare (SQLite, en ajout seul)
+- Une ligne par exécution (runs) et par tentative (attempts) : base, moteur, passe, tentative,
+  statut, octets, durée, raison d'échec
+- Rapport p50 / p95 par base et détection des bases dont la durée dérive à la hausse
+- Échéance par base dérivée de la distribution récente des durées (remplace les timeouts fixes
+  quand l'historique suffit)
+
+Usage: python downloader/download_history.py [--days N] [--base NOM] [--db CHEMIN]
+"""
+
+import os
+import sys
+import sqlite3
+import statistics
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+HISTORY_DB = os.environ.get("COMMCARE_HISTORY_DB") or "download_history.sqlite"
+
+# Dérive : médiane des DRIFT_RECENT derniers succès vs médiane des DRIFT_BASELINE précédents
+DRIFT_RECENT = 5
+DRIFT_BASELINE = 20
+DRIFT_RATIO = 1.3
+DRIFT_MIN_SECONDS = 60
+
+# Échéance par base = p95 des TIMEOUT_WINDOW derniers succès × TIMEOUT_FACTOR, bornée,
+# dès TIMEOUT_MIN_SAMPLES succès
+TIMEOUT_FACTOR = 3.0
+TIMEOUT_WINDOW = 20
+TIMEOUT_MIN_SAMPLES = 5
+TIMEOUT_FLOOR = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    engine      TEXT,
+    expected    INTEGER,
+    failed      INTEGER
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id    INTEGER REFERENCES runs(run_id),
+    ts        TEXT NOT NULL,
+    base      TEXT NOT NULL,
+    engine    TEXT NOT NULL,
+    pass_no   INTEGER NOT NULL DEFAULT 1,
+    attempt   INTEGER NOT NULL DEFAULT 1,
+    status    TEXT NOT NULL,
+    bytes     INTEGER,
+    seconds   REAL,
+    reason    TEXT
+);
+CREATE INDEX IF NOT EXISTS attempts_base_ts ON attempts(base, ts);
+"""
+
+_LOCK = threading.Lock()
+# Fichiers dont le schéma est déjà en place dans ce processus
+_READY = set()
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Nouvelle connexion ; mode WAL et schéma ne sont posés qu'une fois par fichier et par processus."""
+    path = path or HISTORY_DB
+    key = os.path.abspath(path)
+    fresh = key not in _READY or not os.path.exists(path)
+    conn = sqlite3.connect(path, timeout=30)
+    if fresh:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _READY.add(key)
+    return conn
+
+
+@contextmanager
+def _open(path: Optional[str] = None):
+    """Connexion le temps d'un bloc : transaction validée (annulée sur erreur), puis fermée."""
+    conn = connect(path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def start_run(engine: str, expected: int, path: Optional[str] = None) -> int:
+    with _LOCK, _open(path) as conn:
+        cur = conn.execute("INSERT INTO runs (started_at, engine, expected) VALUES (?, ?, ?)",
+                           (_now(), engine, expected))
+        return cur.lastrowid
+
+
+def finish_run(run_id: int, failed: int, path: Optional[str] = None) -> None:
+    with _LOCK, _open(path) as conn:
+        conn.execute("UPDATE runs SET finished_at = ?, failed = ? WHERE run_id = ?", (_now(), failed, run_id))
+
+
+def record_attempt(run_id: Optional[int], base: str, engine: str, status: str,
+                   seconds: Optional[float] = None, nbytes: Optional[int] = None,
+                   reason: Optional[str] = None, pass_no: int = 1, attempt: int = 1,
+                   path: Optional[str] = None) -> None:
+    """Ajoute une tentative (status : 'ok', 'timeout', 'stalled', 'error'). N'échoue jamais le téléchargement."""
+    try:
+        with _LOCK, _open(path) as conn:
+            conn.execute(
+                "INSERT INTO attempts (run_id, ts, base, engine, pass_no, attempt, status, bytes, seconds, reason) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, _now(), base, engine, pass_no, attempt, status, nbytes,
+                 None if seconds is None else round(seconds, 1), (reason or "")[:500] or None))
+    except sqlite3.Error:
+        pass
+
+
+# -------------------------------------------------------------------
+# ANALYSES
+# -------------------------------------------------------------------
+def _percentile(values: List[float], q: float) -> float:
+    """Percentile par interpolation linéaire (valeurs non vides)."""
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def success_durations(days: Optional[int] = None, base: Optional[str] = None,
+                      path: Optional[str] = None, engine: Optional[str] = None) -> Dict[str, List[float]]:
+    """{base: [durées des succès, du plus ancien au plus récent]} ; `engine` : "http" ou "selenium" seulement"""
+    if not os.path.exists(path or HISTORY_DB):
+        return {}
+    sql = "SELECT base, seconds FROM attempts WHERE status = 'ok' AND seconds IS NOT NULL"
+    args: list = []
+    if days:
+        sql += " AND ts >= ?"
+        args.append((datetime.now() - timedelta(days=days)).isoformat(timespec="seconds"))
+    if base:
+        sql += " AND base = ?"
+        args.append(base)
+    if engine:
+        sql += " AND engine = ?"
+        args.append(engine)
+    out: Dict[str, List[float]] = {}
+    with _open(path) as conn:
+        for b, s in conn.execute(sql + " ORDER BY ts, id", args):
+            out.setdefault(b, []).append(s)
+    return out
+
+
+def drift(durations: List[float]) -> Optional[float]:
+    """Ratio médiane récente / médiane de référence si la base dérive à la hausse, sinon None."""
+    if len(durations) < DRIFT_RECENT + TIMEOUT_MIN_SAMPLES:
+        return None
+    recent = statistics.median(durations[-DRIFT_RECENT:])
+    baseline = statistics.median(durations[-(DRIFT_RECENT + DRIFT_BASELINE):-DRIFT_RECENT])
+    if baseline > 0 and recent > baseline * DRIFT_RATIO and recent - baseline > DRIFT_MIN_SECONDS:
+        return recent / baseline
+    return None
+
+
+def typical_durations(path: Optional[str] = None, engine: Optional[str] = None) -> Dict[str, float]:
+    """
+    Médiane des succès par base (ordonnancement « plus long d'abord »), pour `engine` seulement
+    s'il est donné : un export HTTP de 25 s peut prendre 10 min par le navigateur.
+    """
+    return {b: statistics.median(v) for b, v in success_durations(path=path, engine=engine).items()}
+
+
+def timeout_for(base: str, default: int, path: Optional[str] = None, engine: str = "selenium") -> int:
+    """
+    Échéance d'une tentative `engine` pour `base` : p95 des TIMEOUT_WINDOW derniers succès du même
+    moteur × TIMEOUT_FACTOR, au moins TIMEOUT_FLOOR et au plus `default` ; `default` tant que
+    l'historique est trop court.
+    """
+    try:
+        durations = success_durations(days=90, base=base, path=path, engine=engine).get(base, [])[-TIMEOUT_WINDOW:]
+    except sqlite3.Error:
+        return default
+    if len(durations) < TIMEOUT_MIN_SAMPLES:
+        return default
+    return int(min(default, max(TIMEOUT_FLOOR, _percentile(durations, 0.95) * TIMEOUT_FACTOR)))
+
+
+def report(days: Optional[int] = None, base: Optional[str] = None, path: Optional[str] = None) -> int:
+    """Affiche p50/p95/échecs par base ; retourne le nombre de bases en dérive."""
+    if not os.path.exists(path or HISTORY_DB):
+        print(f"❌ Historique introuvable : {path or HISTORY_DB}")
+        return 0
+    ok = success_durations(days, base, path)
+    sql = "SELECT base, COUNT(*), SUM(status != 'ok'), MAX(ts) FROM attempts"
+    args: list = []
+    where = []
+    if days:
+        where.append("ts >= ?")
+        args.append((datetime.now() - timedelta(days=days)).isoformat(timespec="seconds"))
+    if base:
+        where.append("base = ?")
+        args.append(base)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    with _open(path) as conn:
+        rows = conn.execute(sql + " GROUP BY base ORDER BY base", args).fetchall()
+        runs = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    print(f"📊 Historique {path or HISTORY_DB} — {runs} exécution(s)" + (f", {days} derniers jours" if days else ""))
+    print(f"{'base':60s} {'n':>4s} {'échecs':>6s} {'p50 s':>8s} {'p95 s':>8s} {'dernier':>19s}")
+    drifting = 0
+    for b, n, failures, last in rows:
+        durations = ok.get(b, [])
+        p50 = f"{_percentile(durations, 0.5):8.0f}" if durations else f"{'-':>8s}"
+        p95 = f"{_percentile(durations, 0.95):8.0f}" if durations else f"{'-':>8s}"
+        print(f"{b[:60]:60s} {n:4d} {failures or 0:6d} {p50} {p95} {last:>19s}")
+        ratio = drift(durations)
+        if ratio:
+            drifting += 1
+            print(f"   ⚠️ Dérive : médiane des {DRIFT_RECENT} derniers succès ×{ratio:.2f} par rapport aux précédents")
+    print("✅ Aucune dérive" if not drifting else f"⚠️ {drifting} base(s) en dérive")
+    return drifting
+
+
+def parse_args(argv):
+    opts = {"days": None, "base": None, "db": None}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--days":
+            opts["days"] = int(next(args))
+        elif arg == "--base":
+            opts["base"] = next(args)
+        elif arg == "--db":
+            opts["db"] = next(args)
+    return opts
+
+
+if __name__ == "__main__":
+    opts = parse_args(sys.argv[1:])
+    report(opts["days"], opts["base"], opts["db"])
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Surveillance événementielle d'un dossier de téléchargement
+- Index en mémoire base → fichier du jour (plus de glob + regex sur tout le dossier à chaque appel)
+- Fin de téléchargement signalée par le renommage .crdownload/.partial/.part → nom final
+- watchdog (inotify sous Linux, FSEvents, ReadDirectoryChangesW) si disponible,
+  sinon scrutation légère : le dossier n'est relu que si son mtime a changé
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+log = logging.getLogger("commcare-downloader")
+
+PARTIAL_SUFFIXES = (".crdownload", ".partial", ".part")
+POLL_INTERVAL = float(os.getenv("COMMCARE_WATCH_POLL", "0.5"))  # secondes (fallback sans watchdog)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher: "DownloadWatcher"):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher._add(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher._remove(event.src_path)
+            self.watcher._add(event.dest_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.watcher._remove(event.src_path)
+
+
+class DownloadWatcher:
+    """
+    Index des fichiers du jour d'un dossier, tenu à jour par événements.
+
+    `match(base, folder, name)` renvoie 0 (pas de correspondance), 1 (faible : préfixe + mtime)
+    ou 2 (forte : motif du jour) ; une correspondance forte remplace une faible.
+    """
+
+    def __init__(self, folder: str, bases: Iterable[str], match: Callable[[str, str, str], int]):
+        self.folder = os.path.abspath(folder)
+        self.bases = list(bases)
+        self.match = match
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._names: Set[str] = set()
+        self._date = None
+        self._cond = threading.Condition()
+        self._observer = None
+        self._poller = None
+        self._stop = threading.Event()
+
+    # ---------------------------------------------------------------
+    # Cycle de vie
+    # ---------------------------------------------------------------
+    def start(self) -> "DownloadWatcher":
+        os.makedirs(self.folder, exist_ok=True)
+        self._rescan()
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(self), self.folder, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self._poller = threading.Thread(target=self._poll, name=f"watch:{self.folder}", daemon=True)
+            self._poller.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        if self._poller is not None:
+            self._poller.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def backend(self) -> str:
+        return "watchdog" if self._observer is not None else "polling"
+
+    # ---------------------------------------------------------------
+    # Requêtes
+    # ---------------------------------------------------------------
+    def lookup(self, base: str) -> Optional[str]:
+        """Fichier du jour pour `base` (index en mémoire ; relu une fois par jour)."""
+        with self._cond:
+            if self._date != _today():
+                self._rescan()
+            hit = self._index.get(base)
+            return hit[0] if hit else None
+
+    def wait_for(self, base: str, timeout: float) -> Optional[str]:
+        """Attend qu'un fichier final du jour apparaisse pour `base` (None si timeout)."""
+        end = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                path = self.lookup(base)
+                if path and os.path.exists(path):
+                    return path
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, 60))
+
+    # ---------------------------------------------------------------
+    # Mise à jour de l'index
+    # ---------------------------------------------------------------
+    def _rescan(self) -> None:
+        with self._cond:
+            self._index.clear()
+            self._date = _today()
+            self._names = self._list_names()
+            for name in self._names:
+                self._add(os.path.join(self.folder, name), notify=False)
+            self._cond.notify_all()
+
+    def _list_names(self) -> Set[str]:
+        try:
+            with os.scandir(self.folder) as it:
+                return {entry.name for entry in it if entry.is_file()}
+        except FileNotFoundError:
+            return set()
+
+    def _is_today(self, path: str, name: str) -> bool:
+        """Filtre bon marché : seul un fichier daté du jour (nom ou mtime) peut correspondre."""
+        if self._date in name:
+            return True
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d") == self._date
+        except OSError:
+            return False
+
+    def _add(self, path: str, notify: bool = True) -> None:
+        name = os.path.basename(path)
+        if name.endswith(PARTIAL_SUFFIXES) or not name.lower().endswith(".xlsx"):
+            return
+        if os.path.dirname(os.path.abspath(path)) != self.folder or not self._is_today(path, name):
+            return
+        with self._cond:
+            for base in self.bases:
+                strength = self.match(base, self.folder, name)
+                if strength and strength >= self._index.get(base, ("", 0))[1]:
+                    self._index[base] = (os.path.join(self.folder, name), strength)
+            if notify:
+                self._cond.notify_all()
+
+    def _remove(self, path: str) -> None:
+        path = os.path.join(self.folder, os.path.basename(path))
+        with self._cond:
+            # Rare (fichier supprimé ou renommé) : relecture pour retrouver un éventuel autre candidat
+            if any(p == path for p, _ in self._index.values()):
+                self._rescan()
+
+    def _poll(self) -> None:
+        """
+        Fallback sans watchdog : le dossier n'est relu que si son mtime change, et seuls les
+        noms apparus ou disparus depuis le dernier passage sont traités.
+        """
+        last = None
+        while not self._stop.wait(POLL_INTERVAL):
+            try:
+                mtime = os.stat(self.folder).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime == last:
+                continue
+            last = mtime
+            names = self._list_names()
+            with self._cond:
+                for name in self._names - names:
+                    self._remove(os.path.join(self.folder, name))
+                for name in names - self._names:
+                    self._add(os.path.join(self.folder, name), notify=False)
+                self._names = names
+                self._cond.notify_all()
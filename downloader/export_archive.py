@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Archive des exports CommCare, adressée par contenu
+- Chaque export terminé est haché (SHA-256 des feuilles du classeur, hors métadonnées d'horodatage)
+  et stocké une seule fois : objects/<2 car.>/<empreinte>
+  (sans extension .xlsx : le nettoyage git_script/delete_all_excel_files ne l'atteint pas)
+- Catalogue SQLite : base, jour, empreinte, octets, nombre de lignes, nom d'origine
+- « Inchangé depuis » : un export identique au précédent ne coûte qu'un hachage (information
+  de rapport : stats.json et tableau ci-dessous)
+- Rétention : ARCHIVE_KEEP derniers contenus distincts par base ; les objets que plus
+  aucune base ne référence sont supprimés
+
+Usage: python downloader/export_archive.py [--base NOM] [--days N] [--dir CHEMIN]
+       python downloader/export_archive.py --prune [N] [--base NOM] [--dir CHEMIN]
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import zipfile
+import hashlib
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+ARCHIVE_DIR = os.environ.get("COMMCARE_ARCHIVE_DIR") or os.path.join("data", ".export_archive")
+CATALOG_NAME = "catalog.sqlite"
+# Parties du classeur réécrites à chaque export (dates de création/modification, application)
+VOLATILE_PARTS = ("docProps/",)
+# Contenus distincts conservés par base (les plus récents) ; 0 = tout garder
+ARCHIVE_KEEP = int(os.getenv("COMMCARE_ARCHIVE_KEEP", "30"))
+# Un objet écrit ou réutilisé depuis moins longtemps n'est jamais supprimé (archivage concurrent)
+PRUNE_GRACE_SECONDS = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    base        TEXT NOT NULL,
+    day         TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    sha256      TEXT NOT NULL,
+    bytes       INTEGER,
+    rows        INTEGER,
+    name        TEXT,
+    UNIQUE (base, day, sha256)
+);
+CREATE INDEX IF NOT EXISTS exports_base_day ON exports(base, day);
+CREATE INDEX IF NOT EXISTS exports_sha256 ON exports(sha256);
+"""
+
+_LOCK = threading.Lock()
+# Catalogues dont le schéma est déjà en place dans ce processus
+_READY = set()
+
+
+def connect(archive_dir: Optional[str] = None) -> sqlite3.Connection:
+    """Nouvelle connexion au catalogue ; mode WAL et schéma posés une fois par fichier et par processus."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    path = os.path.join(archive_dir, CATALOG_NAME)
+    key = os.path.abspath(path)
+    fresh = key not in _READY or not os.path.exists(path)
+    if fresh:
+        os.makedirs(archive_dir, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    if fresh:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _READY.add(key)
+    return conn
+
+
+@contextmanager
+def _open(archive_dir: Optional[str] = None):
+    """Connexion le temps d'un bloc : transaction validée (annulée sur erreur), puis fermée."""
+    conn = connect(archive_dir)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Empreinte du contenu : pour un classeur (zip), les parties décompressées triées par nom,
+    hors VOLATILE_PARTS — deux exports des mêmes données ont la même empreinte malgré les dates
+    d'horodatage du zip ; pour tout autre fichier, les octets bruts.
+    """
+    h = hashlib.sha256()
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in sorted(zf.infolist(), key=lambda i: i.filename):
+                if info.is_dir() or info.filename.startswith(VOLATILE_PARTS):
+                    continue
+                h.update(info.filename.encode("utf-8") + b"\0")
+                with zf.open(info) as member:
+                    for chunk in iter(lambda: member.read(1024 * 1024), b""):
+                        h.update(chunk)
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def object_path(sha256: str, archive_dir: Optional[str] = None) -> str:
+    return os.path.join(archive_dir or ARCHIVE_DIR, "objects", sha256[:2], sha256)
+
+
+def count_rows(path: str) -> Optional[int]:
+    """Lignes de données de la première feuille (en-tête exclu) ; None si illisible."""
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True)
+        try:
+            ws = wb.worksheets[0]
+            # max_row vient de la dimension déclarée ; sinon on parcourt la feuille
+            n = ws.max_row if ws.max_row is not None else sum(1 for _ in ws.iter_rows(values_only=True))
+        finally:
+            wb.close()
+        return max(0, n - 1)
+    except Exception:
+        return None
+
+
+def _store(path: str, sha256: str, archive_dir: Optional[str]) -> bool:
+    """Copie atomique dans le magasin ; False si le contenu y est déjà."""
+    dest = object_path(sha256, archive_dir)
+    if os.path.exists(dest):
+        # Réutilisé : la date de modification protège l'objet de la purge pendant PRUNE_GRACE_SECONDS
+        os.utime(dest)
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, dest)
+    return True
+
+
+def archive_file(base: str, path: str, day: Optional[str] = None,
+                 archive_dir: Optional[str] = None) -> Dict:
+    """
+    Archive l'export `path` de `base` pour `day` (jour courant par défaut).
+    Retourne {sha256, bytes, rows, stored, unchanged_since} ; `stored` est False si le contenu
+    était déjà archivé (le comptage des lignes est alors repris du catalogue).
+    """
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    sha = file_sha256(path)
+    stored = _store(path, sha, archive_dir)
+    with _LOCK, _open(archive_dir) as conn:
+        known = conn.execute("SELECT rows FROM exports WHERE sha256 = ? AND rows IS NOT NULL LIMIT 1",
+                             (sha,)).fetchone()
+        rows = known[0] if known else count_rows(path)
+        conn.execute(
+            "INSERT OR IGNORE INTO exports (base, day, archived_at, sha256, bytes, rows, name) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (base, day, datetime.now().isoformat(timespec="seconds"), sha, os.path.getsize(path), rows,
+             os.path.basename(path)))
+    return {"sha256": sha, "bytes": os.path.getsize(path), "rows": rows, "stored": stored,
+            "unchanged_since": unchanged_since(base, day, archive_dir)}
+
+
+def unchanged_since(base: str, day: Optional[str] = None, archive_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Premier jour depuis lequel l'export de `base` n'a pas changé (jusqu'à `day`, dernier jour
+    archivé par défaut) ; None si le contenu diffère du jour archivé précédent ou s'il n'y en a pas.
+    """
+    if not os.path.exists(os.path.join(archive_dir or ARCHIVE_DIR, CATALOG_NAME)):
+        return None
+    sql = "SELECT day, sha256 FROM exports WHERE base = ?"
+    args: list = [base]
+    if day:
+        sql += " AND day <= ?"
+        args.append(day)
+    with _open(archive_dir) as conn:
+        history = conn.execute(sql + " ORDER BY day DESC, id DESC", args).fetchall()
+    if not history:
+        return None
+    last_day, sha = history[0]
+    since = last_day
+    for d, s in history[1:]:
+        if d == last_day:
+            # Plusieurs contenus le même jour : seul le dernier archivé compte
+            continue
+        if s != sha:
+            break
+        since = d
+    return since if since != last_day else None
+
+
+def prune(keep: Optional[int] = None, base: Optional[str] = None,
+          archive_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Ne garde, pour chaque base (ou seulement `base`), que les `keep` derniers contenus distincts
+    (ARCHIVE_KEEP par défaut ; ordre du dernier jour où chacun a été vu), puis supprime les objets
+    que plus aucune ligne du catalogue ne référence.
+    Retourne {"rows": lignes retirées, "objects": objets supprimés, "bytes": octets libérés}.
+    """
+    keep = ARCHIVE_KEEP if keep is None else keep
+    archive_dir = archive_dir or ARCHIVE_DIR
+    out = {"rows": 0, "objects": 0, "bytes": 0}
+    if keep <= 0 or not os.path.exists(os.path.join(archive_dir, CATALOG_NAME)):
+        return out
+    with _LOCK, _open(archive_dir) as conn:
+        bases = [base] if base else [b for (b,) in conn.execute("SELECT DISTINCT base FROM exports")]
+        for b in bases:
+            ranked = conn.execute("SELECT sha256 FROM exports WHERE base = ? GROUP BY sha256 "
+                                  "ORDER BY MAX(day) DESC, MAX(id) DESC", (b,)).fetchall()
+            for (sha,) in ranked[keep:]:
+                out["rows"] += conn.execute("DELETE FROM exports WHERE base = ? AND sha256 = ?",
+                                            (b, sha)).rowcount
+        referenced = {sha for (sha,) in conn.execute("SELECT DISTINCT sha256 FROM exports")}
+
+    now = time.time()
+    objects_dir = os.path.join(archive_dir, "objects")
+    for root, _, names in os.walk(objects_dir):
+        for name in names:
+            if name.endswith(".tmp") or name in referenced:
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+                if now - st.st_mtime < PRUNE_GRACE_SECONDS:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            out["objects"] += 1
+            out["bytes"] += st.st_size
+    return out
+
+
+def report(days: Optional[int] = None, base: Optional[str] = None, archive_dir: Optional[str] = None) -> int:
+    """Affiche le dernier export archivé par base ; retourne le nombre de bases inchangées."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not os.path.exists(os.path.join(archive_dir, CATALOG_NAME)):
+        print(f"❌ Archive introuvable : {archive_dir}")
+        return 0
+    sql = "SELECT base, MAX(day), COUNT(*), COUNT(DISTINCT sha256) FROM exports"
+    args: list = []
+    where = []
+    if days:
+        where.append("day >= ?")
+        args.append((datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d"))
+    if base:
+        where.append("base = ?")
+        args.append(base)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    with _open(archive_dir) as conn:
+        rows = conn.execute(sql + " GROUP BY base ORDER BY base", args).fetchall()
+        objects = conn.execute("SELECT COUNT(DISTINCT sha256) FROM exports").fetchone()[0]
+        latest = {b: conn.execute("SELECT sha256, rows FROM exports WHERE base = ? AND day = ? "
+                                  "ORDER BY id DESC LIMIT 1", (b, d)).fetchone()
+                  for b, d, _, _ in rows}
+
+    print(f"🗄️ Archive {archive_dir} — {objects} contenu(s) distinct(s)")
+    print(f"{'base':60s} {'jour':>10s} {'n':>4s} {'uniq':>4s} {'lignes':>8s} {'empreinte':>12s}  inchangé depuis")
+    unchanged = 0
+    for b, d, n, distinct in rows:
+        sha, nrows = latest[b]
+        since = unchanged_since(b, d, archive_dir)
+        unchanged += bool(since)
+        print(f"{b[:60]:60s} {d:>10s} {n:4d} {distinct:4d} {'-' if nrows is None else nrows:>8} {sha[:12]:>12s}  {since or '-'}")
+    print(f"🟰 {unchanged} base(s) inchangée(s)" if unchanged else "✅ Tous les derniers exports ont changé")
+    return unchanged
+
+
+def parse_args(argv):
+    opts = {"days": None, "base": None, "dir": None, "prune": False, "keep": None}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--prune":
+            opts["prune"] = True
+        elif arg.isdigit() and opts["prune"]:
+            # N facultatif après --prune
+            opts["keep"] = int(arg)
+        elif arg == "--days":
+            opts["days"] = int(next(args))
+        elif arg == "--base":
+            opts["base"] = next(args)
+        elif arg == "--dir":
+            opts["dir"] = next(args)
+    return opts
+
+
+if __name__ == "__main__":
+    opts = parse_args(sys.argv[1:])
+    if opts["prune"]:
+        done = prune(opts["keep"], opts["base"], opts["dir"])
+        print(f"🧹 {done['rows']} ligne(s) retirée(s) du catalogue, {done['objects']} objet(s) supprimé(s) "
+              f"({done['bytes'] / (1024 * 1024):.1f} MB libérés)")
+    else:
+        report(opts["days"], opts["base"], opts["dir"])
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+CommCare HTTP Export Client — moteur sans navigateur
+- Télécharge les exports "daily saved" directement (même fichier Excel que l'UI)
+- Une session requests par thread (keep-alive ; requests.Session n'est pas thread-safe)
+- Plusieurs bases en parallèle (ThreadPoolExecutor borné)
+- Écriture en streaming vers un .part puis renommage atomique
+- Fichier refusé (fallback Selenium) s'il n'est pas un classeur ou s'il date d'avant
+  aujourd'hui (Last-Modified) : le « daily saved » n'est reconstruit qu'une fois par jour
+- Racine configurable (COMMCARE_BASE_URL) pour tester contre un serveur local
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("commcare-downloader")
+
+# Racine CommCare (surchargée par un stub local en test)
+COMMCARE_ROOT = os.environ.get("COMMCARE_BASE_URL", "https://www.commcarehq.org").rstrip("/")
+
+# Parallélisme et timeouts (secondes)
+HTTP_MAX_WORKERS = int(os.getenv("COMMCARE_HTTP_WORKERS", "4"))
+HTTP_CONNECT_TIMEOUT = 30
+HTTP_READ_TIMEOUT = 600
+CHUNK_SIZE = 1024 * 1024
+# Âge maximal du fichier « daily saved » en jours calendaires (0 : construit aujourd'hui)
+HTTP_MAX_AGE_DAYS = int(os.getenv("COMMCARE_HTTP_MAX_AGE_DAYS", "0"))
+# Signatures acceptées : .xlsx = archive zip (entrée locale, ou archive vide)
+XLSX_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+
+_EXPORT_RE = re.compile(r"/a/(?P<domain>[^/]+)/data/export/custom/new/(?P<kind>form|case)/download/(?P<export_id>[0-9a-f]+)/?")
+_CREATED_RE = re.compile(r"\(created\s+\d{4}-\d{2}-\d{2}(?:\s+at\s+\d{2}\.\d{2})?\)", re.IGNORECASE)
+
+
+class ExportDownloadError(Exception):
+    """Réponse inattendue du serveur (page de login, HTML, statut != 200, contenu non xlsx)."""
+
+
+class StaleExportError(ExportDownloadError):
+    """Fichier « daily saved » plus ancien que HTTP_MAX_AGE_DAYS : Selenium en génère un à jour."""
+
+
+def parse_export_url(export_url: str) -> Tuple[str, str, str]:
+    """Extrait (domain, kind, export_id) d'une URL d'export de l'UI CommCare."""
+    m = _EXPORT_RE.search(urlsplit(export_url).path)
+    if not m:
+        raise ValueError(f"URL d'export non reconnue: {export_url}")
+    return m.group("domain"), m.group("kind"), m.group("export_id")
+
+
+def direct_download_url(export_url: str, root: str = COMMCARE_ROOT) -> str:
+    """URL du fichier « daily saved » correspondant à une URL d'export de l'UI."""
+    domain, _kind, export_id = parse_export_url(export_url)
+    return f"{root}/a/{domain}/data/export/custom/dailysaved/download/{export_id}/"
+
+
+def make_session(email: str, secret: str, pool_size: int = 1) -> requests.Session:
+    """
+    Session d'un thread de téléchargement (cookies et connexions propres au thread).
+    Auth par clé API (CC_API_KEY) si disponible, sinon Basic (email / mot de passe).
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    api_key = os.getenv("CC_API_KEY")
+    if api_key:
+        session.headers["Authorization"] = f"ApiKey {email}:{api_key}"
+    else:
+        session.auth = (email, secret)
+    return session
+
+
+def _filename_from_response(resp: requests.Response, base: str, date: str) -> str:
+    """
+    Reproduit le nommage de l'UI : « Base (created YYYY-MM-DD) YYYY-MM-DD.xlsx ».
+    Le segment (created …) est repris du Content-Disposition s'il est présent.
+    """
+    cd = resp.headers.get("Content-Disposition", "")
+    m = re.search(r"filename\*=UTF-8''([^;]+)", cd) or re.search(r'filename="?([^";]+)"?', cd)
+    created = None
+    if m:
+        found = _CREATED_RE.search(unquote(m.group(1)))
+        if found:
+            created = found.group(0)
+    return f"{base} {created} {date}.xlsx" if created else f"{base} {date}.xlsx"
+
+
+def export_built_at(resp: requests.Response) -> Optional[datetime]:
+    """
+    Date de construction du fichier servi (Last-Modified, heure locale) ; None si absente ou illisible.
+    Le segment « (created …) » du nom désigne la création de l'export, pas celle du fichier.
+    """
+    value = resp.headers.get("Last-Modified")
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).astimezone().replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+def check_fresh(resp: requests.Response, base: str, max_age_days: int = HTTP_MAX_AGE_DAYS) -> None:
+    """Lève StaleExportError si le fichier date d'avant (aujourd'hui - max_age_days)."""
+    built = export_built_at(resp)
+    if built is None:
+        log.warning(f"🌐 {base}: pas de Last-Modified, fraîcheur du fichier non vérifiable")
+        return
+    oldest = (datetime.now() - timedelta(days=max_age_days)).date()
+    if built.date() < oldest:
+        raise StaleExportError(f"Fichier du {built:%Y-%m-%d %H:%M} (avant le {oldest}) pour {base}")
+
+
+def stream_export(session: requests.Session, base: str, export_url: str, dest_dir: str,
+                  root: str = COMMCARE_ROOT) -> Tuple[str, int]:
+    """
+    Télécharge un export en streaming vers dest_dir.
+
+    Returns:
+        (chemin final, octets écrits)
+    """
+    url = direct_download_url(export_url, root)
+    date = datetime.now().strftime("%Y-%m-%d")
+    with session.get(url, stream=True, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)) as resp:
+        if resp.status_code != 200:
+            raise ExportDownloadError(f"HTTP {resp.status_code} pour {base}")
+        ctype = resp.headers.get("Content-Type", "")
+        if "text/html" in ctype:
+            # Redirection vers la page de login ou export non activé en « daily saved »
+            raise ExportDownloadError(f"Réponse HTML (auth/export non disponible) pour {base}")
+        check_fresh(resp, base)
+
+        # Premier morceau lu avant d'ouvrir le .part : un corps qui n'est pas un zip
+        # (page d'erreur servie en 200, JSON, fichier vide) n'est jamais écrit
+        chunks = (c for c in resp.iter_content(chunk_size=CHUNK_SIZE) if c)
+        first = next(chunks, b"")
+        if not first.startswith(XLSX_MAGIC):
+            raise ExportDownloadError(
+                f"Contenu non xlsx ({ctype or 'type inconnu'}, {len(first)} octet(s) lus) pour {base}")
+
+        final_path = os.path.join(dest_dir, _filename_from_response(resp, base, date))
+        part_path = final_path + ".part"
+        written = 0
+        try:
+            with open(part_path, "wb") as f:
+                f.write(first)
+                written += len(first)
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+        except Exception:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+    os.replace(part_path, final_path)
+    return final_path, written
+
+
+def download_bases(bases: Iterable[str], export_urls: Dict[str, str], dest_dir: str,
+                   email: str, secret: str, stats: dict,
+                   max_workers: int = HTTP_MAX_WORKERS, root: str = COMMCARE_ROOT,
+                   on_result: Optional[Callable] = None) -> List[str]:
+    """
+    Télécharge plusieurs bases en parallèle et complète `stats` au format stats.json.
+    `on_result(base, status, secondes, octets, raison)` est appelé pour chaque base (historique).
+
+    Returns:
+        list: bases en échec (à confier au fallback Selenium)
+    """
+    bases = [b for b in bases if b in export_urls]
+    if not bases:
+        return []
+    # Une session par thread du pool, toutes fermées à la fin
+    sessions: List[requests.Session] = []
+    sessions_lock = threading.Lock()
+    per_thread = threading.local()
+    failed = []
+
+    def _session() -> requests.Session:
+        session = getattr(per_thread, "session", None)
+        if session is None:
+            session = per_thread.session = make_session(email, secret)
+            with sessions_lock:
+                sessions.append(session)
+        return session
+
+    def _one(base: str):
+        t0 = time.time()
+        try:
+            path, written = stream_export(_session(), base, export_urls[base], dest_dir, root)
+        except Exception as e:
+            if on_result:
+                status = "stale" if isinstance(e, StaleExportError) else "error"
+                on_result(base, status, time.time() - t0, None, f"{type(e).__name__}: {e}")
+            raise
+        dt = time.time() - t0
+        if on_result:
+            on_result(base, "ok", dt, written, None)
+        return path, written, dt
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_one, b): b for b in bases}
+            for fut in as_completed(futures):
+                base = futures[fut]
+                try:
+                    path, written, dt = fut.result()
+                except Exception as e:
+                    log.warning(f"🌐 HTTP échec {base}: {e}")
+                    failed.append(base)
+                    continue
+                mb = written / (1024 * 1024)
+                stats[base] = {
+                    "status": "downloaded",
+                    "size_mb": mb,
+                    "seconds": round(dt, 1),
+                    "mbps": round(mb / dt, 3) if dt > 0 else None,
+                    "engine": "http",
+                }
+                log.info(f"🌐 OK {base} — {mb:.1f} MB en {dt:.1f}s → {os.path.basename(path)}")
+    finally:
+        for session in sessions:
+            session.close()
+    return failed
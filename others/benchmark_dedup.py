@@ -0,0 +1,129 @@
+"""
+Benchmark du moteur de dédoublonnage fuzzy (utils.detect_duplicates_with_groups)
+- Génère N enfants fictifs (office, année de naissance, nom) dont ~5% de doublons bruités
+- Mesure le moteur par blocs (rapidfuzz.cdist) sur le jeu complet
+- Mesure l'ancienne boucle O(n²) SequenceMatcher sur un échantillon, extrapolée à N
+- Compare les paires trouvées sur l'échantillon (rappel de chaque blocage) :
+  office + année seuls (défaut, sans perte ici) et avec la clé phonétique du nom (plus rapide,
+  au prix de paires manquées quand une faute touche la clé)
+
+Usage: python others/benchmark_dedup.py [N] [TAILLE_ECHANTILLON]
+"""
+
+import os
+import sys
+import time
+import random
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "script"))
+from utils import detect_duplicates_with_groups, _normalize_text_series  # noqa: E402
+
+N_CHILDREN = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+SAMPLE_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+DUP_RATE = 0.05
+THRESHOLD = 90
+RANDOM_SEED = 42
+
+PRENOMS = ["jean", "marie", "pierre", "rose", "kettly", "jude", "wilner", "nadege", "roseline", "fritznel",
+           "mackenson", "widline", "stephanie", "jameson", "guerline", "peterson", "sandra", "ricardo",
+           "esther", "daniel", "mirlande", "junior", "rosemene", "dieunel", "fabiola", "samuel", "lovely",
+           "johanne", "emmanuel", "nathalie"]
+NOMS = ["joseph", "pierre", "jean baptiste", "louis", "charles", "francois", "paul", "michel", "augustin",
+        "desir", "etienne", "alexis", "dorvil", "noel", "celestin", "estime", "saint fleur", "cadet",
+        "toussaint", "philippe", "jeune", "laguerre", "metellus", "baptiste", "simon", "beauvais",
+        "registre", "dumas", "severe", "lafortune"]
+OFFICES = ["CAP", "PAP", "GON", "JER", "PDP", "SMA", "LEO", "ARC"]
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    """Introduit une faute de saisie (suppression, doublement ou substitution d'une lettre)."""
+    i = rng.randrange(len(name))
+    op = rng.choice(("del", "dup", "sub"))
+    if op == "del":
+        return name[:i] + name[i + 1:]
+    if op == "dup":
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + rng.choice("aeioulnrst") + name[i + 1:]
+
+
+def make_children(n: int, seed: int = RANDOM_SEED) -> pd.DataFrame:
+    """N enfants fictifs ; une fraction DUP_RATE sont des ressaisies bruitées."""
+    rng = random.Random(seed)
+    n_orig = int(n * (1 - DUP_RATE))
+    rows = [(rng.choice(OFFICES), rng.randint(2018, 2025),
+             f"{rng.choice(PRENOMS)} {rng.choice(PRENOMS)} {rng.choice(NOMS)}")
+            for _ in range(n_orig)]
+    for _ in range(n - n_orig):
+        office, year, name = rows[rng.randrange(n_orig)]
+        rows.append((office, year, _typo(name, rng)))
+    rng.shuffle(rows)
+    return pd.DataFrame(rows, columns=["office", "annee_naissance", "name"])
+
+
+def legacy_pairs(df: pd.DataFrame, colonnes, threshold: int) -> set:
+    """Ancienne boucle exhaustive (SequenceMatcher sur toutes les paires)."""
+    vals = np.column_stack([_normalize_text_series(df[c]).to_numpy() for c in colonnes])
+    pairs = set()
+    for i in range(len(vals)):
+        for j in range(i + 1, len(vals)):
+            smin = 100.0
+            for k in range(len(colonnes)):
+                smin = min(smin, 100.0 * SequenceMatcher(None, vals[i][k], vals[j][k]).ratio())
+                if smin < threshold:
+                    break
+            if smin >= threshold:
+                pairs.add((i, j))
+    return pairs
+
+
+def group_pairs(out: pd.DataFrame) -> set:
+    """Paires (i, j) appartenant au même groupe de doublons."""
+    pairs = set()
+    for _, idx in out[out["duplicate_group_id"] > 0].groupby("duplicate_group_id").groups.items():
+        idx = sorted(idx)
+        pairs.update((a, b) for k, a in enumerate(idx) for b in idx[k + 1:])
+    return pairs
+
+
+if __name__ == "__main__":
+    colonnes = ["name", "office", "annee_naissance"]
+    blockings = {
+        "office + année": dict(block_on=["office", "annee_naissance"], phonetic_block=False),
+        "office + année + phonétique": dict(block_on=["office", "annee_naissance"], phonetic_block=True),
+    }
+
+    print(f"🔬 Génération de {N_CHILDREN:,} enfants fictifs ({DUP_RATE:.0%} de doublons bruités)...")
+    children = make_children(N_CHILDREN)
+
+    # 1) Moteur par blocs sur le jeu complet
+    timings = {}
+    for label, blocking in blockings.items():
+        t0 = time.perf_counter()
+        out = detect_duplicates_with_groups(children, colonnes, threshold=THRESHOLD,
+                                            return_only_duplicates=2, **blocking)
+        timings[label] = time.perf_counter() - t0
+        n_groups = out.loc[out["duplicate_group_id"] > 0, "duplicate_group_id"].nunique()
+        print(f"⚡ Blocs {label} : {timings[label]:.1f}s — {n_groups:,} groupes, "
+              f"{int((out['duplicate_group_id'] > 0).sum()):,} lignes en doublon")
+
+    # 2) Ancienne boucle sur un échantillon, extrapolée (coût quadratique)
+    sample = children.sample(SAMPLE_SIZE, random_state=RANDOM_SEED).reset_index(drop=True)
+    t0 = time.perf_counter()
+    ref = legacy_pairs(sample, colonnes, THRESHOLD)
+    t_legacy = time.perf_counter() - t0
+    t_legacy_full = t_legacy * (N_CHILDREN / SAMPLE_SIZE) ** 2
+    print(f"🐢 Boucle SequenceMatcher : {t_legacy:.1f}s sur {SAMPLE_SIZE:,} lignes "
+          f"→ ~{t_legacy_full / 3600:.1f}h extrapolé à {N_CHILDREN:,}")
+    for label, elapsed in timings.items():
+        print(f"📈 Accélération estimée ({label}) : x{t_legacy_full / elapsed:,.0f}")
+
+    # 3) Rappel de chaque blocage sur l'échantillon (paires directes de l'ancienne boucle retrouvées)
+    for label, blocking in blockings.items():
+        got = group_pairs(detect_duplicates_with_groups(sample, colonnes, threshold=THRESHOLD,
+                                                        return_only_duplicates=2, **blocking))
+        recall = len(ref & got) / len(ref) if ref else 1.0
+        print(f"🎯 Rappel {label} : {recall:.1%} ({len(ref & got)}/{len(ref)} paires)")
@@ -0,0 +1,173 @@
+"""
+Benchmark des extraits PTME en parallèle (utils.run_extracts)
+- Crée une base SQLite de remplacement avec le sous-ensemble du schéma caris_db utilisé
+  par les extraits PTME (patient, club, club_session, session, tracking_pregnancy,
+  tracking_children, testing_specimen, lookups)
+- Exécute les mêmes extraits indépendants en séquence puis en parallèle sur le pool partagé
+- Vérifie que les DataFrames sont identiques et affiche la latence par requête
+
+SQLite est local : sans attente réseau, le gain vient surtout de la latence serveur simulée
+(LATENCE secondes d'attente par requête, comme le temps d'exécution côté MySQL).
+
+Usage: python others/benchmark_ptme_extracts.py [N_PATIENTS] [LATENCE] [URI_BASE]
+  URI_BASE : base MySQL/MariaDB de test déjà peuplée (sinon SQLite temporaire, LATENCE=0 conseillé)
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "script"))
+from utils import run_query, run_extracts  # noqa: E402
+
+N_PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+SERVER_LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+DB_URI = sys.argv[3] if len(sys.argv) > 3 else None
+RANDOM_SEED = 42
+START, END = "2025-01-01", "2025-12-31"
+
+SCHEMA = """
+CREATE TABLE patient (id INTEGER PRIMARY KEY, patient_code TEXT, linked_to_id_patient INTEGER);
+CREATE TABLE lookup_club_type (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE lookup_club_attendance (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE lookup_testing_specimen_result (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE club (id INTEGER PRIMARY KEY, name TEXT, club_type INTEGER);
+CREATE TABLE club_session (id INTEGER PRIMARY KEY, id_club INTEGER, date TEXT);
+CREATE TABLE session (id INTEGER PRIMARY KEY, id_club_session INTEGER, id_patient INTEGER, is_present INTEGER);
+CREATE TABLE tracking_pregnancy (id INTEGER PRIMARY KEY, id_patient_mother INTEGER, ddr TEXT, dpa TEXT,
+                                 actual_delivery_date TEXT, created_at TEXT);
+CREATE TABLE tracking_children (id INTEGER PRIMARY KEY, id_patient_child INTEGER, id_patient_mother INTEGER);
+CREATE TABLE testing_specimen (id INTEGER PRIMARY KEY, id_patient INTEGER, date_blood_taken TEXT,
+                               pcr_result INTEGER, which_pcr INTEGER);
+CREATE INDEX ix_session_cs ON session(id_club_session);
+CREATE INDEX ix_cs_date ON club_session(date);
+CREATE INDEX ix_ts_patient ON testing_specimen(id_patient);
+CREATE INDEX ix_tc_child ON tracking_children(id_patient_child);
+"""
+
+# Extraits PTME en SQL portable (sous-ensemble des requêtes de ptme_pipeline / executor)
+QUERIES = {
+    "pregnancy_data": """
+        SELECT p.patient_code, tp.ddr, tp.dpa, tp.actual_delivery_date, tp.created_at
+        FROM tracking_pregnancy tp LEFT JOIN patient p ON p.id = tp.id_patient_mother
+        WHERE tp.dpa >= :start OR tp.actual_delivery_date BETWEEN :start AND :end
+        ORDER BY tp.id""",
+    "club_session_data": """
+        SELECT p.patient_code, MAX(cs.date) AS last_session_date, lt.name AS club_type,
+               SUM(s.is_present = 1) AS nb_presence
+        FROM session s
+        JOIN club_session cs ON cs.id = s.id_club_session
+        JOIN club c ON c.id = cs.id_club
+        JOIN patient p ON p.id = s.id_patient
+        LEFT JOIN lookup_club_type lt ON lt.id = c.club_type
+        WHERE cs.date BETWEEN :start AND :end AND c.club_type != 1
+        GROUP BY s.id_patient, p.patient_code, lt.name ORDER BY s.id_patient""",
+    "club_sessions_detailed": """
+        SELECT p.patient_code, c.name AS club_name, cs.date AS session_date_presence,
+               s.is_present AS present, lca.name AS raison_absence
+        FROM session s
+        LEFT JOIN club_session cs ON cs.id = s.id_club_session
+        LEFT JOIN club c ON c.id = cs.id_club
+        LEFT JOIN patient p ON p.id = s.id_patient
+        LEFT JOIN lookup_club_attendance lca ON lca.id = s.is_present
+        WHERE s.is_present IS NOT NULL AND cs.date BETWEEN :start AND :end
+        ORDER BY c.name, p.patient_code, cs.date, s.id""",
+    "pcr_analysis": """
+        SELECT p.patient_code, ts.date_blood_taken, ts.which_pcr, lr.name AS pcr_result_name
+        FROM testing_specimen ts
+        LEFT JOIN patient p ON p.id = ts.id_patient
+        LEFT JOIN lookup_testing_specimen_result lr ON lr.id = ts.pcr_result
+        WHERE ts.date_blood_taken BETWEEN :start AND :end ORDER BY ts.id""",
+    "mother_child_linked_pcr": """
+        SELECT mp.patient_code AS mother_patient_code, cp.patient_code AS child_patient_code,
+               MIN(ts.date_blood_taken) AS first_blood_taken_date, tp.actual_delivery_date
+        FROM testing_specimen ts
+        JOIN tracking_children tc ON tc.id_patient_child = ts.id_patient
+        LEFT JOIN patient mp ON mp.id = tc.id_patient_mother
+        LEFT JOIN patient cp ON cp.id = tc.id_patient_child
+        LEFT JOIN tracking_pregnancy tp ON tp.id_patient_mother = tc.id_patient_mother
+        WHERE ts.date_blood_taken > :start AND tp.actual_delivery_date IS NOT NULL
+        GROUP BY ts.id_patient, mp.patient_code, cp.patient_code, tp.actual_delivery_date
+        ORDER BY ts.id_patient, tp.actual_delivery_date""",
+}
+
+
+def _day(rng: random.Random, year: int = 2025) -> str:
+    return f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def build_sqlite(path: str, n_patients: int, seed: int = RANDOM_SEED) -> None:
+    """Peuple une base SQLite de remplacement avec des données fictives."""
+    rng = random.Random(seed)
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    con.executemany("INSERT INTO patient VALUES (?,?,?)",
+                    [(i, f"PAP/{i:07d}", 0) for i in range(1, n_patients + 1)])
+    con.executemany("INSERT INTO lookup_club_type VALUES (?,?)", [(1, "Adolescents"), (2, "PTME"), (3, "Enfants")])
+    con.executemany("INSERT INTO lookup_club_attendance VALUES (?,?)", [(0, "Absent"), (1, "Présent"), (2, "Malade")])
+    con.executemany("INSERT INTO lookup_testing_specimen_result VALUES (?,?)", [(1, "Négatif"), (2, "Positif")])
+    n_clubs = max(10, n_patients // 100)
+    con.executemany("INSERT INTO club VALUES (?,?,?)",
+                    [(i, f"Club {i}", rng.randint(1, 3)) for i in range(1, n_clubs + 1)])
+    n_cs = n_clubs * 24
+    con.executemany("INSERT INTO club_session VALUES (?,?,?)",
+                    [(i, rng.randint(1, n_clubs), _day(rng, rng.choice((2024, 2025)))) for i in range(1, n_cs + 1)])
+    con.executemany("INSERT INTO session (id_club_session, id_patient, is_present) VALUES (?,?,?)",
+                    [(rng.randint(1, n_cs), rng.randint(1, n_patients), rng.randint(0, 2))
+                     for _ in range(n_patients * 8)])
+    mothers = rng.sample(range(1, n_patients + 1), n_patients // 3)
+    con.executemany("INSERT INTO tracking_pregnancy (id_patient_mother, ddr, dpa, actual_delivery_date, created_at) "
+                    "VALUES (?,?,?,?,?)",
+                    [(m, _day(rng, 2024), _day(rng), _day(rng) if rng.random() < 0.6 else None, _day(rng))
+                     for m in mothers])
+    con.executemany("INSERT INTO tracking_children (id_patient_child, id_patient_mother) VALUES (?,?)",
+                    [(rng.randint(1, n_patients), m) for m in mothers])
+    con.executemany("INSERT INTO testing_specimen (id_patient, date_blood_taken, pcr_result, which_pcr) VALUES (?,?,?,?)",
+                    [(rng.randint(1, n_patients), _day(rng), rng.randint(1, 2), rng.randint(1, 3))
+                     for _ in range(n_patients)])
+    con.commit()
+    con.close()
+
+
+def make_jobs(db_uri: str, latency: float = 0.0) -> dict:
+    """Un extrait par requête ; `latency` simule le temps d'exécution côté serveur."""
+    from sqlalchemy import text
+    params = {"start": START, "end": END}
+
+    def _job(sql):
+        time.sleep(latency)
+        return run_query(text(sql), db_uri=db_uri, params=params)
+
+    return {name: (lambda sql=sql: _job(sql)) for name, sql in QUERIES.items()}
+
+
+if __name__ == "__main__":
+    if DB_URI is None:
+        path = os.path.join(tempfile.mkdtemp(), "caris_ptme.db")
+        print(f"🔬 Base SQLite de remplacement : {N_PATIENTS:,} patients → {path}")
+        build_sqlite(path, N_PATIENTS)
+        DB_URI = f"sqlite:///{path}"
+
+    jobs = make_jobs(DB_URI, SERVER_LATENCY)
+    print(f"⏳ Latence serveur simulée : {SERVER_LATENCY:.1f}s par requête")
+
+    # 1) En séquence (comportement historique)
+    t0 = time.perf_counter()
+    sequential = {name: fn() for name, fn in jobs.items()}
+    t_seq = time.perf_counter() - t0
+    print(f"🐢 Séquentiel : {t_seq:.2f}s")
+
+    # 2) En parallèle sur le pool partagé
+    t0 = time.perf_counter()
+    parallel, timings = run_extracts(jobs)
+    t_par = time.perf_counter() - t0
+    print(f"⚡ Parallèle : {t_par:.2f}s (x{t_seq / t_par:.1f})")
+
+    for name, df in sequential.items():
+        pd.testing.assert_frame_equal(df, parallel[name])
+    print(f"🎯 {len(jobs)} extraits identiques ({sum(len(df) for df in parallel.values()):,} lignes)")
@@ -0,0 +1,81 @@
+"""
+Benchmark de la lecture SQL en streaming (utils.stream_query_to_parquet)
+- Réutilise la base SQLite de remplacement de benchmark_ptme_extracts (schéma PTME)
+- Lit l'historique des sessions de club :
+    1) en entier (pd.read_sql_query puis typage)
+    2) en streaming par morceaux typés écrits directement en dataset Parquet
+- Compare le pic mémoire Python (tracemalloc) et vérifie les types relus depuis le Parquet
+
+Usage: python others/benchmark_sql_streaming.py [N_PATIENTS] [CHUNKSIZE]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "script"))
+sys.path.insert(0, HERE)
+from utils import run_query, apply_sql_schema, stream_query_to_parquet  # noqa: E402
+from benchmark_ptme_extracts import build_sqlite  # noqa: E402
+
+N_PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+CHUNKSIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+HISTORY_SQL = """
+    SELECT s.id_patient, p.patient_code, c.name AS club_name, lct.name AS club_type,
+           cs.date AS session_date_presence, s.is_present AS present, lca.name AS raison_absence
+    FROM session s
+    LEFT JOIN club_session cs ON cs.id = s.id_club_session
+    LEFT JOIN club c ON c.id = cs.id_club
+    LEFT JOIN lookup_club_type lct ON lct.id = c.club_type
+    LEFT JOIN patient p ON p.id = s.id_patient
+    LEFT JOIN lookup_club_attendance lca ON lca.id = s.is_present
+    ORDER BY s.id
+"""
+HISTORY_SCHEMA = {
+    "id_patient": "int",
+    "session_date_presence": "date",
+    "club_name": "category",
+    "club_type": "category",
+    "raison_absence": "category",
+    "present": "int8",
+}
+
+
+def measure(fn):
+    """(résultat, secondes, pic mémoire en Mo)"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 ** 2
+
+
+if __name__ == "__main__":
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "caris_ptme.db")
+    print(f"🔬 Base SQLite de remplacement : {N_PATIENTS:,} patients ({N_PATIENTS * 8:,} présences)")
+    build_sqlite(path, N_PATIENTS)
+    db_uri = f"sqlite:///{path}"
+
+    full, t_full, m_full = measure(lambda: apply_sql_schema(run_query(HISTORY_SQL, db_uri=db_uri), HISTORY_SCHEMA))
+    print(f"🐢 Lecture complète : {len(full):,} lignes en {t_full:.1f}s — pic {m_full:,.0f} Mo")
+
+    dest = os.path.join(tmp, "club_sessions_history")
+    rows, t_stream, m_stream = measure(
+        lambda: stream_query_to_parquet(HISTORY_SQL, dest, HISTORY_SCHEMA, CHUNKSIZE, db_uri=db_uri))
+    print(f"⚡ Streaming Parquet ({CHUNKSIZE:,} lignes/morceau) : {rows:,} lignes en {t_stream:.1f}s — "
+          f"pic {m_stream:,.0f} Mo")
+
+    back = pd.read_parquet(dest)
+    assert len(back) == len(full) == rows
+    print("🎯 Types relus :", {c: str(back[c].dtype) for c in HISTORY_SCHEMA})
+    pd.testing.assert_series_equal(back["session_date_presence"], full["session_date_presence"], check_dtype=False)
+    print(f"📉 Pic mémoire divisé par {m_full / m_stream:.1f}")
@@ -0,0 +1,666 @@
+"""
+Générateur vectorisé d'exports CommCare fictifs (mêmes noms de fichiers et de colonnes que
+les exports lus par les pipelines) pour les benchmarks hors ligne, de 10k à 5M lignes
+- Nutrition : dépistage, suivi nutritionnel, cas Nutrition (enrôlement)
+- PTME / OEV : appels et visites (6 formulaires lus par call-pipeline)
+- MUSO : groupes et bénéficiaires
+- All Gardens
+Conventions CommCare respectées : '---' pour les valeurs absentes, dates 'AAAA-MM-JJ',
+horodatages 'AAAA-MM-JJ HH:MM:SS', identifiants UUID, codes patient SITE/CODE.
+
+Des doublons contrôlables sont plantés (ressaisies de la même personne sous un nouvel
+identifiant, avec ou sans faute de frappe sur le nom) ; la vérité terrain est écrite dans
+_doublons_plantes.csv (jeu, ligne du doublon, ligne d'origine, faute ou non).
+Génération et écriture par morceaux de CHUNK_ROWS lignes (~3,5 Go de pic à 5M lignes) ;
+l'écriture xlsx (openpyxl) reste l'étape la plus lente : préférer parquet au-delà de 100k lignes.
+
+Usage: python others/generate_caris_dataset.py [N_LIGNES] [--sets a,b,...] [--out DOSSIER]
+                                                [--format xlsx|parquet|csv] [--dup-rate 0.05]
+                                                [--typo-rate 0.5] [--date AAAA-MM-JJ] [--seed 42]
+  N_LIGNES : lignes par export (les groupes MUSO en ont N/20) ; défaut 10 000
+  --out    : défaut data/synthetic (les pipelines lisent data/ : y copier les fichiers voulus)
+  --format : xlsx par défaut ; au-delà de la limite Excel (1 048 575 lignes) → parquet
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+EXCEL_MAX_ROWS = 1_048_575
+CHUNK_ROWS = 1_000_000  # lignes générées et écrites à la fois (borne la mémoire à 5M lignes)
+MISSING = "---"
+RANDOM_SEED = 42
+START_DAY = np.datetime64("2024-01-01")
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Prénoms et noms courants (prénoms composés tirés à 40 % pour élargir la cardinalité)
+PRENOMS = ["jean", "marie", "pierre", "rose", "kettly", "jude", "wilner", "nadege", "roseline", "fritznel",
+           "mackenson", "widline", "stephanie", "jameson", "guerline", "peterson", "sandra", "ricardo",
+           "esther", "daniel", "mirlande", "junior", "rosemene", "dieunel", "fabiola", "samuel", "lovely",
+           "johanne", "emmanuel", "nathalie", "wideline", "jacqueline", "marc", "evens", "carline",
+           "sonia", "frantz", "gerda", "yves", "magalie", "ketia", "roodly", "jessica", "wisly", "natacha",
+           "rodrigue", "manouchka", "dachena", "berline", "osner"]
+NOMS = ["joseph", "pierre", "jean baptiste", "louis", "charles", "francois", "paul", "michel", "augustin",
+        "desir", "etienne", "alexis", "dorvil", "noel", "celestin", "estime", "saint fleur", "cadet",
+        "toussaint", "philippe", "jeune", "laguerre", "metellus", "baptiste", "simon", "beauvais",
+        "registre", "dumas", "severe", "lafortune", "jean louis", "saint louis", "florestal", "delva",
+        "exantus", "fleurant", "germain", "lundi", "mondesir", "pierre louis", "remy", "saintil",
+        "thelusma", "valcourt", "victor", "zamor", "bien aime", "derisma", "elysee", "jacques"]
+
+OFFICE_DEPARTEMENT = {"PAP": "OUEST", "GON": "ARTIBONITE", "CAP": "NORD", "PDP": "NORD-OUEST",
+                      "FLM": "NORD-EST", "JER": "GRANDE-ANSE", "CAY": "SUD", "HIN": "CENTRE"}
+# Agents de jardinage filtrés par garden_pipeline (pour que le filtre garde des lignes)
+GARDEN_USERNAMES = ["1mackenson", "6jkenson", "j6geniel", "j1james", "j1vincent",
+                    "j6emanise", "j6guerby", "j1napolean", "j1cepoudy", "j6benest"]
+GENDER_FORM = np.array(["Male", "Femelle"])
+
+# Colonnes des exports (en-têtes CommCare ; les colonnes non simulées valent '---')
+COLUMNS = {
+    "depistage": [
+        "number", "formid", "form.depistage.office_location_id", "form.depistage.departement_location_id",
+        "form.depistage.commune_location_id", "form.depistage.site_code_id", "form.depistage.date_de_visite",
+        "form.depistage.last_name", "form.depistage.first_name", "form.depistage.gender",
+        "form.depistage.date_of_birth", "form.depistage.muac", "form.depistage.weight_kg", "form.depistage.height",
+        "form.depistage.edema", "form.depistage.lesion_cutane", "form.depistage.diarrhea",
+        "form.depistage.autres_symptomes", "form.depistage.carer_name", "form.depistage.carer_relationship_to_patient",
+        "form.depistage.patient_code", "form.depistage.address", "form.depistage.phone_number",
+        "form.depistage.phone_number_2", "form.depistage.carer_name_add", "form.depistage.phone_number_add",
+        "form.depistage.photo_depistage", "form.depistage.office", "form.depistage.departement",
+        "form.depistage.commune", "form.depistage.site_code", "form.depistage.owner_id",
+        "form.depistage.date_de_depistage", "form.depistage.fullname", "form.depistage.eligible",
+        "form.depistage.manutrition_type", "form.case.@case_id", "completed_time", "started_time", "username",
+        "received_on", "form_link", "hq_user", "form.depistage.nut_code", "form.depistage.open_by_agent",
+    ],
+    "suivi_nutritionnel": [
+        "number", "formid", "form.date_of_visit", "form.type_of_visit", "form.is_available_at_time_visit",
+        "form.enfant_absent", "form.nbr_visit", "form.nbr_visit_succeed", "form.discharge.raison_pour_la_sortie",
+        "form.discharge.last_weight", "form.discharge.last_height", "form.discharge.last_muac",
+        "form.followup_visit.Medicaments_Administres.mamba_quantity_given", "form.case.@case_id",
+        "completed_time", "started_time", "username", "received_on", "form_link",
+    ],
+    "nutrition": [
+        "number", "caseid", "name", "first_name", "last_name", "eligible", "manutrition_type", "date_of_birth",
+        "gender", "muac", "nbr_visit", "is_alive", "death_date", "death_reason", "nbr_visit_succeed",
+        "admission_muac", "office", "commune", "departement", "household_collection_date", "household_number",
+        "has_household", "closed", "closed_date", "last_modified_date", "opened_date", "case_link",
+        "enrollement_date_de_visite", "enrollment_date", "enrollment_eligibility", "enrollment_manutrition_type",
+        "is_enrolled", "hiv_test_done", "hiv_test_result", "club_id", "club_name", "date_admission",
+        "child_often_sick", "exclusive_breastfeeding_6months", "breastfeeding_received", "enrrolled_where",
+        "has_mamba", "last_mamba_date", "nut_code", "last_date_of_visit", "is_approve_by_manager",
+        "raison_de_non_approbation", "last_modified_by_user_username", "closed_by_username", "approval_date",
+        "visit_reason_not_reachable", "username", "owner_name",
+    ],
+    "muso_groupes": [
+        "number", "caseid", "cycle_1_start_date", "is_graduated", "office", "graduation_date", "localite_name",
+        "cycle_2_start_date", "commune", "officer", "cycle_3_end_date", "commune_name", "code", "cycle_2_end_date",
+        "cycle_1_end_date", "inactive_date", "creation_date", "meeting_hour", "officer_name", "meeting_day",
+        "formed_by_members_from", "localite", "actual_cycle", "cycle_3_start_date", "is_inactive", "section",
+        "id_group", "gps_date", "gps", "office_name", "office_id", "commune_id", "adress",
+        "section_communale_name", "section_communale_id", "section_communale", "owner_id", "section_name",
+        "departement", "departement_name", "name", "office_location_id", "departement_location_id",
+        "commune_location_id", "section_communale_location_id", "closed_date", "inactive_reason",
+        "derniere_date_suivi", "derniere_cotisation", "present", "message", "credit", "balance", "absent",
+        "cotisation", "date_suivi", "date_prochain_suivi", "closed", "closed_by_username", "closed_date1",
+        "last_modified_by_user_username", "last_modified_date", "opened_by_username", "opened_date",
+        "owner_name", "case_link",
+    ],
+    "muso_beneficiaries": [
+        "number", "caseid", "household_number", "group_code", "dob", "patient_code", "first_name",
+        "group_commune", "phone", "is_inactive", "group_departement", "inactive_date", "graduated",
+        "abandoned_date", "is_abandoned", "last_name", "graduation_date", "gender", "rank", "group_name",
+        "address", "is_pvvih", "is_caris_member", "name", "household_number_2022", "muso_start_date",
+        "patient_code_pv", "date_enquete_ppi", "score_total_ppi", "close_reason", "removing_date", "test",
+        "test_result", "date_du_test", "institution_ou_centre_hospitalier_qui_a_fait_le_test", "est_sous_arv",
+        "proche_decede_du_vih", "hospitalisation_dans_les_3_derniers_mois",
+        "lien_de_parent_avec_proche_decede_du_vih", "probleme_de_sante_regulier", "refere", "owner_id",
+        "indices.muso_groupes", "closed", "closed_by_username", "closed_date", "last_modified_by_user_username",
+        "last_modified_date", "opened_by_username", "opened_date", "owner_name", "case_link",
+    ],
+    "all_gardens": [
+        "number", "info.case_id", "name", "caris_site", "address_department", "address_commune",
+        "cycle_1_start_date", "cycle_2_start_date", "cycle_3_start_date", "cycle_4_start_date",
+        "closed", "info.closed_date", "info.last_modified_date", "info.opened_date", "info.owner_name",
+    ],
+}
+
+# Formulaires d'appels / visites : (fichier, groupe du formulaire, champ code patient, champ date, champ présence)
+CALL_FORMS = {
+    "appels_ptme": ("Caris Health Agent - Femme PMTE  - APPELS PTME (created 2025-02-13)",
+                    "APPELS_PTME", "patient_code", "date_appel", "is_ptme_available", "ptme"),
+    "visite_ptme": ("Caris Health Agent - Femme PMTE  - Visite PTME (created 2025-02-13)",
+                    "visite_ptme", "health_id", "date_of_visit", "is_present", "ptme"),
+    "ration_ptme": ("Caris Health Agent - Femme PMTE  - Ration & Autres Visites (created 2025-02-18)",
+                    "visit_ratio_and_others", "patient_code", "date_of_visit", "is_benficiary_present", "ptme"),
+    "appels_oev":  ("Caris Health Agent - Enfant - APPELS OEV (created 2025-01-08)",
+                    "appels_oev", "patient_code", "date_appel", "parenttuteur_trouve", "oev"),
+    "ration_oev":  ("Caris Health Agent - Enfant - Ration et autres visites (created 2022-08-29)",
+                    "visit_ratio_and_others", "patient_code", "date_of_visit", "is_benficiary_present", "oev"),
+    "visite_oev":  ("Caris Health Agent - Enfant - Visite Enfant (created 2025-07-30)",
+                    "visite_enfant", "patient_code", "date_of_visit", "is_available_at_time_visit", "oev"),
+}
+for _name, (_, _group, _code, _date, _found, _) in CALL_FORMS.items():
+    COLUMNS[_name] = ["number", "formid", f"form.{_group}.{_code}", f"form.{_group}.{_date}",
+                      f"form.{_group}.{_found}", f"form.{_group}.commune", "form.case.@case_id",
+                      "completed_time", "started_time", "username", "received_on", "form_link"]
+
+FILE_NAMES = {
+    "depistage": "Caris Health Agent - NUTRITON[HIDDEN] - Dépistage Nutritionnel (created 2025-06-26)",
+    "suivi_nutritionnel": "Caris Health Agent - Nutrition - Suivi nutritionel (created 2025-06-26)",
+    "nutrition": "Nutrition (created 2025-04-25)",
+    "muso_groupes": "muso_groupes (created 2025-03-25)",
+    "muso_beneficiaries": "muso_beneficiaries (created 2025-03-25)",
+    "all_gardens": "All Gardens",
+    **{name: spec[0] for name, spec in CALL_FORMS.items()},
+}
+
+# Colonnes de nom (prénom, nom) par jeu, cibles des fautes de frappe sur les doublons
+NAME_COLUMNS = {
+    "depistage": ("form.depistage.first_name", "form.depistage.last_name"),
+    "nutrition": ("first_name", "last_name"),
+    "muso_beneficiaries": ("first_name", "last_name"),
+}
+# Colonnes identifiant une saisie (régénérées sur les doublons)
+ID_COLUMNS = ["formid", "caseid", "form.case.@case_id", "info.case_id"]
+
+
+#=================================================================================================
+# Briques vectorisées
+#=================================================================================================
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+def uuids(rng: np.random.Generator, n: int) -> np.ndarray:
+    """n identifiants au format UUID (8-4-4-4-12) sans boucle Python."""
+    nibbles = _HEX[rng.integers(0, 16, size=(n, 32), dtype=np.uint8)]
+    out = np.full((n, 36), ord("-"), dtype=np.uint8)
+    out[:, [i for i in range(36) if i not in (8, 13, 18, 23)]] = nibbles
+    return out.view("S36").ravel().astype(str)
+
+
+def days(rng: np.random.Generator, n: int, start=START_DAY, end=None) -> np.ndarray:
+    end = np.datetime64(end or datetime.today().date())
+    return start + rng.integers(0, max(1, (end - start).astype(int)), n).astype("timedelta64[D]")
+
+
+def fmt_days(d: np.ndarray) -> np.ndarray:
+    return np.datetime_as_string(d, unit="D")
+
+
+def fmt_times(d: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Horodatages 'AAAA-MM-JJ HH:MM:SS' dans la journée de `d`."""
+    t = d.astype("datetime64[s]") + rng.integers(6 * 3600, 19 * 3600, len(d)).astype("timedelta64[s]")
+    return np.char.replace(np.datetime_as_string(t, unit="s"), "T", " ")
+
+
+def with_missing(values: np.ndarray, rng: np.random.Generator, rate: float) -> np.ndarray:
+    """Remplace une fraction `rate` des valeurs par '---' (colonnes numériques → object mixte, comme CommCare)."""
+    missing = rng.random(len(values)) < rate
+    if values.dtype.kind == "U":
+        return np.where(missing, MISSING, values)
+    values = values.astype(object)
+    values[missing] = MISSING
+    return values
+
+
+def digits(rng: np.random.Generator, n: int, width: int) -> np.ndarray:
+    return np.char.zfill(rng.integers(0, 10 ** width, n).astype(str), width)
+
+
+def typos(names: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Une faute par nom (suppression, doublement ou substitution d'une lettre), vectorisée."""
+    raw = np.asarray(names, dtype="S")
+    width = raw.dtype.itemsize
+    n = len(raw)
+    if n == 0:
+        return np.asarray(names, dtype=str)
+    chars = np.zeros((n, width + 2), dtype=np.uint8)
+    chars[:, :width] = raw.view(np.uint8).reshape(n, width)
+    length = np.maximum((chars != 0).sum(axis=1), 1)
+    pos = (rng.random(n) * length).astype(int)[:, None]
+    op = rng.integers(0, 3, n)[:, None]
+    j = np.arange(width + 1)[None, :]
+    src = np.where(op == 0, j + (j >= pos), np.where(op == 1, j - (j > pos), j))
+    out = np.take_along_axis(chars, np.clip(src, 0, width + 1), axis=1)
+    sub = op[:, 0] == 2
+    out[sub, pos[sub, 0]] = np.frombuffer(b"aeioulnrst", dtype=np.uint8)[rng.integers(0, 10, sub.sum())]
+    return out.view(f"S{width + 1}").ravel().astype(str)
+
+
+def load_sites() -> pd.DataFrame:
+    """Sites CARIS (input/site_info.xlsx s'il est présent, sinon une liste minimale)."""
+    path = Path(HERE).parent / "input" / "site_info.xlsx"
+    if path.exists():
+        sites = pd.read_excel(path, usecols=["site", "office", "departement", "commune"]).dropna(subset=["site"])
+        sites["departement"] = sites["departement"].astype(str).str.upper()
+        return sites.astype(str).reset_index(drop=True)
+    return pd.DataFrame({
+        "site": [f"{o}/SITE{i}" for o in OFFICE_DEPARTEMENT for i in range(1, 6)],
+        "office": [o for o in OFFICE_DEPARTEMENT for _ in range(5)],
+        "departement": [d for d in OFFICE_DEPARTEMENT.values() for _ in range(5)],
+        "commune": [f"Commune {o} {i}" for o in OFFICE_DEPARTEMENT for i in range(1, 6)],
+    })
+
+
+def usernames(rng: np.random.Generator, k: int = 200) -> np.ndarray:
+    return np.char.add(rng.integers(1, 9, k).astype(str), np.array(PRENOMS)[rng.integers(0, len(PRENOMS), k)])
+
+
+def people(rng: np.random.Generator, n: int, sites: pd.DataFrame, min_age: int, max_age: int) -> pd.DataFrame:
+    """Personnes fictives : nom, sexe, date de naissance, site, code patient et identifiant de cas."""
+    site_idx = rng.integers(0, len(sites), n)
+    today = np.datetime64(datetime.today().date())
+    dob = today - rng.integers(min_age * 365, max_age * 365 + 1, n).astype("timedelta64[D]")
+    site = sites["site"].to_numpy()[site_idx]
+    prenoms = np.array(PRENOMS)
+    first = prenoms[rng.integers(0, len(prenoms), n)]
+    second = np.char.add(" ", prenoms[rng.integers(0, len(prenoms), n)])
+    first = np.char.add(first, np.where(rng.random(n) < 0.4, second, ""))
+    return pd.DataFrame({
+        "first_name": first,
+        "last_name": np.array(NOMS)[rng.integers(0, len(NOMS), n)],
+        "gender": rng.integers(0, 2, n),
+        "dob": fmt_days(dob),
+        "site": site,
+        "office": sites["office"].to_numpy()[site_idx],
+        "departement": sites["departement"].to_numpy()[site_idx],
+        "commune": sites["commune"].to_numpy()[site_idx],
+        "patient_code": np.char.add(np.char.add(site.astype(str), "/"), digits(rng, n, 7)),
+        "caseid": uuids(rng, n),
+    })
+
+
+def frame(set_name: str, n: int, values: dict) -> pd.DataFrame:
+    """
+    DataFrame aux colonnes de l'export ; colonnes non fournies remplies de '---'.
+    Les colonnes texte sont stockées en chaînes Arrow (tampons contigus, ~10× moins de mémoire
+    que des objets Python à 5M lignes, écrites telles quelles en Parquet).
+    """
+    data = {}
+    for col in COLUMNS[set_name]:
+        v = values.get(col, MISSING)
+        if isinstance(v, str):
+            v = pd.array(pa.repeat(pa.scalar(v), n), dtype=STRING_DTYPE)
+        elif np.isscalar(v):
+            v = np.full(n, v)
+        elif isinstance(v, pd.api.extensions.ExtensionArray):
+            v = v.astype(STRING_DTYPE)
+        elif v.dtype.kind == "U" or pd.api.types.infer_dtype(v, skipna=False) == "string":
+            v = pd.array(pa.array(v, pa.string()), dtype=STRING_DTYPE)
+        data[col] = v
+    return pd.DataFrame(data)
+
+
+def plant_duplicates(df: pd.DataFrame, set_name: str, rng: np.random.Generator,
+                     dup_rate: float, typo_rate: float):
+    """
+    Remplace une fraction `dup_rate` des lignes par des ressaisies d'autres lignes (nouvel
+    identifiant, même personne) ; une fraction `typo_rate` d'entre elles a une faute sur le nom.
+    Returns: (DataFrame, vérité terrain {dup_row, source_row, typo})
+    """
+    n = len(df)
+    n_dup = int(n * dup_rate) if set_name in NAME_COLUMNS else 0
+    if n_dup == 0:
+        return df, pd.DataFrame(columns=["set", "dup_row", "source_row", "typo"])
+    # Positions des doublons tirées au hasard, sources parmi les autres lignes : une seule copie (take)
+    shuffled = rng.permutation(n)
+    dup_rows, source_rows = np.sort(shuffled[:n_dup]), shuffled[n_dup:][rng.integers(0, n - n_dup, n_dup)]
+    take = np.arange(n)
+    take[dup_rows] = source_rows
+    out = df.take(take).reset_index(drop=True)
+    for col in ID_COLUMNS:
+        if col in out.columns:
+            out.loc[dup_rows, col] = uuids(rng, n_dup)
+    has_typo = rng.random(n_dup) < typo_rate
+    first_col, last_col = NAME_COLUMNS[set_name]
+    for col, pick in ((first_col, has_typo), (last_col, has_typo & (rng.random(n_dup) < 0.5))):
+        rows = dup_rows[pick]
+        out.loc[rows, col] = typos(out.loc[rows, col].to_numpy(), rng)
+    truth = pd.DataFrame({"set": set_name, "dup_row": dup_rows, "source_row": source_rows, "typo": has_typo})
+    return out, truth
+
+
+#=================================================================================================
+# Jeux de données
+#=================================================================================================
+def make_depistage(rng, n, ctx) -> pd.DataFrame:
+    kids = ctx["children"].iloc[ctx["offset"]: ctx["offset"] + n]
+    visit = days(rng, n)
+    eligible = rng.random(n) < 0.33
+    return frame("depistage", n, {
+        "number": np.arange(n),
+        "formid": uuids(rng, n),
+        "form.depistage.site_code_id": kids["site"].to_numpy(),
+        "form.depistage.date_de_visite": fmt_days(visit),
+        "form.depistage.last_name": kids["last_name"].to_numpy(),
+        "form.depistage.first_name": kids["first_name"].to_numpy(),
+        "form.depistage.gender": GENDER_FORM[kids["gender"].to_numpy()],
+        "form.depistage.date_of_birth": kids["dob"].to_numpy(),
+        "form.depistage.muac": np.round(rng.normal(13.8, 1.2, n) * 2) / 2,
+        "form.depistage.weight_kg": np.round(rng.normal(11, 2.5, n), 1),
+        "form.depistage.height": np.round(rng.normal(85, 10, n), 1),
+        "form.depistage.edema": np.where(rng.random(n) < 0.02, "yes", "no"),
+        "form.depistage.phone_number": digits(rng, n, 8),
+        "form.depistage.patient_code": with_missing(kids["patient_code"].to_numpy(), rng, 0.95),
+        "form.depistage.office": with_missing(kids["office"].to_numpy(), rng, 0.04),
+        "form.depistage.departement": kids["departement"].to_numpy(),
+        "form.depistage.commune": kids["commune"].to_numpy(),
+        "form.depistage.fullname": np.char.add(np.char.add(kids["first_name"].to_numpy().astype(str), " "),
+                                               kids["last_name"].to_numpy().astype(str)),
+        "form.depistage.eligible": np.where(eligible, "yes", "no"),
+        "form.depistage.manutrition_type": np.where(eligible, np.where(rng.random(n) < 0.15, "MAS", "MAM"), MISSING),
+        "form.case.@case_id": kids["caseid"].to_numpy(),
+        "completed_time": fmt_times(visit, rng),
+        "started_time": fmt_times(visit, rng),
+        "username": ctx["agents"][rng.integers(0, len(ctx["agents"]), n)],
+        "received_on": fmt_times(visit + 1, rng),
+    })
+
+
+def make_nutrition(rng, n, ctx) -> pd.DataFrame:
+    kids = ctx["children"].iloc[ctx["offset"]: ctx["offset"] + n]
+    enrolled = days(rng, n, np.datetime64("2025-01-01"))
+    where = np.where(rng.random(n) < 0.3, "caris_itu", MISSING)
+    closed = rng.random(n) < 0.2
+    agent = ctx["agents"][rng.integers(0, len(ctx["agents"]), n)]
+    return frame("nutrition", n, {
+        "number": np.arange(n),
+        "caseid": kids["caseid"].to_numpy(),
+        "name": np.char.add(np.char.add(kids["first_name"].to_numpy().astype(str), " "),
+                            kids["last_name"].to_numpy().astype(str)),
+        "first_name": kids["first_name"].to_numpy(),
+        "last_name": kids["last_name"].to_numpy(),
+        "eligible": "yes",
+        "manutrition_type": np.where(rng.random(n) < 0.15, "MAS", "MAM"),
+        "date_of_birth": kids["dob"].to_numpy(),
+        "gender": GENDER_FORM[kids["gender"].to_numpy()],
+        "muac": np.round(rng.normal(12.2, 0.6, n) * 2) / 2,
+        "nbr_visit": rng.integers(0, 12, n),
+        "nbr_visit_succeed": rng.integers(0, 10, n),
+        "is_alive": np.where(rng.random(n) < 0.995, "yes", "no"),
+        "office": kids["office"].to_numpy(),
+        "commune": kids["commune"].to_numpy(),
+        "departement": kids["departement"].to_numpy(),
+        "closed": closed,
+        "closed_date": np.where(closed, fmt_times(enrolled + 60, rng), MISSING),
+        "last_modified_date": fmt_times(enrolled + 30, rng),
+        "opened_date": fmt_times(enrolled, rng),
+        "enrollement_date_de_visite": fmt_days(enrolled),
+        "is_enrolled": "yes",
+        "enrrolled_where": where,
+        "has_mamba": np.where(rng.random(n) < 0.6, "yes", "no"),
+        "last_mamba_date": with_missing(fmt_days(enrolled + 14), rng, 0.4),
+        "approval_date": with_missing(fmt_days(enrolled + 7), rng, 0.3),
+        "username": agent,
+        "owner_name": agent,
+        "last_modified_by_user_username": agent,
+    })
+
+
+def make_suivi(rng, n, ctx) -> pd.DataFrame:
+    cases = ctx["children"]["caseid"].array[: max(1, len(ctx["children"]) // 3)]
+    visit = days(rng, n, np.datetime64("2025-01-01"))
+    available = rng.random(n) < 0.85
+    return frame("suivi_nutritionnel", n, {
+        "number": np.arange(n),
+        "formid": uuids(rng, n),
+        "form.date_of_visit": fmt_days(visit),
+        "form.type_of_visit": np.where(rng.random(n) < 0.9, "followup", "discharge"),
+        "form.is_available_at_time_visit": np.where(available, "yes", "no"),
+        "form.enfant_absent": np.where(available, MISSING, "yes"),
+        "form.nbr_visit": rng.integers(1, 12, n),
+        "form.nbr_visit_succeed": rng.integers(0, 10, n),
+        "form.discharge.last_muac": with_missing(np.round(rng.normal(12.8, 0.8, n), 1), rng, 0.9),
+        "form.followup_visit.Medicaments_Administres.mamba_quantity_given": with_missing(
+            rng.integers(1, 15, n), rng, 0.5),
+        "form.case.@case_id": cases.take(rng.integers(0, len(cases), n)),
+        "completed_time": fmt_times(visit, rng),
+        "started_time": fmt_times(visit, rng),
+        "username": ctx["agents"][rng.integers(0, len(ctx["agents"]), n)],
+        "received_on": fmt_times(visit + 1, rng),
+    })
+
+
+def make_call_form(set_name: str):
+    _, group, code_field, date_field, found_field, program = CALL_FORMS[set_name]
+
+    def _make(rng, n, ctx) -> pd.DataFrame:
+        pool = ctx["children"] if program == "oev" else ctx["women"]
+        idx = rng.integers(0, len(pool), n)
+        when = days(rng, n, np.datetime64("2025-01-01"))
+        found = rng.choice(np.array(["1", "0", MISSING]), n, p=[0.75, 0.2, 0.05])
+        return frame(set_name, n, {
+            "number": np.arange(n),
+            "formid": uuids(rng, n),
+            f"form.{group}.{code_field}": pool["patient_code"].array.take(idx),
+            f"form.{group}.{date_field}": with_missing(fmt_days(when), rng, 0.01),
+            f"form.{group}.{found_field}": found,
+            f"form.{group}.commune": pool["commune"].array.take(idx),
+            "form.case.@case_id": pool["caseid"].array.take(idx),
+            "completed_time": fmt_times(when, rng),
+            "started_time": fmt_times(when, rng),
+            "username": ctx["agents"][rng.integers(0, len(ctx["agents"]), n)],
+            "received_on": fmt_times(when + 1, rng),
+        })
+    return _make
+
+
+def make_muso_groupes(rng, n, ctx) -> pd.DataFrame:
+    sites = ctx["sites"]
+    idx = rng.integers(0, len(sites), n)
+    created = days(rng, n, np.datetime64("2019-01-01"))
+    closed = rng.random(n) < 0.1
+    officer = ctx["agents"][rng.integers(0, len(ctx["agents"]), n)]
+    names = np.char.add(np.char.add("Muso ", np.array(NOMS)[rng.integers(0, len(NOMS), n)]),
+                        np.char.add(" ", np.arange(ctx["offset"] + 1, ctx["offset"] + n + 1).astype(str)))
+    return frame("muso_groupes", n, {
+        "number": np.arange(n),
+        "caseid": ctx["group_ids"][ctx["offset"]: ctx["offset"] + n],
+        "office": sites["office"].to_numpy()[idx],
+        "office_name": sites["office"].to_numpy()[idx],
+        "commune_name": sites["commune"].to_numpy()[idx],
+        "departement_name": sites["departement"].to_numpy()[idx],
+        "code": np.arange(ctx["offset"] + 1, ctx["offset"] + n + 1),
+        "name": names,
+        "creation_date": with_missing(fmt_days(created), rng, 0.4),
+        "cycle_1_start_date": fmt_days(created),
+        "is_graduated": (rng.random(n) < 0.3).astype(int),
+        "is_inactive": (rng.random(n) < 0.1).astype(int),
+        "meeting_day": rng.integers(1, 8, n),
+        "officer_name": officer,
+        "closed": closed,
+        "last_modified_date": fmt_times(created + 365, rng),
+        "opened_by_username": officer,
+        "opened_date": fmt_times(created, rng),
+        "owner_name": officer,
+    })
+
+
+def make_muso_beneficiaries(rng, n, ctx) -> pd.DataFrame:
+    adults = ctx["women"].iloc[ctx["offset"]: ctx["offset"] + n]
+    n_groups = len(ctx["group_ids"])
+    group = rng.integers(0, n_groups, n)
+    start = days(rng, n, np.datetime64("2019-01-01"))
+    agent = ctx["agents"][rng.integers(0, len(ctx["agents"]), n)]
+    return frame("muso_beneficiaries", n, {
+        "number": np.arange(n),
+        "caseid": adults["caseid"].to_numpy(),
+        "household_number": digits(rng, n, 6),
+        "group_code": group + 1,
+        "dob": adults["dob"].to_numpy(),
+        "patient_code": with_missing(adults["patient_code"].to_numpy(), rng, 0.8),
+        "first_name": adults["first_name"].to_numpy(),
+        "last_name": adults["last_name"].to_numpy(),
+        "name": np.char.add(np.char.add(adults["first_name"].to_numpy().astype(str), " "),
+                            adults["last_name"].to_numpy().astype(str)),
+        "group_commune": adults["commune"].to_numpy(),
+        "group_departement": adults["departement"].to_numpy(),
+        "phone": digits(rng, n, 8),
+        "is_inactive": (rng.random(n) < 0.1).astype(int),
+        "gender": np.where(rng.random(n) < 0.85, 2, 1),
+        "is_pvvih": np.where(rng.random(n) < 0.3, "1", "0"),
+        "is_caris_member": np.where(rng.random(n) < 0.6, "1", "0"),
+        "muso_start_date": fmt_days(start),
+        "removing_date": with_missing(fmt_days(start + 400), rng, 0.9),
+        "indices.muso_groupes": ctx["group_ids"][group],
+        "closed": rng.random(n) < 0.05,
+        "last_modified_by_user_username": agent,
+        "last_modified_date": fmt_times(start + 30, rng),
+        "opened_by_username": agent,
+        "opened_date": fmt_times(start, rng),
+        "owner_name": agent,
+    })
+
+
+def make_all_gardens(rng, n, ctx) -> pd.DataFrame:
+    sites = ctx["sites"]
+    idx = rng.integers(0, len(sites), n)
+    start = days(rng, n, np.datetime64("2023-01-01"))
+    owners = np.concatenate([np.array(GARDEN_USERNAMES), ctx["agents"][:40]])
+    return frame("all_gardens", n, {
+        "number": np.arange(n),
+        "info.case_id": uuids(rng, n),
+        "name": np.char.add("Jardin ", np.arange(ctx["offset"] + 1, ctx["offset"] + n + 1).astype(str)),
+        "caris_site": np.char.add(np.char.add(sites["site"].to_numpy()[idx].astype(str), " - "),
+                                  sites["commune"].to_numpy()[idx].astype(str)),
+        "address_department": np.char.lower(sites["departement"].to_numpy()[idx].astype(str)),
+        "address_commune": sites["commune"].to_numpy()[idx],
+        "cycle_1_start_date": fmt_days(start),
+        "cycle_2_start_date": with_missing(fmt_days(start + 120), rng, 0.3),
+        "cycle_3_start_date": with_missing(fmt_days(start + 240), rng, 0.6),
+        "cycle_4_start_date": with_missing(fmt_days(start + 360), rng, 0.85),
+        "closed": rng.random(n) < 0.1,
+        "info.last_modified_date": fmt_times(days(rng, n, np.datetime64("2024-06-01")), rng),
+        "info.opened_date": fmt_times(start, rng),
+        "info.owner_name": owners[rng.integers(0, len(owners), n)],
+    })
+
+
+MAKERS = {
+    "depistage": make_depistage,
+    "suivi_nutritionnel": make_suivi,
+    "nutrition": make_nutrition,
+    **{name: make_call_form(name) for name in CALL_FORMS},
+    "muso_groupes": make_muso_groupes,
+    "muso_beneficiaries": make_muso_beneficiaries,
+    "all_gardens": make_all_gardens,
+}
+# Lignes par jeu relativement à N (un groupe MUSO pour ~20 bénéficiaires)
+ROW_RATIO = {"muso_groupes": 0.05}
+
+
+#=================================================================================================
+# Écriture
+#=================================================================================================
+def write_export(chunks, rows: int, path_base: Path, fmt: str) -> Path:
+    """
+    Écrit un export morceau par morceau (parquet/csv en flux) ; xlsx au-delà de la limite
+    Excel bascule en parquet.
+    """
+    if fmt == "xlsx" and rows > EXCEL_MAX_ROWS:
+        print(f"⚠️ {rows:,} lignes > limite Excel : {path_base.name} écrit en parquet")
+        fmt = "parquet"
+    path = path_base.with_name(f"{path_base.name}.{fmt}")
+    if fmt == "xlsx":
+        df = pd.concat(list(chunks), ignore_index=True)
+        try:
+            # ModuleNotFoundError (ImportError) si xlsxwriter n'est pas installé
+            with pd.ExcelWriter(path, engine="xlsxwriter",
+                                engine_kwargs={"options": {"constant_memory": True}}) as writer:
+                df.to_excel(writer, index=False)
+        except ImportError:
+            df.to_excel(path, index=False)
+        return path
+    writer = None
+    for i, df in enumerate(chunks):
+        if fmt == "csv":
+            df.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            continue
+        # Colonnes mixtes (nombres et '---') en texte, comme à la relecture des exports
+        df = df.astype({c: str for c in df.columns if df[c].dtype == object})
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        writer = writer or pq.ParquetWriter(path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+    return path
+
+
+def parse_args(argv):
+    opts = {"rows": 10_000, "sets": list(MAKERS), "out": Path(HERE).parent / "data" / "synthetic",
+            "format": "xlsx", "dup_rate": 0.05, "typo_rate": 0.5,
+            "date": datetime.today().strftime("%Y-%m-%d"), "seed": RANDOM_SEED}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--sets":
+            opts["sets"] = next(args).split(",")
+        elif arg == "--out":
+            opts["out"] = Path(next(args))
+        elif arg == "--format":
+            opts["format"] = next(args)
+        elif arg == "--dup-rate":
+            opts["dup_rate"] = float(next(args))
+        elif arg == "--typo-rate":
+            opts["typo_rate"] = float(next(args))
+        elif arg == "--date":
+            opts["date"] = next(args)
+        elif arg == "--seed":
+            opts["seed"] = int(next(args))
+        else:
+            opts["rows"] = int(arg.replace("_", ""))
+    unknown = set(opts["sets"]) - set(MAKERS)
+    if unknown:
+        raise SystemExit(f"❌ Jeux inconnus : {', '.join(sorted(unknown))} (connus : {', '.join(MAKERS)})")
+    return opts
+
+
+def generate(opts) -> dict:
+    """Génère les jeux demandés ; renvoie {jeu: chemin écrit}."""
+    rng = np.random.default_rng(opts["seed"])
+    n = opts["rows"]
+    sites = load_sites()
+    n_groups = max(1, int(n * ROW_RATIO["muso_groupes"]))
+    ctx = {"sites": sites, "agents": usernames(rng), "group_ids": uuids(rng, n_groups)}
+    for pool, (min_age, max_age) in (("children", (0, 5)), ("women", (18, 45))):
+        ctx[pool] = pd.concat([people(rng, min(CHUNK_ROWS, n - offset), sites, min_age, max_age)
+                               for offset in range(0, n, CHUNK_ROWS)], ignore_index=True)
+
+    opts["out"].mkdir(parents=True, exist_ok=True)
+    print(f"🔬 Génération de {len(opts['sets'])} exports fictifs ({n:,} lignes, "
+          f"{opts['dup_rate']:.0%} de doublons dont {opts['typo_rate']:.0%} avec faute) → {opts['out']}")
+    written, truths = {}, []
+    for name in opts["sets"]:
+        t0 = time.perf_counter()
+        rows = max(1, int(n * ROW_RATIO.get(name, 1.0)))
+
+        def chunks():
+            # Doublons plantés à l'intérieur de chaque morceau (sources à moins de CHUNK_ROWS lignes)
+            for offset in range(0, rows, CHUNK_ROWS):
+                size = min(CHUNK_ROWS, rows - offset)
+                df = MAKERS[name](rng, size, {**ctx, "offset": offset})
+                df, truth = plant_duplicates(df, name, rng, opts["dup_rate"], opts["typo_rate"])
+                df["number"] = np.arange(offset, offset + size)
+                truths.append(truth.assign(dup_row=truth["dup_row"] + offset,
+                                           source_row=truth["source_row"] + offset))
+                yield df
+
+        written[name] = write_export(chunks(), rows, opts["out"] / f"{FILE_NAMES[name]} {opts['date']}",
+                                     opts["format"])
+        elapsed = time.perf_counter() - t0
+        print(f"⏱️ {name} : {rows:,} lignes × {len(COLUMNS[name])} colonnes en {elapsed:.1f}s "
+              f"({rows / elapsed:,.0f} lignes/s)")
+    pd.concat(truths, ignore_index=True).to_csv(opts["out"] / "_doublons_plantes.csv", index=False)
+    print(f"✅ Exports écrits dans {opts['out']} (vérité terrain : _doublons_plantes.csv)")
+    return written
+
+
+if __name__ == "__main__":
+    generate(parse_args(sys.argv[1:]))
@@ -0,0 +1,209 @@
+"""
+Profilage des requêtes SQL lourdes (sql/*.sql) avec historique et détection de régressions
+- Exécute chaque requête enregistrée sur une base configurable (ex. MariaDB locale peuplée
+  ou copie de caris_db) en paramètres liés (utils.load_sql)
+- Mesure le temps réel (médiane de REPEAT exécutions) et le nombre de lignes
+- Capture le plan d'exécution : EXPLAIN ANALYZE (MySQL 8), ANALYZE FORMAT=JSON (MariaDB),
+  EXPLAIN QUERY PLAN (SQLite)
+- Ajoute une ligne par requête à l'historique JSONL et la compare au passage précédent
+  (même base, mêmes paramètres) : temps en hausse au-delà du seuil, nombre de lignes ou plan modifiés
+
+Usage: python others/profile_sql.py [REQUÊTE|fichier.sql ...] [--db URI] [--repeat N]
+                                    [--param nom=valeur ...] [--threshold 0.2] [--no-explain]
+  REQUÊTE : nom enregistré dans QUERIES (défaut : toutes) ou chemin d'un fichier .sql
+  --db    : URI SQLAlchemy (défaut : CARIS_PROFILE_DB_URI, sinon MYSQL_* de variables/dot.env)
+Code de sortie 1 si au moins une régression est détectée.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import statistics
+from datetime import datetime
+from pathlib import Path
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "script"))
+from sqlalchemy import text as sql_text  # noqa: E402
+from utils import get_engine, load_sql, mysql_uri  # noqa: E402
+
+# Requêtes suivies (fichiers du dossier sql/)
+QUERIES = {
+    "mastersheet_ptme": "mastersheet_ptme.sql",
+    "femmes_ptme_servies_quarter": "Femmes_PTME_Servies_quarter.sql",
+    "charges_virales_pediatriques": "Charges_virales_pediatriques.sql",
+}
+
+PROFILE_HISTORY = Path(os.environ.get("CARIS_PROFILE_HISTORY")
+                       or Path(HERE).parent / "data" / ".sql_profile_history.jsonl")
+REGRESSION_THRESHOLD = float(os.getenv("CARIS_PROFILE_REGRESSION", "0.2"))  # +20 % de temps
+REGRESSION_MIN_SECONDS = float(os.getenv("CARIS_PROFILE_MIN_SECONDS", "0.5"))  # ignore le bruit
+
+# Chiffres (coûts, temps, lignes estimées) retirés avant l'empreinte du plan
+_PLAN_NUMBERS_RE = re.compile(r"\d+(?:\.\d+)?(?:e[+-]?\d+)?")
+
+
+def parse_args(argv):
+    """Arguments ligne de commande → dict d'options (sans dépendance à argparse, comme run_pipeline)."""
+    opts = {"queries": [], "db": os.getenv("CARIS_PROFILE_DB_URI"), "repeat": 1, "params": {},
+            "threshold": REGRESSION_THRESHOLD, "explain": True}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--db":
+            opts["db"] = next(args)
+        elif arg == "--repeat":
+            opts["repeat"] = max(1, int(next(args)))
+        elif arg == "--param":
+            name, _, value = next(args).partition("=")
+            opts["params"][name] = value
+        elif arg == "--threshold":
+            opts["threshold"] = float(next(args))
+        elif arg == "--no-explain":
+            opts["explain"] = False
+        else:
+            opts["queries"].append(arg)
+    return opts
+
+
+def resolve_queries(names):
+    """[(nom, fichier)] : noms enregistrés ou chemins de fichiers .sql."""
+    if not names:
+        return list(QUERIES.items())
+    resolved = []
+    for name in names:
+        if name in QUERIES:
+            resolved.append((name, QUERIES[name]))
+        elif name.endswith(".sql"):
+            resolved.append((Path(name).stem, name))
+        else:
+            raise SystemExit(f"❌ Requête inconnue : {name} (connues : {', '.join(QUERIES)})")
+    return resolved
+
+
+def server_version(engine) -> str:
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            return "SQLite " + conn.execute(sql_text("SELECT sqlite_version()")).scalar()
+        return str(conn.execute(sql_text("SELECT VERSION()")).scalar())
+
+
+def explain_prefix(engine, version: str) -> str:
+    """Préfixe d'analyse du plan selon le moteur (l'analyse réexécute la requête côté serveur)."""
+    if engine.dialect.name == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    if "mariadb" in version.lower():
+        return "ANALYZE FORMAT=JSON "
+    return "EXPLAIN ANALYZE "
+
+
+def timed_run(engine, statement, params):
+    """(secondes, lignes) : exécution complète, lignes parcourues sans construire de DataFrame."""
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(statement, params)
+        rows = sum(len(batch) for batch in result.partitions(10_000))
+    return time.perf_counter() - t0, rows
+
+
+def capture_plan(engine, statement, params, prefix: str) -> str:
+    with engine.connect() as conn:
+        rows = conn.execute(sql_text(prefix + statement.text), params).fetchall()
+    return "\n".join(" | ".join(str(v) for v in row) for row in rows)
+
+
+def plan_digest(plan: str) -> str:
+    """Empreinte de la forme du plan (indépendante des coûts et temps mesurés)."""
+    return hashlib.sha1(_PLAN_NUMBERS_RE.sub("#", plan).encode("utf-8")).hexdigest()[:12]
+
+
+def load_history() -> list:
+    if not PROFILE_HISTORY.exists():
+        return []
+    with open(PROFILE_HISTORY, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(entries: list) -> None:
+    PROFILE_HISTORY.parent.mkdir(parents=True, exist_ok=True)
+    with open(PROFILE_HISTORY, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+def previous_run(history: list, query: str, db: str, params: dict):
+    """Dernier passage comparable : même requête, même base, mêmes paramètres."""
+    for entry in reversed(history):
+        if entry["query"] == query and entry["db"] == db and entry["params"] == params:
+            return entry
+    return None
+
+
+def compare(entry: dict, prev, threshold: float) -> list:
+    """Liste des régressions de `entry` par rapport au passage précédent."""
+    if prev is None:
+        return []
+    issues = []
+    delta = entry["wall_s"] - prev["wall_s"]
+    if delta > REGRESSION_MIN_SECONDS and entry["wall_s"] > prev["wall_s"] * (1 + threshold):
+        issues.append(f"temps {prev['wall_s']:.2f}s → {entry['wall_s']:.2f}s (+{delta / prev['wall_s']:.0%})")
+    if entry["rows"] != prev["rows"]:
+        issues.append(f"lignes {prev['rows']:,} → {entry['rows']:,}")
+    if entry.get("plan_digest") and prev.get("plan_digest") and entry["plan_digest"] != prev["plan_digest"]:
+        issues.append(f"plan modifié ({prev['plan_digest']} → {entry['plan_digest']})")
+    if entry["sql_sha1"] != prev["sql_sha1"]:
+        issues = [f"{i} [SQL modifié depuis]" for i in issues]
+    return issues
+
+
+def profile(opts) -> int:
+    db_uri = opts["db"] or mysql_uri(env_path=os.path.join(HERE, "..", "variables", "dot.env"))
+    engine = get_engine(db_uri)
+    db = engine.url.render_as_string(hide_password=True)
+    version = server_version(engine)
+    prefix = explain_prefix(engine, version)
+    history = load_history()
+    print(f"🔬 Profilage sur {db} ({version}), {opts['repeat']} exécution(s) par requête")
+
+    entries, regressions = [], 0
+    for name, path in resolve_queries(opts["queries"]):
+        statement, params = load_sql(path, **opts["params"])
+        runs = [timed_run(engine, statement, params) for _ in range(opts["repeat"])]
+        wall = statistics.median(t for t, _ in runs)
+        plan = capture_plan(engine, statement, params, prefix) if opts["explain"] else ""
+        entry = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "query": name,
+            "file": str(path),
+            "sql_sha1": hashlib.sha1(statement.text.encode("utf-8")).hexdigest()[:12],
+            "db": db,
+            "server": version,
+            "params": params,
+            "repeat": opts["repeat"],
+            "wall_s": round(wall, 4),
+            "wall_runs": [round(t, 4) for t, _ in runs],
+            "rows": runs[-1][1],
+            "plan_digest": plan_digest(plan) if plan else None,
+            "explain": plan,
+        }
+        issues = compare(entry, previous_run(history, name, db, entry["params"]), opts["threshold"])
+        regressions += bool(issues)
+        entries.append(entry)
+        print(f"⏱️ {name} : {entry['rows']:,} lignes en {wall:.2f}s"
+              + (f" — plan {entry['plan_digest']}" if plan else ""))
+        for issue in issues:
+            print(f"   ⚠️ Régression : {issue}")
+
+    append_history(entries)
+    print(f"💾 Historique : {PROFILE_HISTORY}")
+    if regressions:
+        print(f"❌ {regressions} requête(s) en régression")
+        return 1
+    print("✅ Aucune régression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(profile(parse_args(sys.argv[1:])))
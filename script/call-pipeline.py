@@ -32,6 +32,7 @@ import os
 from dotenv import load_dotenv
 import openpyxl
 from openpyxl.utils import get_column_letter
+from utils import read_excel_snapshot
 
 # Define datetime range
 start_date = pd.to_datetime('2025-01-01')
@@ -450,12 +451,12 @@ def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.abspath(os.path.join(script_dir, '..', 'data'))
 
-    Apel_ptme = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - APPELS PTME (created 2025-02-13) {today_date}.xlsx"), parse_dates=True)
-    Apel_oev = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Enfant - APPELS OEV (created 2025-01-08) {today_date}.xlsx"), parse_dates=True)
-    Visite_ptme = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - Visite PTME (created 2025-02-13) {today_date}.xlsx"), parse_dates=True)
-    Ration_ptme = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - Ration & Autres Visites (created 2025-02-18) {today_date}.xlsx"), parse_dates=True)
-    Ration_oev = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Enfant - Ration et autres visites (created 2022-08-29) {today_date}.xlsx"), parse_dates=True)
-    oev_visite = pd.read_excel(os.path.join(data_dir, f"Caris Health Agent - Enfant - Visite Enfant (created 2025-07-30) {today_date}.xlsx"), parse_dates=True)
+    Apel_ptme = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - APPELS PTME (created 2025-02-13) {today_date}.xlsx"))
+    Apel_oev = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Enfant - APPELS OEV (created 2025-01-08) {today_date}.xlsx"))
+    Visite_ptme = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - Visite PTME (created 2025-02-13) {today_date}.xlsx"))
+    Ration_ptme = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Femme PMTE  - Ration & Autres Visites (created 2025-02-18) {today_date}.xlsx"))
+    Ration_oev = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Enfant - Ration et autres visites (created 2022-08-29) {today_date}.xlsx"))
+    oev_visite = read_excel_snapshot(os.path.join(data_dir, f"Caris Health Agent - Enfant - Visite Enfant (created 2025-07-30) {today_date}.xlsx"))
 
     # We copy ration oev file to have info on oev visit
     Visite_oev = Ration_oev.copy(deep=True)
@@ -1,25 +1,12 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
 import pandas as pd
+from utils import run_query, load_sql
 
-def execute_sql_query(env_path: str, sql_file_path: str) -> pd.DataFrame:
-    load_dotenv(env_path)
-    user = os.getenv('MYSQL_USER')
-    password = os.getenv('MYSQL_PASSWORD')
-    host = os.getenv('MYSQL_HOST')
-    db = os.getenv('MYSQL_DB')
-
-    conn_text = f'mysql+pymysql://{user}:{password}@{host}/{db}'
-    engine = create_engine(conn_text)
-
-    with open(sql_file_path, 'r') as file:
-        sql_query = file.read().replace('use caris_db;', '')
-
-    df = pd.read_sql_query(sql_query, engine)
-    engine.dispose()
-
-    return df
+def execute_sql_query(env_path: str, sql_file_path: str, params: dict = None) -> pd.DataFrame:
+    # Engine partagé et poolé (utils.get_engine) ; modèle compilé en paramètres liés (utils.load_sql)
+    sql, bound = load_sql(sql_file_path, **(params or {}))
+    return run_query(sql, env_path=env_path, params=bound)
 
 #===========================================================================================================================
 #========================================================================================================================= 
@@ -26,7 +26,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 # import functions
-from utils import get_commcare_odata
+from utils import get_commcare_odata, run_query, run_extracts, stream_query_to_parquet, prepare_sql
 # Download charges virales database from "Charges_virales_pediatriques.sql file"
 from caris_fonctions import execute_sql_query
 
@@ -70,16 +70,10 @@ def get_pregnancy_data(start_date, end_date, db_config, sql_script=None):
     :param sql_script: Script SQL personnalisé (optionnel). Si None, utilise la requête par défaut.
     :return: DataFrame pandas des résultats.
     """
-    # Sécuriser les dates
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-
     # Utiliser le script SQL fourni ou la requête par défaut
+    # (variables @start_date / @end_date liées comme paramètres par utils.prepare_sql)
     if sql_script is None:
-        sql_query = f"""
-SET @start_date={start_date_sql};
-SET @end_date={end_date_sql};
-
+        sql_query = """
 SELECT 
     lhs.office,
     lhs.name as hosp,
@@ -191,31 +185,15 @@ WHERE
 GROUP BY id_patient_mother
 """
     else:
-        # Utiliser le script SQL fourni et remplacer les placeholders de dates
-        sql_query = sql_script.replace("{start_date}", start_date_sql).replace("{end_date}", end_date_sql)    # La fonction read_sql_query de Pandas ne peut pas exécuter les commandes SET 
-    # car elle attend une seule commande SELECT.
-    # Nous devons donc exécuter SET séparément.
+        # Script fourni : {start_date}, @start_date ou :start_date ; les SET @... sont retirés
+        sql_query = sql_script
     
     # 2. Connexion et Exécution
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Remplacer les variables @start_date et @end_date directement dans la requête
-        select_query = sql_query.replace("@start_date", start_date_sql).replace("@end_date", end_date_sql)
-        
-        # Supprimer les commandes SET du début de la requête car elles ne sont plus nécessaires
-        select_query = select_query.split("SELECT", 1)[1]
-        select_query = "SELECT" + select_query
+        sql_query, params = prepare_sql(sql_query, start_date=start_date, end_date=end_date)
         
-        df_result = pd.read_sql_query(select_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -234,12 +212,8 @@ def get_club_session_data(start_date, end_date, db_config):
     :return: DataFrame pandas des résultats.
     """
     
-    # Sécuriser les dates
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Requête SQL pour les sessions de club
-    sql_query = f"""
+    sql_query, params = prepare_sql("""
     SELECT 
         p.patient_code,
         ti.first_name, 
@@ -254,24 +228,14 @@ def get_club_session_data(start_date, end_date, db_config):
         INNER JOIN patient p ON p.id = s.id_patient
         LEFT JOIN lookup_club_type lt ON lt.id = c.club_type
     WHERE 
-        (cs.date BETWEEN {start_date_sql} AND {end_date_sql}) 
+        (cs.date BETWEEN :start_date AND :end_date) 
         AND (c.club_type != 1)
     GROUP BY s.id_patient
-    """
+    """, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -294,10 +258,6 @@ def get_woman_child_pcr(start_date, end_date, db_config, sql_script=None):
         pandas.DataFrame: DataFrame contenant les données des tests PCR
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les tests PCR
     default_sql = """
     WITH ranked AS (
@@ -308,7 +268,7 @@ def get_woman_child_pcr(start_date, end_date, db_config, sql_script=None):
               ORDER BY ts.date_blood_taken DESC, ts.id DESC
           ) AS rn
       FROM testing_specimen ts
-      WHERE ts.date_blood_taken > {start_date}
+      WHERE ts.date_blood_taken > :start_date
     )
     
     SELECT 
@@ -342,12 +302,12 @@ def get_woman_child_pcr(start_date, end_date, db_config, sql_script=None):
         ON lts.id = ts.pcr_result
     WHERE 
         ts.rn = 1
-        AND ts.date_blood_taken > {start_date}
+        AND ts.date_blood_taken > :start_date
         AND tc.id_patient_mother IS NOT NULL
         AND tp.actual_delivery_date IS NOT NULL
         AND tp.actual_delivery_date != '0000-00-00'
-        AND tp.actual_delivery_date > {start_date}
-        AND tp.actual_delivery_date < {end_date}
+        AND tp.actual_delivery_date > :start_date
+        AND tp.actual_delivery_date < :end_date
     GROUP BY 
         ts.id_patient,
         mp.patient_code,
@@ -366,21 +326,11 @@ def get_woman_child_pcr(start_date, end_date, db_config, sql_script=None):
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -403,10 +353,6 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
         pandas.DataFrame: DataFrame contenant les données d'analyse des spécimens PCR
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour l'analyse des spécimens PCR
     default_sql = """
     WITH base AS (
@@ -422,7 +368,7 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
         TIMESTAMPDIFF(MONTH, date_of_birth, date_blood_taken) AS age_month
       FROM testing_specimen
       WHERE
-        date_blood_taken BETWEEN {start_date} AND {end_date}
+        date_blood_taken BETWEEN :start_date AND :end_date
         AND which_pcr = 1
     )
     SELECT
@@ -437,7 +383,7 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
 
       /* 1) résultat dans l'intervalle calendrier */
       CASE
-        WHEN b.pcr_result_date BETWEEN {start_date} AND {end_date} THEN 'yes'
+        WHEN b.pcr_result_date BETWEEN :start_date AND :end_date THEN 'yes'
         ELSE 'no'
       END AS result_in_the_interval,
 
@@ -469,21 +415,11 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -506,10 +442,6 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
         pandas.DataFrame: DataFrame contenant les données des tests PCR avec liaison mère-enfant
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les tests PCR avec liaison mère-enfant
     default_sql = """
     WITH ranked AS (
@@ -520,7 +452,7 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
               ORDER BY ts.date_blood_taken DESC, ts.id DESC
           ) AS rn
       FROM testing_specimen ts
-      WHERE ts.date_blood_taken > {start_date}
+      WHERE ts.date_blood_taken > :start_date
     )
 
     SELECT 
@@ -554,12 +486,12 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
         ON lts.id = ts.pcr_result
     WHERE 
         ts.rn = 1
-        AND ts.date_blood_taken > {start_date}
+        AND ts.date_blood_taken > :start_date
         AND tc.id_patient_mother IS NOT NULL
         AND tp.actual_delivery_date IS NOT NULL
         AND tp.actual_delivery_date != '0000-00-00'
-        AND tp.actual_delivery_date > {start_date}
-        AND tp.actual_delivery_date < {end_date}
+        AND tp.actual_delivery_date > :start_date
+        AND tp.actual_delivery_date < :end_date
     GROUP BY 
         ts.id_patient,
         mp.patient_code,
@@ -578,21 +510,11 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -615,10 +537,6 @@ def get_club_attendance_data(start_date, end_date, db_config, sql_script=None):
         pandas.DataFrame: DataFrame contenant les données de présence aux clubs avec agrégations mensuelles
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les données de présence aux clubs
     default_sql = """
     SELECT 
@@ -712,7 +630,7 @@ def get_club_attendance_data(start_date, end_date, db_config, sql_script=None):
             GROUP BY cs3.id_club, s3.id_patient
         ) aa ON aa.id_patient = ss.id_patient AND c.id = aa.id_club
         WHERE 
-            cs.date BETWEEN {start_date} AND {end_date}
+            cs.date BETWEEN :start_date AND :end_date
             AND p.id IS NOT NULL
         ORDER BY 
             CONCAT(lh.city_code, '/', lh.hospital_code), 
@@ -726,21 +644,11 @@ def get_club_attendance_data(start_date, end_date, db_config, sql_script=None):
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -749,7 +657,33 @@ def get_club_attendance_data(start_date, end_date, db_config, sql_script=None):
         return pd.DataFrame()
 
 #==========================================================================================================
-def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
+# Schéma déclaré des sessions détaillées (lecture en streaming, utils.apply_sql_schema)
+CLUB_SESSIONS_SCHEMA = {
+    "id_patient": "int",
+    "session_date_presence": "date",
+    "first_attendance_date": "date",
+    "last_attendance_date": "date",
+    "first_attendance_date_by_club": "date",
+    "dob": "date",
+    "graduation_date": "date",
+    "hopital": "category",
+    "site_code": "category",
+    "club_name": "category",
+    "club_type": "category",
+    "topic": "category",
+    "graduation": "category",
+    "sex": "category",
+    "raison_absence": "category",
+    "is_abandoned": "int8",
+    "is_dead": "int8",
+    "clore": "int8",
+    "is_patient_tb": "int8",
+    "is_patient_on_pf": "int8",
+    "present": "int8",
+}
+
+
+def get_club_sessions_data(start_date, end_date, db_config, sql_script=None, parquet_dir=None):
     """
     Récupère les données détaillées des sessions de club avec informations de présence et raisons d'absence.
     
@@ -758,15 +692,15 @@ def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
         end_date (str): Date de fin au format 'YYYY-MM-DD'  
         db_config (dict): Configuration de la base de données
         sql_script (str, optional): Script SQL personnalisé. Si fourni, remplace le script par défaut.
+        parquet_dir (str, optional): Si fourni, le résultat est lu en streaming (curseur serveur,
+            morceaux de utils.SQL_CHUNK_SIZE lignes typés par CLUB_SESSIONS_SCHEMA) et écrit
+            directement dans ce dataset Parquet ; la mémoire reste bornée par un morceau.
     
     Returns:
         pandas.DataFrame: DataFrame contenant les données détaillées des sessions de club
+        (int : nombre de lignes écrites si parquet_dir est fourni)
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les sessions de club détaillées
     default_sql = """
     SELECT
@@ -839,27 +773,20 @@ def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
     WHERE
         ss.is_present IS NOT NULL AND
         p.id IS NOT NULL AND
-        cs.date BETWEEN {start_date} AND {end_date}
+        cs.date BETWEEN :start_date AND :end_date
     ORDER BY CONCAT(lh.city_code, '/', lh.hospital_code) , c.name , p.patient_code , cs.date
     LIMIT 100000000
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        if parquet_dir is not None:
+            return stream_query_to_parquet(sql_query, parquet_dir, CLUB_SESSIONS_SCHEMA, db_config=db_config, params=params)
+
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -882,8 +809,44 @@ db_config_example = {
 date_debut = '2025-05-01'
 date_fin = '2025-12-06'
 
+# Définition des dates pour les sessions de club
+date_debut_club = '2025-11-01'
+date_fin_club = '2025-11-30'
+
+# Définition des dates pour les tests PCR
+date_debut_pcr = '2025-05-01'
+date_fin_pcr = '2025-12-06'
+
+# Définition des dates pour les données de présence
+date_debut_attendance = '2025-11-01'
+date_fin_attendance = '2025-12-06'
+
+# Définition des dates pour les sessions détaillées
+date_debut_detailed = '2025-05-01'
+date_fin_detailed = '2025-12-06'
+
+# Définition des dates pour l'analyse des spécimens PCR
+date_debut_specimens = '2025-11-01'
+date_fin_specimens = '2025-12-06'
+
+# Définition des dates pour les données PCR mère-enfant
+date_debut_mother_child = '2025-05-01'
+date_fin_mother_child = '2025-12-06'
+
+# Les extraits par défaut sont indépendants : ils partent ensemble sur le pool de
+# connexions partagé (utils.run_extracts), chaque exemple ci-dessous lit son résultat.
+executor_extracts, executor_timings = run_extracts({
+    "pregnancy_data": lambda: get_pregnancy_data(date_debut, date_fin, db_config_example),
+    "club_session_data": lambda: get_club_session_data(date_debut_club, date_fin_club, db_config_example),
+    "pcr_test_data": lambda: get_woman_child_pcr(date_debut_pcr, date_fin_pcr, db_config_example),
+    "club_attendance_data": lambda: get_club_attendance_data(date_debut_attendance, date_fin_attendance, db_config_example),
+    "club_sessions_detailed": lambda: get_club_sessions_data(date_debut_detailed, date_fin_detailed, db_config_example),
+    "pcr_specimens_analysis": lambda: get_pcr_analysis(date_debut_specimens, date_fin_specimens, db_config_example),
+    "mother_child_linked_pcr": lambda: get_mother_child_linked_pcr(date_debut_mother_child, date_fin_mother_child, db_config_example),
+})
+
 # Exécution et récupération du DataFrame (sans script personnalisé - utilise le script par défaut)
-df_data = get_pregnancy_data(date_debut, date_fin, db_config_example)
+df_data = executor_extracts["pregnancy_data"]
 
 if not df_data.empty:
     print(f"\nDataFrame récupéré avec {len(df_data)} lignes et {len(df_data.columns)} colonnes.")
@@ -892,12 +855,8 @@ if not df_data.empty:
 
 # --- 4. Exemple d'utilisation pour les sessions de club ---
 
-# Définition des dates pour les sessions de club
-date_debut_club = '2025-11-01'
-date_fin_club = '2025-11-30'
-
 # Exécution et récupération du DataFrame des sessions de club
-df_club_data = get_club_session_data(date_debut_club, date_fin_club, db_config_example)
+df_club_data = executor_extracts["club_session_data"]
 
 if not df_club_data.empty:
     print(f"\nDataFrame des sessions de club récupéré avec {len(df_club_data)} lignes et {len(df_club_data.columns)} colonnes.")
@@ -908,13 +867,9 @@ else:
 
 # --- 5. Exemple d'utilisation pour les tests PCR ---
 
-# Définition des dates pour les tests PCR
-date_debut_pcr = '2025-05-01'
-date_fin_pcr = '2025-12-06'
-
 # Exécution et récupération du DataFrame des tests PCR
 print("\n--- Test avec données PCR par défaut ---")
-df_pcr_data = get_woman_child_pcr(date_debut_pcr, date_fin_pcr, db_config_example)
+df_pcr_data = executor_extracts["pcr_test_data"]
 
 if not df_pcr_data.empty:
     print(f"\nDataFrame des tests PCR récupéré avec {len(df_pcr_data)} lignes et {len(df_pcr_data.columns)} colonnes.")
@@ -1035,13 +990,9 @@ else:
 
 # --- 8. Exemple d'utilisation pour les données de présence aux clubs ---
 
-# Définition des dates pour les données de présence
-date_debut_attendance = '2025-11-01'
-date_fin_attendance = '2025-12-06'
-
 # Exécution et récupération du DataFrame des données de présence
 print("\n--- Test avec données de présence aux clubs ---")
-df_attendance_data = get_club_attendance_data(date_debut_attendance, date_fin_attendance, db_config_example)
+df_attendance_data = executor_extracts["club_attendance_data"]
 
 if not df_attendance_data.empty:
     print(f"\nDataFrame des présences aux clubs récupéré avec {len(df_attendance_data)} lignes et {len(df_attendance_data.columns)} colonnes.")
@@ -1097,13 +1048,9 @@ else:
 
 # --- 10. Exemple d'utilisation pour les sessions de club détaillées ---
 
-# Définition des dates pour les sessions détaillées
-date_debut_detailed = '2025-05-01'
-date_fin_detailed = '2025-12-06'
-
 # Exécution et récupération du DataFrame des sessions détaillées
 print("\n--- Test avec données de sessions de club détaillées ---")
-df_detailed_sessions = get_club_sessions_data(date_debut_detailed, date_fin_detailed, db_config_example)
+df_detailed_sessions = executor_extracts["club_sessions_detailed"]
 
 if not df_detailed_sessions.empty:
     print(f"\nDataFrame des sessions détaillées récupéré avec {len(df_detailed_sessions)} lignes et {len(df_detailed_sessions.columns)} colonnes.")
@@ -1113,6 +1060,21 @@ if not df_detailed_sessions.empty:
 else:
     print("Aucune donnée de session détaillée trouvée pour la période spécifiée.")
 
+# --- 10b. Historique pluriannuel des sessions détaillées en streaming ---
+
+# Écrit directement en dataset Parquet typé, sans charger tout l'historique en mémoire.
+# Extraction de plusieurs années : seulement sur demande (EXECUTOR_SESSIONS_HISTORY=1),
+# vers un dossier ignoré par Git (pas sous outputs/, committé par l'automatisation)
+SESSIONS_HISTORY = os.getenv("EXECUTOR_SESSIONS_HISTORY", "0") in {"1", "true", "yes"}
+SESSIONS_HISTORY_DIR = os.getenv("EXECUTOR_SESSIONS_HISTORY_DIR",
+                                 os.path.join("data", ".sql_store", "club_sessions_history"))
+if SESSIONS_HISTORY:
+    print("\n--- Historique des sessions détaillées (streaming Parquet) ---")
+    n_history = get_club_sessions_data('2020-01-01', date_fin_detailed, db_config_example,
+                                       parquet_dir=SESSIONS_HISTORY_DIR)
+else:
+    print("\n--- Historique des sessions détaillées ignoré (EXECUTOR_SESSIONS_HISTORY=1 pour l'extraire) ---")
+
 # --- 11. Test avec script de sessions détaillées personnalisé ---
 
 # Script personnalisé simplifié pour tester les sessions détaillées
@@ -1155,13 +1117,9 @@ else:
 
 # --- 12. Exemple d'utilisation pour l'analyse des spécimens PCR ---
 
-# Définition des dates pour l'analyse des spécimens PCR
-date_debut_specimens = '2025-11-01'
-date_fin_specimens = '2025-12-06'
-
 # Exécution et récupération du DataFrame des spécimens PCR
 print("\n--- Test avec données d'analyse des spécimens PCR ---")
-df_pcr_specimens = get_pcr_analysis(date_debut_specimens, date_fin_specimens, db_config_example)
+df_pcr_specimens = executor_extracts["pcr_specimens_analysis"]
 
 if not df_pcr_specimens.empty:
     print(f"\nDataFrame des spécimens PCR récupéré avec {len(df_pcr_specimens)} lignes et {len(df_pcr_specimens.columns)} colonnes.")
@@ -1173,13 +1131,9 @@ else:
 
 # --- 13. Exemple d'utilisation pour les données PCR mère-enfant liées ---
 
-# Définition des dates pour les données PCR mère-enfant
-date_debut_mother_child = '2025-05-01'
-date_fin_mother_child = '2025-12-06'
-
 # Exécution et récupération du DataFrame des PCR mère-enfant
 print("\n--- Test avec données PCR mère-enfant liées ---")
-df_mother_child_pcr = get_mother_child_linked_pcr(date_debut_mother_child, date_fin_mother_child, db_config_example)
+df_mother_child_pcr = executor_extracts["mother_child_linked_pcr"]
 
 if not df_mother_child_pcr.empty:
     print(f"\nDataFrame des PCR mère-enfant récupéré avec {len(df_mother_child_pcr)} lignes et {len(df_mother_child_pcr.columns)} colonnes.")
@@ -4,6 +4,7 @@
 import pandas as pd
 import os
 from datetime import datetime
+from utils import read_excel_snapshot
 
 def main():
     # Obtenir le dossier du script et remonter à la racine du projet
@@ -20,7 +21,7 @@ def main():
         return
 
     # Étape 3 : Lecture du fichier Garden
-    df = pd.read_excel(garden_path)
+    df = read_excel_snapshot(garden_path)
 
     # Étape 4 : Renommer la colonne info.owner_name en username
     if 'info.owner_name' in df.columns:
@@ -35,7 +35,8 @@ from dotenv import load_dotenv
 
 # Import functions
 try:
-    from utils import get_commcare_odata
+    from utils import (get_commcare_odata, read_excel_snapshot, update_identity_index,
+                       confirm_duplicate_pairs, duplicate_pairs_from_list)
     from caris_fonctions import execute_sql_query
 except ImportError as e:
     print(f"Warning: Could not import some functions: {e}")
@@ -57,24 +58,20 @@ def main():
         today_str = datetime.today().strftime('%Y-%m-%d')
         
         # Chargement des fichiers Excel
-        muso_group = pd.read_excel(
-            f"~/Downloads/caris-dashboard-app/data/muso_groupes (created 2025-03-25) {today_str}.xlsx", 
-            parse_dates=True
+        muso_group = read_excel_snapshot(
+            f"~/Downloads/caris-dashboard-app/data/muso_groupes (created 2025-03-25) {today_str}.xlsx"
         )
         
-        muso_ben = pd.read_excel(
-            f"~/Downloads/caris-dashboard-app/data/muso_beneficiaries (created 2025-03-25) {today_str}.xlsx", 
-            parse_dates=True
+        muso_ben = read_excel_snapshot(
+            f"~/Downloads/caris-dashboard-app/data/muso_beneficiaries (created 2025-03-25) {today_str}.xlsx"
         )
         
-        muso_household = pd.read_excel(
-            f"~/Downloads/caris-dashboard-app/data/muso_household_2022 (created 2025-03-25) {today_str}.xlsx", 
-            parse_dates=True
+        muso_household = read_excel_snapshot(
+            f"~/Downloads/caris-dashboard-app/data/muso_household_2022 (created 2025-03-25) {today_str}.xlsx"
         )
         
-        muso_ppi = pd.read_excel(
-            f"~/Downloads/caris-dashboard-app/data/MUSO - Members - PPI Questionnaires (created 2025-04-23) {today_str}.xlsx", 
-            parse_dates=True
+        muso_ppi = read_excel_snapshot(
+            f"~/Downloads/caris-dashboard-app/data/MUSO - Members - PPI Questionnaires (created 2025-04-23) {today_str}.xlsx"
         )
         
         muso_actif = pd.read_excel("input/group_muso_actif.xlsx", parse_dates=True)
@@ -246,6 +243,9 @@ def main():
         muso_ben_actif = muso_ben_actif[columns_existantes]
         print(f"Colonnes bénéficiaires conservées: {len(columns_existantes)}/{len(columns)}")
         
+        # Bénéficiaires avant exclusion des doublons connus (base de l'index d'identité)
+        muso_ben_candidats = muso_ben_actif[muso_ben_actif["caseid"].notna()].copy() if "caseid" in muso_ben_actif.columns else muso_ben_actif.copy()
+
         # 4. LECTURE ET MERGE AVEC LISTE_MUSO
         print("\n3. LECTURE ET MERGE AVEC LISTE_MUSO")
         
@@ -340,6 +340,29 @@ def main():
             liste_muso = None
             doublon = None
         
+        # DOUBLONS PROBABLES : index d'identité incrémental (seuls les caseid nouveaux ou
+        # modifiés depuis la dernière exécution sont comparés ; les doublons déjà listés
+        # dans la feuille « doublons » sont enregistrés comme paires confirmées)
+        doublons_probables = None
+        name_cols = [c for c in ("first_name", "last_name") if c in muso_ben_candidats.columns]
+        if name_cols and "caseid_group" in muso_ben_candidats.columns:
+            try:
+                if doublon is not None and "caseid" in doublon.columns:
+                    confirm_duplicate_pairs(
+                        "muso_beneficiaries",
+                        duplicate_pairs_from_list(muso_ben_candidats, doublon["caseid"], name_cols + ["caseid_group"])
+                    )
+                doublons_probables = update_identity_index(
+                    muso_ben_candidats, "muso_beneficiaries", colonnes=name_cols,
+                    key_col="caseid", threshold=95, block_on=["caseid_group"]
+                )
+                if doublon is not None and "caseid" in doublon.columns:
+                    doublons_probables["deja_identifie"] = doublons_probables["caseid"].astype(str).isin(doublon["caseid"].astype(str))
+                print(f"Doublons probables (index d'identité): {doublons_probables.shape[0]} lignes")
+            except Exception as e:
+                print(f"Erreur lors de la mise à jour de l'index d'identité: {e}")
+                doublons_probables = None
+
         # VÉRIFICATION FINALE DES COLONNES REQUISES
         required_final_cols = ['caseid_group', 'officer_fullname', 'officer_name', 'caseid']
         missing_final = [col for col in required_final_cols if col not in muso_ben_actif.columns]
@@ -436,6 +459,11 @@ def main():
                 # Optionnel: sauvegarder les doublons identifiés
                 doublon.to_excel(os.path.join(output_dir, "doublons_identifies.xlsx"), index=False)
                 print(f"✓ Fichier doublons_identifies.xlsx créé")
+
+            if doublons_probables is not None:
+                # À revoir : les nouveaux doublons confirmés s'ajoutent à la feuille « doublons »
+                doublons_probables.to_excel(os.path.join(output_dir, "doublons_probables.xlsx"), index=False)
+                print(f"✓ Fichier doublons_probables.xlsx créé")
                 
         except Exception as e:
             print(f"Erreur lors de la sauvegarde: {e}")
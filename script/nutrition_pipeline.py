@@ -46,7 +46,7 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', 'data'))
 #=========================================================================================================
 # Functions modules
-from utils import is_screened_in_period,today_str,detect_duplicates_with_groups,load_excel_to_df,extraire_data, age_range,get_age_in_year, get_age_in_months, clean_column_names,creer_colonne_match_conditional,combine_columns, commcare_match_person
+from utils import is_screened_in_period,today_str,detect_duplicates_with_groups,load_excel_to_df,read_excel_snapshot,extraire_data, age_range,get_age_in_year, get_age_in_months, clean_column_names,creer_colonne_match_conditional,combine_columns, commcare_match_person
 #=========================================================================================================
 # PIPE-FRIENDLY WRAPPER FUNCTIONS
 #=========================================================================================================
@@ -108,7 +108,9 @@ def load_excel_pipe(filename, usecols=None, parse_dates=True, **kwargs):
     # If filename is not absolute, join with DATA_DIR
     if not os.path.isabs(filename):
         filename = os.path.join(DATA_DIR, filename)
-    return pd.read_excel(filename, usecols=usecols, parse_dates=parse_dates, **kwargs)
+    if kwargs:
+        return pd.read_excel(filename, usecols=usecols, parse_dates=parse_dates, **kwargs)
+    return read_excel_snapshot(filename, columns=usecols)
 
 def convert_datetime_column(df, column_name, errors='coerce', format=None):
     """Convertit une colonne en datetime de manière pipe-friendly"""
@@ -648,6 +650,54 @@ def create_smart_aggregation_dict(df, group_col='caseid'):
     return agg_dict
 
 
+#=========================================================================================================
+# CUBE MULTI-PÉRIODES (consommé par le dashboard Streamlit)
+#=========================================================================================================
+CUBE_DIMS = ["day", "office", "commune", "age_range", "manutrition_type", "enrrolled_where"]
+CUBE_MEASURES = ["depistages", "eligibles", "enrolled", "enrolled_actifs", "enrolled_exeats",
+                 "menages", "benef_indirects"]
+
+
+def _cube_facts(df, date_col, measures):
+    """Lignes de faits (dimensions + mesures 0/1) à partir d'un DataFrame ligne à ligne."""
+    facts = pd.DataFrame({"day": pd.to_datetime(df[date_col], errors="coerce").dt.normalize()})
+    for dim in CUBE_DIMS[1:]:
+        facts[dim] = df[dim].astype("string").fillna("---") if dim in df.columns else "---"
+    for m in CUBE_MEASURES:
+        facts[m] = measures.get(m, 0)
+    return facts.dropna(subset=["day"])
+
+
+def build_nutrition_cube(depistage_df, enrolled_df, filename=None):
+    """
+    Construit le cube agrégé (jour x office x commune x age_range x manutrition_type
+    x enrrolled_where) avec des mesures additives, sauvegardé une fois par exécution.
+    Le dashboard répond aux KPIs, tendances et ventilations par bureau et par âge en le découpant.
+    """
+    dep = _cube_facts(depistage_df, "date_de_depistage", {
+        "depistages": 1,
+        "eligibles": (depistage_df["eligible"] == "yes").astype(int).to_numpy() if "eligible" in depistage_df.columns else 0,
+    })
+    enr = _cube_facts(enrolled_df, "date_enrollement", {
+        "enrolled": 1,
+        "enrolled_actifs": (enrolled_df["actif"] == "yes").astype(int).to_numpy() if "actif" in enrolled_df.columns else 0,
+        "enrolled_exeats": (enrolled_df["actif"] == "no").astype(int).to_numpy() if "actif" in enrolled_df.columns else 0,
+        "menages": (enrolled_df["has_household"] == "yes").astype(int).to_numpy() if "has_household" in enrolled_df.columns else 0,
+        "benef_indirects": pd.to_numeric(enrolled_df["household_number"], errors="coerce").fillna(0).to_numpy()
+                           if "household_number" in enrolled_df.columns else 0,
+    })
+    cube = (
+        pd.concat([dep, enr], ignore_index=True)
+        .groupby(CUBE_DIMS, as_index=False, observed=True)[CUBE_MEASURES].sum()
+        .sort_values(CUBE_DIMS)
+        .reset_index(drop=True)
+    )
+    if filename:
+        cube.to_parquet(filename, index=False)
+        print(f"✅ Cube nutrition: {len(cube)} cellules ({len(dep)} dépistages, {len(enr)} enrôlés) → {filename}")
+    return cube
+
+
 # Cette ligne est maintenant inutile car le filtrage est déjà fait dans la fonction
 # condition_avant_septembre = condition_avant_septembre[condition_user_mamba]
 #=========================================================================================================
@@ -701,7 +751,7 @@ print(f"Le fichier existe-t-il? {os.path.exists(depistage_file)}")
 # If depistage_file is not absolute, join with DATA_DIR
 file_path = depistage_file if os.path.isabs(depistage_file) else os.path.join(DATA_DIR, depistage_file)
 depistage = (
-    pd.read_excel(file_path, parse_dates=True)
+    read_excel_snapshot(file_path)
     .pipe(select_columns, dep_col)
     .pipe(print_shape, "dépistage télechargés avec succes")
     .pipe(rename_cols, {'form.case.@case_id': 'caseid','form.depistage.date_de_visite':'date_de_depistage'})
@@ -905,7 +955,7 @@ end_date_nut = pd.Timestamp(datetime.today().date())
 #==========================================================================================================
 # Pipeline d'enrôlement avec .pipe()
 nut_filtered = (
-    pd.read_excel(os.path.join(DATA_DIR, f"Nutrition (created 2025-04-25) {today_str}.xlsx"), engine="openpyxl")
+    read_excel_snapshot(os.path.join(DATA_DIR, f"Nutrition (created 2025-04-25) {today_str}.xlsx"))
     .pipe(select_columns, enroled_col)
     .pipe(convert_datetime_column, "last_mamba_date", errors='coerce')
     .pipe(print_shape, "Fichier enrollement Télechargé avec succès")
@@ -1166,6 +1216,8 @@ save_to_excel(
     index=False
 )
 
+build_nutrition_cube(depistage_filtered, enroled, os.path.join(output_dir, "nutrition_cube.parquet"))
+
 print("=== LES ELIGIBLES EN ATTENTE ===")
 # Filtrer les éligibles en attente
 eligibles = depistage_filtered[depistage_filtered['eligible'] == 'yes']
@@ -3,6 +3,7 @@ import os
 import re
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from dateutil.parser import parse
@@ -17,7 +18,6 @@ import plotly.graph_objects as go
 import openpyxl
 import xlsxwriter
 import pymysql
-from sqlalchemy import create_engine
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -26,7 +26,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 # import functions
-from utils import get_commcare_odata
+from utils import read_excel_snapshot, sync_commcare_odata
 # Download charges virales database from "Charges_virales_pediatriques.sql file"
 from caris_fonctions import execute_sql_query
 
@@ -97,7 +97,7 @@ def main():
     # Utiliser une structure flexible :
     base_path = os.path.join("data")
     path = os.path.join(base_path, f"All_child_PatientCode_CaseID {today_str}.xlsx")
-    caseid = pd.read_excel(os.path.expanduser(path))
+    caseid = read_excel_snapshot(path)
 
     # Étape 3 : Charger la base de données charges virales
     oev_data = execute_sql_query(os.path.join('variables', 'dot.env'), os.path.join('sql', 'Charges_virales_pediatriques.sql'))
@@ -139,13 +139,14 @@ def main():
     child_url = 'https://www.commcarehq.org/a/caris-test/api/odata/cases/v1/41b99d862f48b671c2b2880b6e2c74cb/feed'
     hh_child_url ='https://www.commcarehq.org/a/caris-test/api/odata/cases/v1/e7c7fb14a8fd38961090d420c3fb64c2/feed'
     auth = (os.getenv('CC_USERNAME'), os.getenv('CC_PASSWORD'))
-    params = {}
-    # Lire le fichier avec pd.read_excel
 
-    # Extraction depuis CommCare OData
-    ajout = pd.DataFrame(get_commcare_odata(ajout_url, auth, params))
-    child = pd.DataFrame(get_commcare_odata(child_url, auth, params))
-    hh_child = pd.DataFrame(get_commcare_odata(hh_child_url, auth, params))
+    # Extraction depuis CommCare OData (incrémentale : seules les lignes modifiées sont téléchargées)
+    # Les trois flux sont indépendants : on les récupère en parallèle
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        ajout_future = pool.submit(sync_commcare_odata, "oev_ajout", ajout_url, auth, key_col='formid', watermark_col='received_on')
+        child_future = pool.submit(sync_commcare_odata, "oev_child", child_url, auth, key_col='caseid', watermark_col='last_modified_date')
+        hh_child_future = pool.submit(sync_commcare_odata, "oev_hh_child", hh_child_url, auth, key_col='caseid', watermark_col='last_modified_date')
+        ajout, child, hh_child = ajout_future.result(), child_future.result(), hh_child_future.result()
 
     # Nettoyage des colonnes
     ajout.columns = ajout.columns.str.replace(' ', '_').str.replace('form_', '', regex=False)
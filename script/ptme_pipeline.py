@@ -1,4 +1,3 @@
-import requests
 # Standard library imports
 import os
 import re
@@ -18,7 +17,6 @@ import plotly.graph_objects as go
 import openpyxl
 import xlsxwriter
 import pymysql
-from sqlalchemy import create_engine
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -27,7 +25,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 # import functions
-from utils import execute_sql_query,creer_colonne_match_conditional
+from utils import execute_sql_query,creer_colonne_match_conditional,run_query,run_extracts,sync_sql_window,fetch_text_cached,prepare_sql
 # Download charges virales database from "Charges_virales_pediatriques.sql file"
 #from caris_fonctions import execute_sql_query
 #from ptme_fonction import creer_colonne_match_conditional
@@ -47,16 +45,13 @@ os.makedirs('outputs/PTME', exist_ok=True)
 print("\n\n=== DATABASE DES FEMMES ENCEINTES ===")
 #===============================================================================
 def fetch_sql_from_gist(url, token=None):
+    # revalidation ETag : le SQL n'est re-téléchargé que s'il a changé (utils.fetch_text_cached)
     headers = {"Authorization": f"token {token}"} if token else {}
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    return r.text
+    return fetch_text_cached(url, headers)
 
 def run_query_from_gist(url, db_uri, token=None):
     sql = fetch_sql_from_gist(url, token)
-    engine = create_engine(db_uri)
-    df = pd.read_sql(sql, engine)
-    return df
+    return run_query(sql, db_uri=db_uri)
 
 gist_sql_url = "https://gist.githubusercontent.com/MMasson1988/cd22e60e69527b34ded0dd2631cd5975/raw"
 token = None  # Pas besoin de token pour un gist public
@@ -71,27 +66,11 @@ db_uri = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}/{mysql_db}
 
 print(f"Connexion à la base : {mysql_user}@{mysql_host}/{mysql_db}")
 
-# Exécuter la requête
-try:
-    df = run_query_from_gist(gist_sql_url, db_uri, token)
-    print(f"Requête exécutée avec succès!")
-    print(f"Nombre de lignes récupérées : {len(df)}")
-    print("\nPremières lignes :")
-    print(df.head())
-    
-    # Sauvegarder les résultats
-    output_file = "outputs/PTME/pregnancy_tracking.xlsx"
-    df.to_excel(output_file, index=False)
-    print(f"\nRésultats sauvegardés dans {output_file}")
-    
-except Exception as e:
-    print(f"Erreur lors de l'exécution : {e}")
-    
 
 #===============================================================================
 print("\n\n=== DATABASE DES SESSIONS DES CLUBS ===")
 #===============================================================================
-def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
+def get_club_sessions_data(start_date, end_date, db_config, sql_script=None, raise_errors=False):
     """
     Récupère les données détaillées des sessions de club avec informations de présence et raisons d'absence.
     
@@ -100,15 +79,13 @@ def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
         end_date (str): Date de fin au format 'YYYY-MM-DD'  
         db_config (dict): Configuration de la base de données
         sql_script (str, optional): Script SQL personnalisé. Si fourni, remplace le script par défaut.
+        raise_errors (bool): propage les erreurs au lieu de renvoyer un DataFrame vide
+            (extraction incrémentale : une erreur ne doit pas passer pour une fenêtre vide)
     
     Returns:
         pandas.DataFrame: DataFrame contenant les données détaillées des sessions de club
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les sessions de club détaillées
     default_sql = """
     SELECT
@@ -182,31 +159,23 @@ def get_club_sessions_data(start_date, end_date, db_config, sql_script=None):
     WHERE
         ss.is_present IS NOT NULL AND
         p.id IS NOT NULL AND
-        cs.date BETWEEN {start_date} AND {end_date}
+        cs.date BETWEEN :start_date AND :end_date
     ORDER BY CONCAT(lh.city_code, '/', lh.hospital_code) , c.name , p.patient_code , cs.date
     LIMIT 100000000
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params, cache_ttl=0)
         
         return df_result
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Une erreur inattendue s'est produite : {e}")
         return pd.DataFrame()
     
@@ -224,18 +193,6 @@ date_fin = datetime.now().strftime('%Y-%m-%d')
 # For consistent testing, we can set a fixed end date
 #date_fin = '2025-12-06'
 
-# Exécution et récupération du DataFrame des sessions détaillées
-print("\n--- Test avec données de sessions de club détaillées ---")
-df_detailed_sessions = get_club_sessions_data(start_date='2025-01-01', end_date=date_fin, db_config=db_config_example)
-
-if not df_detailed_sessions.empty:
-    print(f"\nDataFrame des sessions détaillées récupéré avec {len(df_detailed_sessions)} lignes et {len(df_detailed_sessions.columns)} colonnes.")
-    print("Colonnes disponibles:", list(df_detailed_sessions.columns))
-    print(df_detailed_sessions.head())
-    df_detailed_sessions.to_excel('./outputs/PTME/club_sessions_detailed.xlsx', index=False)
-else:
-    print("Aucune donnée de session détaillée trouvée pour la période spécifiée.")
-
 #===============================================================================
 print("\n\n=== PCR DATABASE ANALYSIS ===")
 #===============================================================================
@@ -253,10 +210,6 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
         pandas.DataFrame: DataFrame contenant les données d'analyse des spécimens PCR
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour l'analyse des spécimens PCR
     default_sql = """
     WITH base AS (
@@ -272,7 +225,7 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
         TIMESTAMPDIFF(MONTH, date_of_birth, date_blood_taken) AS age_month
       FROM testing_specimen
       WHERE
-        date_blood_taken BETWEEN {start_date} AND {end_date}
+        date_blood_taken BETWEEN :start_date AND :end_date
         AND which_pcr = 1
     )
     SELECT
@@ -287,7 +240,7 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
 
       /* 1) résultat dans l'intervalle calendrier */
       CASE
-        WHEN b.pcr_result_date BETWEEN {start_date} AND {end_date} THEN 'yes'
+        WHEN b.pcr_result_date BETWEEN :start_date AND :end_date THEN 'yes'
         ELSE 'no'
       END AS result_in_the_interval,
 
@@ -319,21 +272,11 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -345,21 +288,10 @@ def get_pcr_analysis(start_date, end_date, db_config, sql_script=None):
 #date_fin_pcr = datetime.now().strftime('%Y-%m-%d')
 # Pour des tests cohérents, on peut fixer une date de fin
 #date_fin_pcr = '2025-12-06'
-# Exécution et récupération du DataFrame des spécimens PCR
-print("\n--- Test avec données d'analyse des spécimens PCR ---")
-df_pcr_specimens = get_pcr_analysis(date_debut, date_fin, db_config_example)
-
-if not df_pcr_specimens.empty:
-    print(f"\nDataFrame des spécimens PCR récupéré avec {len(df_pcr_specimens)} lignes et {len(df_pcr_specimens.columns)} colonnes.")
-    print("Colonnes disponibles:", list(df_pcr_specimens.columns))
-    print(df_pcr_specimens.head())
-    df_pcr_specimens.to_excel('./outputs/PTME/pcr_analysis.xlsx', index=False)
-else:
-    print("Aucune donnée d'analyse PCR trouvée pour la période spécifiée.")
 #=======================================================================================
 print("\n\n=== MOTHER LINKED TO CHILD DATABASE ANALYSIS ===")
 #=======================================================================================
-def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None):
+def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None, window_start=None, raise_errors=False):
     """
     Récupère les données des tests PCR avec liaison mère-enfant détaillée.
     
@@ -368,15 +300,14 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
         end_date (str): Date de fin au format 'YYYY-MM-DD'  
         db_config (dict): Configuration de la base de données
         sql_script (str, optional): Script SQL personnalisé. Si fourni, remplace le script par défaut.
+        window_start (str, optional): borne basse des prélèvements (date_blood_taken > window_start)
+            pour l'extraction incrémentale ; les accouchements restent filtrés sur start_date.
+        raise_errors (bool): propage les erreurs au lieu de renvoyer un DataFrame vide
     
     Returns:
         pandas.DataFrame: DataFrame contenant les données des tests PCR avec liaison mère-enfant
     """
     
-    # Sécuriser les dates pour l'insertion SQL
-    start_date_sql = f"'{start_date}'"
-    end_date_sql = f"'{end_date}'"
-    
     # Script SQL par défaut pour les tests PCR avec liaison mère-enfant
     default_sql = """
     WITH ranked AS (
@@ -387,7 +318,7 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
               ORDER BY ts.date_blood_taken DESC, ts.id DESC
           ) AS rn
       FROM testing_specimen ts
-      WHERE ts.date_blood_taken > {start_date}
+      WHERE ts.date_blood_taken > :window_start
     )
 
     SELECT 
@@ -421,12 +352,12 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
         ON lts.id = ts.pcr_result
     WHERE 
         ts.rn = 1
-        AND ts.date_blood_taken > {start_date}
+        AND ts.date_blood_taken > :window_start
         AND tc.id_patient_mother IS NOT NULL
         AND tp.actual_delivery_date IS NOT NULL
         AND tp.actual_delivery_date != '0000-00-00'
-        AND tp.actual_delivery_date > {start_date}
-        AND tp.actual_delivery_date < {end_date}
+        AND tp.actual_delivery_date > :start_date
+        AND tp.actual_delivery_date < :end_date
     GROUP BY 
         ts.id_patient,
         mp.patient_code,
@@ -445,40 +376,21 @@ def get_mother_child_linked_pcr(start_date, end_date, db_config, sql_script=None
     """
     
     # Utiliser le script fourni ou le script par défaut
-    sql_query = sql_script.format(start_date=start_date_sql, end_date=end_date_sql) if sql_script else default_sql.format(start_date=start_date_sql, end_date=end_date_sql)
+    sql_query, params = prepare_sql(sql_script or default_sql, start_date=start_date, end_date=end_date,
+                                    window_start=window_start or start_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        from sqlalchemy import create_engine
-        
-        # Créer la chaîne de connexion SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params, cache_ttl=0)
         
         return df_result
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Une erreur inattendue s'est produite : {e}")
         return pd.DataFrame()
 
-# Exécution et récupération du DataFrame des PCR mère-enfant
-print("\n--- Test avec données PCR mère-enfant liées ---")
-df_mother_child_pcr = get_mother_child_linked_pcr(date_debut, date_fin, db_config_example)
-
-if not df_mother_child_pcr.empty:
-    print(f"\nDataFrame des PCR mère-enfant récupéré avec {len(df_mother_child_pcr)} lignes et {len(df_mother_child_pcr.columns)} colonnes.")
-    print("Colonnes disponibles:", list(df_mother_child_pcr.columns))
-    print(df_mother_child_pcr.head())
-    df_mother_child_pcr.to_excel('./outputs/PTME/mother_child_linked_pcr.xlsx', index=False)
-else:
-    print("Aucune donnée PCR mère-enfant trouvée pour la période spécifiée.")
-
 #=======================================================================================
 print("\n\n=== PTME REPORT DATABASE ===")
 #=======================================================================================
@@ -513,7 +425,7 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
     """
     
     # Script SQL pour les données de suivi de grossesse
-    sql_query = f"""
+    sql_query, params = prepare_sql("""
     SELECT 
         lhs.office,
         lhs.name as hospital,
@@ -533,20 +445,20 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
         IF(v.id_patient IS NOT NULL,
             'yes',
             'no') AS has_viral_load_for_interval,
-        IF((viral_load_date + INTERVAL 12 MONTH) > '{end_date}',
+        IF((viral_load_date + INTERVAL 12 MONTH) > :end_date,
             'yes',
             'no') AS has_valide_viral_load,
-        IF(((tp.dpa >= '{start_date}')
-                OR ((tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) >= '{start_date}'))
-                AND ((tp.ddr <= '{end_date}')
-                OR ((tp.dpa - INTERVAL 9 MONTH - INTERVAL 7 DAY) <= '{end_date}')),
+        IF(((tp.dpa >= :start_date)
+                OR ((tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) >= :start_date))
+                AND ((tp.ddr <= :end_date)
+                OR ((tp.dpa - INTERVAL 9 MONTH - INTERVAL 7 DAY) <= :end_date)),
             'yes',
             'no') AS is_pregnant_in_the_interval,
-        IF(tp.actual_delivery_date BETWEEN '{start_date}' AND '{end_date}',
+        IF(tp.actual_delivery_date BETWEEN :start_date AND :end_date,
             'yes',
             'no') AS has_delivery_in_the_interval,
-        IF((tp.dpa BETWEEN '{start_date}' AND '{end_date}'
-                OR (tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) BETWEEN '{start_date}' AND '{end_date}'),
+        IF((tp.dpa BETWEEN :start_date AND :end_date
+                OR (tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) BETWEEN :start_date AND :end_date),
             'yes',
             'no') AS expected_delivery_in_period,
         ll.name AS planned_place_of_birth_name,
@@ -557,7 +469,7 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
                 'no',
                 tp.planned_place_of_birth_hospital_know)) AS planned_place_of_birth_hospital_know_name,
         tp.created_at AS pregnancy_added_at,
-        IF(tp.created_at BETWEEN '{start_date}' AND '{end_date}',
+        IF(tp.created_at BETWEEN :start_date AND :end_date,
             'yes',
             'no') AS pregnancy_added_in_the_interval,
         b.viral_load_date,
@@ -565,7 +477,7 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
         IF(v.id_patient IS NOT NULL,
             'yes',
             'no') AS has_viral_load_in_the_interval,
-        IF((b.viral_load_date + INTERVAL 12 MONTH) > '{start_date}',
+        IF((b.viral_load_date + INTERVAL 12 MONTH) > :start_date,
             'yes',
             'no') AS valide_viral_load_for_interval,
         IF(tp.infant_has_no_pcr_test = 1,
@@ -614,28 +526,21 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
         FROM
             tracking_motherfollowup tmf
         WHERE
-            viral_load_date BETWEEN '{start_date}' AND '{end_date}'
+            viral_load_date BETWEEN :start_date AND :end_date
         GROUP BY tmf.id_patient) v ON v.id_patient = tp.id_patient_mother
     WHERE
-        (((tp.dpa >= '{start_date}')
-            OR ((tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) >= '{start_date}'))
-            AND ((tp.ddr <= '{end_date}')
-            OR ((tp.dpa - INTERVAL 9 MONTH - INTERVAL 7 DAY) <= '{end_date}')))
-            OR tp.actual_delivery_date BETWEEN '{start_date}' AND '{end_date}'
-            OR tp.created_at BETWEEN '{start_date}' AND '{end_date}'
+        (((tp.dpa >= :start_date)
+            OR ((tp.ddr + INTERVAL 9 MONTH + INTERVAL 7 DAY) >= :start_date))
+            AND ((tp.ddr <= :end_date)
+            OR ((tp.dpa - INTERVAL 9 MONTH - INTERVAL 7 DAY) <= :end_date)))
+            OR tp.actual_delivery_date BETWEEN :start_date AND :end_date
+            OR tp.created_at BETWEEN :start_date AND :end_date
     GROUP BY id_patient_mother
-    """
+    """, start_date=start_date, end_date=end_date)
     
     try:
-        # Établir la connexion à la base de données avec SQLAlchemy
-        connection_string = f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-        engine = create_engine(connection_string)
-        
-        # Exécuter la requête
-        df_result = pd.read_sql_query(sql_query, engine)
-        
-        # Fermer la connexion
-        engine.dispose()
+        # Connexion empruntée au pool partagé (utils.get_engine)
+        df_result = run_query(sql_query, db_config=db_config, params=params)
         
         return df_result
 
@@ -643,9 +548,65 @@ def get_pregnancy_tracking_data(start_date, end_date, db_config):
         print(f"Une erreur inattendue s'est produite : {e}")
         return pd.DataFrame()
 
-def main():
-    """Fonction principale du script."""
+#=======================================================================================
+print("\n\n=== EXTRACTION PARALLÈLE DES BASES PTME ===")
+#=======================================================================================
+# Les extraits sont indépendants : ils partent ensemble sur le pool de connexions partagé
+# (utils.run_extracts) au lieu de s'attendre les uns les autres, puis sont sauvegardés.
+PTME_REPORT_START = '2025-01-01'
+report_db_config = load_database_config()
+
+# Historiques datés : extraction incrémentale (utils.sync_sql_window), seuls les derniers
+# CARIS_SQL_REFRESH_DAYS jours sont ré-interrogés puis fusionnés dans le store local.
+CLUB_SESSIONS_REFRESH_COLS = {
+    "first_attendance_date": ["id_patient"],
+    "last_attendance_date": ["id_patient", "patient_code"],
+    "first_attendance_date_by_club": ["id_patient", "patient_code", "site_code", "club_name"],
+}
+
+def _pcr_since(window_start):
+    # la requête filtre date_blood_taken > borne : pour une fenêtre, la borne est la veille
+    if window_start == date_debut:
+        return date_debut
+    return (pd.Timestamp(window_start) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+ptme_jobs = {
+    "pregnancy_tracking": lambda: run_query_from_gist(gist_sql_url, db_uri, token),
+    "club_sessions_detailed": lambda: sync_sql_window(
+        "ptme_club_sessions",
+        lambda ws: get_club_sessions_data(ws, date_fin, db_config_example, raise_errors=True),
+        date_debut, date_fin, date_col="session_date_presence", refresh_cols=CLUB_SESSIONS_REFRESH_COLS),
+    "pcr_analysis": lambda: get_pcr_analysis(date_debut, date_fin, db_config_example),
+    "mother_child_linked_pcr": lambda: sync_sql_window(
+        "ptme_mother_child_pcr",
+        lambda ws: get_mother_child_linked_pcr(date_debut, date_fin, db_config_example,
+                                               window_start=_pcr_since(ws), raise_errors=True),
+        date_debut, date_fin, date_col="first_blood_taken_date", key_cols=["id_patient"]),
+}
+if all(report_db_config.values()):
+    ptme_jobs["pregnancy_report"] = lambda: get_pregnancy_tracking_data(PTME_REPORT_START, datetime.now().date(), report_db_config)
+
+ptme_extracts, ptme_timings = run_extracts(ptme_jobs)
+
+for name in ["pregnancy_tracking", "club_sessions_detailed", "pcr_analysis", "mother_child_linked_pcr"]:
+    df_extract = ptme_extracts[name]
+    if not df_extract.empty:
+        print(f"\nDataFrame {name} récupéré avec {len(df_extract)} lignes et {len(df_extract.columns)} colonnes.")
+        print(df_extract.head())
+        df_extract.to_excel(f'./outputs/PTME/{name}.xlsx', index=False)
+    else:
+        print(f"Aucune donnée {name} trouvée pour la période spécifiée.")
+
+def main(df_pregnancy=None):
+    """Fonction principale du script.
+
+    df_pregnancy : rapport de grossesse déjà extrait par le lot parallèle ; s'il est absent,
+    la requête est lancée directement.
+    """
     
+    if df_pregnancy is not None:
+        return save_pregnancy_report(df_pregnancy)
+
     # Charger la configuration de la base de données
     print("Chargement de la configuration de la base de données...")
     db_config = load_database_config()
@@ -657,14 +618,18 @@ def main():
         return
     
     # Définition des dates (modifiez selon vos besoins)
-    start_date = '2025-01-01'
+    start_date = PTME_REPORT_START
     end_date = datetime.now().date()
     
     print(f"Récupération des données de grossesse entre {start_date} et {end_date}...")
     
     # Récupération des données
     df_pregnancy = get_pregnancy_tracking_data(start_date, end_date, db_config)
-    
+    save_pregnancy_report(df_pregnancy)
+
+
+def save_pregnancy_report(df_pregnancy):
+    """Affiche les statistiques du rapport de grossesse et le sauvegarde dans outputs/PTME."""
     if not df_pregnancy.empty:
         print(f"\n✅ Données récupérées avec succès!")
         print(f"📊 Nombre d'enregistrements: {len(df_pregnancy)}")
@@ -710,7 +675,7 @@ def main():
         print("Vérifiez les dates et la connectivité à la base de données.")
         
 if __name__ == "__main__":
-    main()
+    main(ptme_extracts.get("pregnancy_report"))
 
 
 #=======================================================================================
@@ -1,8 +1,8 @@
-from difflib import SequenceMatcher
-from typing import List
+from typing import List, Optional
 import requests
 import json
 import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta
@@ -31,16 +31,183 @@ def write_excel(df, output_file):
     df.to_excel(output_path, index=False)
     print(f"✅ Fichier enregistré : {output_path}")
 #====================================================================================================
+# SNAPSHOTS COLONNAIRES DES EXPORTS COMMCARE
+# Chaque export Excel de data/ est converti une seule fois en Parquet (clé = hash du fichier),
+# puis toutes les lectures suivantes (tous pipelines confondus) passent par la copie colonnaire.
+#====================================================================================================
+import hashlib
+
+SNAPSHOT_DIR = Path(os.environ.get("CARIS_SNAPSHOT_DIR") or Path(__file__).resolve().parent.parent / "data" / ".snapshots")
+SNAPSHOT_MANIFEST_PREFIX = "manifest_"
+
+
+def _file_sha1(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Un petit manifeste par (source, feuille) : chaque processus ne réécrit que l'entrée qu'il
+# vient de construire, sans verrou ni perte de mise à jour quand les pipelines tournent en parallèle.
+def _snapshot_entry_path(key: str) -> Path:
+    return SNAPSHOT_DIR / f"{SNAPSHOT_MANIFEST_PREFIX}{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+def _load_snapshot_entry(key: str) -> dict | None:
+    try:
+        with open(_snapshot_entry_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_snapshot_entry(key: str, entry: dict) -> None:
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    target = _snapshot_entry_path(key)
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, target)
+
+
+def _iter_snapshot_entries():
+    """(chemin du manifeste, entrée) pour toutes les sources connues."""
+    if not SNAPSHOT_DIR.exists():
+        return
+    for p in SNAPSHOT_DIR.glob(f"{SNAPSHOT_MANIFEST_PREFIX}*.json"):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                yield p, json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def _drop_snapshot(name: str) -> bool:
+    """Supprime un snapshot s'il n'est plus référencé par aucune source (contenus identiques partagés)."""
+    if any(entry.get("snapshot") == name for _, entry in _iter_snapshot_entries()):
+        return False
+    try:
+        (SNAPSHOT_DIR / name).unlink()
+        return True
+    except OSError:
+        return False
+
+
+def _write_snapshot(df: pd.DataFrame, digest: str) -> Path:
+    """
+    Écrit le snapshot en Parquet. Les exports CommCare mélangent parfois nombres et
+    chaînes ('---') dans une même colonne : si Arrow refuse la conversion, on se
+    rabat sur un pickle pour conserver les types d'origine à l'identique.
+    """
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    target = SNAPSHOT_DIR / f"{digest}.parquet"
+    tmp = SNAPSHOT_DIR / f"{digest}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp, index=False)
+    except Exception:
+        target = SNAPSHOT_DIR / f"{digest}.pkl"
+        df.to_pickle(tmp)
+    os.replace(tmp, target)
+    return target
+
+
+def purge_stale_snapshots() -> int:
+    """
+    Supprime les snapshots (et leur manifeste) dont le fichier source a disparu.
+    Ne touche ni aux fichiers temporaires ni aux fichiers qu'aucun manifeste ne référence :
+    ils peuvent appartenir à un autre processus en cours d'écriture.
+
+    Returns:
+        int: nombre de snapshots supprimés
+    """
+    removed = 0
+    for entry_path, entry in list(_iter_snapshot_entries()):
+        if Path(entry.get("source", "")).exists():
+            continue
+        try:
+            entry_path.unlink()
+        except OSError:
+            continue
+        removed += _drop_snapshot(entry.get("snapshot", ""))
+    return removed
+
+
+def _read_snapshot(snapshot_path: Path, columns: list | None) -> pd.DataFrame:
+    if snapshot_path.suffix == ".parquet":
+        return pd.read_parquet(snapshot_path, columns=columns)
+    df = pd.read_pickle(snapshot_path)
+    return df[columns] if columns is not None else df
+
+
+def read_excel_snapshot(path, columns: list | None = None, sheet_name=0, refresh: bool = False) -> pd.DataFrame:
+    """
+    Lit un export Excel via son snapshot colonnaire.
+
+    Le premier appel après un téléchargement parse le fichier Excel et écrit le snapshot ;
+    les appels suivants (même depuis un autre pipeline) lisent directement le Parquet,
+    en ne chargeant que `columns` si précisé. Le snapshot est indexé par (taille, mtime)
+    pour éviter de re-hacher un fichier inchangé, puis par hash SHA-1 du contenu.
+
+    Args:
+        path: chemin du fichier Excel
+        columns: colonnes à charger (projection), None = toutes
+        sheet_name: feuille à lire (défaut: première feuille)
+        refresh: si True, force la reconstruction du snapshot
+
+    Returns:
+        pd.DataFrame: le contenu de la feuille (restreint à `columns` le cas échéant)
+    """
+    source = Path(path).expanduser().resolve()
+    if not source.exists():
+        raise FileNotFoundError(f"❌ Fichier introuvable : {source}")
+
+    stat = source.stat()
+    key = f"{source}::{sheet_name}"
+    entry = _load_snapshot_entry(key)
+
+    if entry and not refresh:
+        same_file = entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+        if not same_file and entry["sha1"] == _file_sha1(source):
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            same_file = True
+            _save_snapshot_entry(key, entry)
+        if same_file:
+            try:
+                return _read_snapshot(SNAPSHOT_DIR / entry["snapshot"], columns)
+            except FileNotFoundError:
+                pass  # snapshot supprimé entre-temps : reconstruction
+
+    digest = _file_sha1(source)
+    df = pd.read_excel(source, sheet_name=sheet_name)
+    snapshot_path = _write_snapshot(df, f"{digest}_{sheet_name}")
+    _save_snapshot_entry(key, {
+        "source": str(source),
+        "sha1": digest,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "snapshot": snapshot_path.name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    # Seul l'ancien snapshot de cette source est retiré (s'il n'est partagé avec aucune autre)
+    if entry and entry.get("snapshot") != snapshot_path.name:
+        _drop_snapshot(entry["snapshot"])
+    purge_stale_snapshots()
+    print(f"🗜️ Snapshot créé pour '{source.name}' → {snapshot_path.name}")
+    return df[columns] if columns is not None else df
+
 
-def load_excel_to_df(filename: str, df_name: str) -> pd.DataFrame:
+def load_excel_to_df(filename: str, df_name: str, columns: list | None = None) -> pd.DataFrame:
     """
     Charge un fichier Excel situé à la racine du projet (ou dans un sous-dossier)
     et renvoie le DataFrame correspondant.
-    
+
     Args:
         filename (str): nom du fichier à lire (ex: 'nutrition.xlsx' ou 'data/nutrition.xlsx')
         df_name (str): nom symbolique du DataFrame à afficher dans les logs
-    
+        columns (list, optional): colonnes à charger, None = toutes
+
     Returns:
         pd.DataFrame: le DataFrame chargé depuis le fichier Excel
     """
@@ -50,118 +217,401 @@ def load_excel_to_df(filename: str, df_name: str) -> pd.DataFrame:
     if not data_path.exists():
         raise FileNotFoundError(f"❌ Fichier introuvable : {data_path}")
     print(f"📂 Lecture du fichier '{filename}' dans {data_path}")
-    df = pd.read_excel(data_path)
+    df = read_excel_snapshot(data_path, columns=columns)
     print(f"✅ DataFrame '{df_name}' chargé ({len(df)} lignes, {len(df.columns)} colonnes)")
     return df
 
 if __name__ == '__main__':
     print("Module utils.py chargé. Ajoutez une fonction main() pour exécuter des tests ou des exemples.")
 #=====================================================================================================
-def get_commcare_odata(url, auth_credentials, filter_params):
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ODATA_PAGE_SIZE = 2000
+ODATA_TIMEOUT = (30, 300)
+_ODATA_SESSIONS = local()
+
+
+def _odata_session(auth_credentials) -> requests.Session:
+    """
+    Session keep-alive par thread et par identifiants (requests.Session n'est pas
+    thread-safe), avec retries + backoff exponentiel sur 429/5xx (en respectant Retry-After).
+    """
+    key = tuple(auth_credentials) if auth_credentials else None
+    sessions = _ODATA_SESSIONS.__dict__.setdefault("by_auth", {})
+    session = sessions.get(key)
+    if session is None:
+        retry = Retry(
+            total=5,
+            backoff_factor=2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=8, pool_maxsize=8)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.auth = auth_credentials
+        sessions[key] = session
+    return session
+
+
+def _odata_get(session, url, params=None):
+    response = session.get(url, params=params, timeout=ODATA_TIMEOUT)
+    if response.status_code != 200:
+        return None, response.status_code
+    return response.json(), 200
+
+
+def _iter_odata_pages(url, auth_credentials, filter_params=None, workers=1, page_size=ODATA_PAGE_SIZE,
+                      strict=False):
+    """
+    Générateur de pages (listes d'enregistrements).
+    - workers == 1 : suit @odata.nextLink page par page
+    - workers > 1  : demande $count puis récupère les pages $skip en parallèle
+                     (fenêtre bornée à `workers` requêtes en vol, ordre conservé) ; exige un
+                     $orderby stable, sinon repli sur nextLink. Le pas est la taille de la première
+                     page réellement servie (le serveur peut plafonner $top) ; une page incomplète
+                     avant la dernière lève RuntimeError plutôt que de sauter des enregistrements.
+    - strict : une page en échec lève RuntimeError au lieu d'arrêter le flux (résultat partiel)
+    """
+    session = _odata_session(auth_credentials)
+    params = dict(filter_params or {})
+    if workers > 1 and "$orderby" not in params:
+        print("Parallel fetch needs a stable $orderby: falling back to nextLink paging")
+        workers = 1
+    if workers > 1:
+        params.update({"$count": "true", "$top": page_size})
+
+    payload, status = _odata_get(session, url, params)
+    if payload is None:
+        if strict:
+            raise RuntimeError(f"API request failed with status code {status}")
+        print(f"Error: API request failed with status code {status}")
+        return
+    first_page = payload.get("value", [])
+    yield first_page
+
+    total = payload.get("@odata.count")
+    if workers > 1 and total is not None:
+        step = len(first_page)
+        total = int(total)
+        skips = list(range(step, total, step)) if step else []
+        print(f"Parallel fetch: {total} records, {len(skips)} remaining page(s) of {step}, {workers} workers")
+
+        def fetch(skip):
+            page_payload, page_status = _odata_get(_odata_session(auth_credentials), url, {**params, "$skip": skip})
+            if page_payload is None:
+                raise RuntimeError(f"Failed to retrieve page $skip={skip}: {page_status}")
+            page = page_payload.get("value", [])
+            if len(page) < min(step, total - skip):
+                raise RuntimeError(f"Incomplete page $skip={skip}: {len(page)} of {min(step, total - skip)} records")
+            return page
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(0, len(skips), workers):
+                for page in pool.map(fetch, skips[i:i + workers]):
+                    yield page
+        return
+
+    # Pagination séquentielle par nextLink
+    next_link = payload.get("@odata.nextLink")
+    while next_link:
+        print(f"Following next link: {next_link}")
+        payload, status = _odata_get(session, next_link)
+        if payload is None:
+            if strict:
+                raise RuntimeError(f"Failed to retrieve next page: {status}")
+            print(f"Error: Failed to retrieve next page: {status}")
+            break
+        yield payload.get("value", [])
+        next_link = payload.get("@odata.nextLink")
+
+
+def iter_commcare_odata(url, auth_credentials, filter_params=None, workers=1, page_size=ODATA_PAGE_SIZE):
+    """
+    Variante générateur de get_commcare_odata : produit un DataFrame par page
+    au lieu d'accumuler tout le flux en mémoire.
+
+    Args:
+        url (str): The OData API URL
+        auth_credentials (tuple): Username and password tuple (username, password)
+        filter_params (dict): Parameters to filter the data
+        workers (int): nombre de pages récupérées en parallèle ($skip), 1 = séquentiel
+        page_size (int): taille de page ($top) en mode parallèle
+
+    Yields:
+        pd.DataFrame: les enregistrements d'une page
+    """
+    for page in _iter_odata_pages(url, auth_credentials, filter_params, workers, page_size):
+        if page:
+            yield pd.DataFrame(page)
+
+
+def get_commcare_odata(url, auth_credentials, filter_params, workers=1, page_size=ODATA_PAGE_SIZE, strict=False):
     """
     Fetch active muso groups from CommCare using OData API
-    
+
     Args:
         url (str): The OData API URL
         auth_credentials (tuple): Username and password tuple (username, password)
         filter_params (dict): Parameters to filter the data
-        
+        workers (int): nombre de pages récupérées en parallèle ($skip), 1 = séquentiel
+        page_size (int): taille de page ($top) en mode parallèle
+        strict (bool): lever RuntimeError si une page échoue (sinon résultat partiel)
+
     Returns:
         list: List of muso group records
     """
-    # Make the initial request to the OData API
-    response = requests.get(url, auth=auth_credentials, params=filter_params)
+    data = []
+    for page in _iter_odata_pages(url, auth_credentials, filter_params, workers, page_size, strict):
+        data.extend(page)
+        print(f"Retrieved {len(page)} records. Total: {len(data)}")
 
-    # Check if the request was successful
-    if response.status_code != 200:
-        print(f"Error: API request failed with status code {response.status_code}")
-        return []
-    # Get initial data
-    data = response.json()['value']
-    # Follow pagination links if they exist
-    while "@odata.nextLink" in response.json():
-        next_link = response.json()["@odata.nextLink"]
-        print(f"Following next link: {next_link}")
-        
-        # Get the next page of data
-        response = requests.get(next_link, auth=auth_credentials)
-        
-        if response.status_code == 200:
-            # Add new records to our data
-            new_records = response.json()['value']
-            data += new_records
-            print(f"Retrieved additional {len(new_records)} records. Total: {len(data)}")
-        else:
-            print(f"Error: Failed to retrieve next page: {response.status_code}")
-            break
-    
     print(f"Total records retrieved: {len(data)}")
     return data
 
 #=========================================================================================================
+# SYNCHRONISATION INCRÉMENTALE DES FLUX ODATA
+# Chaque flux garde un « high-water mark » (last_modified_date / received_on) et un store Parquet local ;
+# seuls les enregistrements modifiés depuis le dernier passage sont demandés via $filter.
+#=========================================================================================================
+ODATA_STORE_DIR = Path(os.environ.get("CARIS_ODATA_STORE_DIR") or Path(__file__).resolve().parent.parent / "data" / ".odata_store")
+# Recouvrement du filtre incrémental : rattrape les lignes dont l'horodatage est antérieur au
+# dernier maximum vu mais qui n'étaient pas encore visibles côté serveur au passage précédent
+ODATA_SYNC_OVERLAP_MINUTES = int(os.environ.get("ODATA_SYNC_OVERLAP_MINUTES", "60"))
+
+
+def _odata_state_path(feed_name: str) -> Path:
+    return ODATA_STORE_DIR / f"{feed_name}.state.json"
+
 
-def is_beneficiary_active(row):
+def _odata_store_path(feed_name: str) -> Path:
+    return ODATA_STORE_DIR / f"{feed_name}.parquet"
+
+
+def _odata_datetime_literal(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+
+
+def sync_commcare_odata(
+    feed_name: str,
+    url: str,
+    auth_credentials,
+    key_col: str = "caseid",
+    watermark_col: str = "last_modified_date",
+    full_refresh: bool = False,
+    workers: int = 1
+) -> pd.DataFrame:
     """
-    Check if a beneficiary is active based on various date fields
+    Synchronise un flux OData CommCare de façon incrémentale et renvoie son état courant.
+
     Args:
-        row (dict): A dictionary representing a beneficiary record
-        start_date (str): The start date for the active period
-        end_date (str): The end date for the active period"
-        """
-    if row['closed_date']<start_date:
-        return "no"
-    if row["creation_date"]>end_date:
-        return "no"
-    if row['graduation_date']>start_date:
-        return "yes"
-    if row['abandoned_date']>start_date:
-        return "yes"
-    if row['inactive_date']>start_date:
-        return "yes"
-    if row['inactive_date']<start_date:
-        return "no"
-    if row['graduation_date']<start_date:
-        return "no"
-    if (pd.isnull(row['is_inactive']) or row['is_inactive']==0) and (row['graduated']==0 or pd.isnull(row['graduated'])):
-        return "yes"
-    return "no"
-
-
-# define a function to check if a group is active
-def is_groupe_active(row):
-    """
-    Check if a group is active based on various date fields
+        feed_name (str): nom du flux (sert de nom de fichier pour le store local)
+        url (str): URL du flux OData
+        auth_credentials (tuple): (username, password)
+        key_col (str): clé d'upsert ('caseid' pour les cas, 'formid' pour les formulaires)
+        watermark_col (str): colonne de date servant de high-water mark
+                             ('last_modified_date' pour les cas, 'received_on' pour les formulaires)
+        full_refresh (bool): si True (ou ODATA_SYNC_FULL=1), ignore le store et re-télécharge tout
+        workers (int): pages récupérées en parallèle (voir get_commcare_odata)
+
+    Returns:
+        pd.DataFrame: toutes les lignes connues du flux, une par `key_col`
+    """
+    ODATA_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    state_path = _odata_state_path(feed_name)
+    store_path = _odata_store_path(feed_name)
+    full_refresh = full_refresh or os.getenv("ODATA_SYNC_FULL", "0") in {"1", "true", "yes"}
+
+    state = {}
+    if state_path.exists() and store_path.exists() and not full_refresh:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+    # Ordre stable (high-water mark puis clé) : les pages se suivent sans trou ni doublon
+    params = {"$orderby": f"{watermark_col},{key_col}"}
+    high_water_mark = state.get("high_water_mark")
+    if high_water_mark:
+        # 'ge' + recouvrement : les lignes déjà vues sont dédoublonnées par l'upsert
+        since = pd.Timestamp(high_water_mark) - pd.Timedelta(minutes=ODATA_SYNC_OVERLAP_MINUTES)
+        params["$filter"] = f"{watermark_col} ge {_odata_datetime_literal(since)}"
+        print(f"🔄 {feed_name}: synchronisation incrémentale depuis {high_water_mark}")
+    else:
+        print(f"📥 {feed_name}: synchronisation complète")
+
+    # strict : une page manquante lève une erreur, le store et le high-water mark restent inchangés
+    delta = pd.DataFrame(get_commcare_odata(url, auth_credentials, params, workers=workers, strict=True))
+    stored = pd.read_parquet(store_path) if high_water_mark else pd.DataFrame()
+
+    if delta.empty:
+        print(f"✅ {feed_name}: aucune modification ({len(stored)} lignes en local)")
+        return stored
+
+    if key_col not in delta.columns or watermark_col not in delta.columns:
+        raise ValueError(f"❌ {feed_name}: colonnes '{key_col}'/'{watermark_col}' absentes du flux — store non mis à jour")
+
+    merged = pd.concat([stored, delta], ignore_index=True) if not stored.empty else delta
+    merged = merged.drop_duplicates(subset=[key_col], keep="last").reset_index(drop=True)
+
+    try:
+        merged.to_parquet(store_path, index=False)
+    except Exception:
+        # colonnes mixtes : on normalise en texte, comme le renvoie le JSON OData
+        merged = merged.astype({c: "string" for c in merged.columns if merged[c].dtype == object})
+        merged.to_parquet(store_path, index=False)
+
+    new_mark = pd.to_datetime(delta[watermark_col], errors="coerce", utc=True).max()
+    if pd.notna(new_mark):
+        state["high_water_mark"] = new_mark.isoformat()
+    state.update(rows=len(merged), last_delta_rows=len(delta), synced_at=datetime.now().isoformat(timespec="seconds"))
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+    print(f"✅ {feed_name}: {len(delta)} ligne(s) reçue(s), {len(merged)} lignes en local")
+    return merged
+
+#=========================================================================================================
+
+# Règles d'activité (évaluées dans l'ordre, la première condition vraie l'emporte) :
+#   office exclu (groupes)          -> no
+#   closed_date < début             -> no
+#   creation_date > fin             -> no
+#   graduation_date > début         -> yes
+#   abandoned_date > début (bénéf.) -> yes
+#   inactive_date > début           -> yes
+#   inactive_date < début           -> no
+#   graduation_date < début         -> no
+#   ni inactif ni gradué            -> yes
+#   sinon                           -> no
+ACTIVITY_DATE_COLS = ["closed_date", "creation_date", "graduation_date", "abandoned_date", "inactive_date"]
+
+
+def _as_naive_datetime64(s: pd.Series) -> np.ndarray:
+    """Colonne de dates -> datetime64[ns] naïf (UTC si la colonne est tz-aware) ; invalide -> NaT."""
+    dt = pd.to_datetime(s, errors="coerce", utc=True)
+    return dt.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def _is_unset_value(v) -> bool:
+    if isinstance(v, str):
+        return v.strip() in ("", "---", "0")
+    try:
+        return float(v) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_unset_flag(s: pd.Series) -> np.ndarray:
+    """
+    True si le drapeau (is_inactive, graduated, ...) est vide (NaN, "", "---") ou vaut 0.
+    Toute autre valeur, y compris un texte ("yes", "oui"), compte comme positionnée.
+    """
+    # Évaluation sur les valeurs distinctes uniquement (quelques-unes par colonne)
+    codes, uniques = pd.factorize(s)
+    unset = np.array([_is_unset_value(u) for u in uniques] + [True], dtype=bool)
+    return unset[codes]  # code -1 (manquant) -> dernier élément, True
+
+
+def activity_matrix(
+    df: pd.DataFrame,
+    starts,
+    ends,
+    kind: str = "beneficiary",
+    excluded_offices=("CAY", "JER")
+) -> np.ndarray:
+    """
+    Statut d'activité de chaque ligne pour chaque période, en une seule opération
+    np.select diffusée sur une matrice (lignes x périodes).
+
     Args:
-        row (dict): A dictionary representing a group record
+        df: bénéficiaires (kind='beneficiary', drapeau 'graduated') ou groupes MUSO
+            (kind='groupe', drapeau 'is_graduated', sans 'abandoned_date', offices exclus)
+        starts, ends: dates de début / fin des périodes (scalaires ou séquences de même longueur)
+        excluded_offices: offices toujours inactifs (groupes uniquement)
+
     Returns:
-        str: 'yes' if active, 'no' if inactive
+        np.ndarray de booléens (len(df), nb périodes)
     """
-        # Convert reference dates to UTC timezone-aware timestamps
-    start_date_dt = pd.to_datetime(start_date)
-    end_date_dt = pd.to_datetime(end_date)
-    print("start date and end date", start_date_dt, end_date_dt)
-    
-    # Convert and normalize dates from the row
-    # Check conditions only if dates are valid
-    if row["office_name"] in ["CAY","JER"]:
-        return "no"
-    # if pd.notna(row['opened_date']) and row['opened_date'] < start_date_dt:
-    #     return "no"
-    if pd.notna(row['closed_date']) and row['closed_date'] < start_date_dt:
-        return "no"
-    if pd.notna(row['creation_date']) and row["creation_date"] > end_date_dt:
-        return "no"
-    if pd.notna(row['graduation_date']) and row['graduation_date'] > start_date_dt:
-        return "yes"
-    if pd.notna(row['inactive_date']) and row['inactive_date'] > start_date_dt:
-        return "yes"
-    if pd.notna(row['inactive_date']) and row['inactive_date'] < start_date_dt:
-        return "no"
-    if pd.notna(row['graduation_date']) and row['graduation_date'] < start_date_dt:
-        return "no"
-    if (pd.isnull(row['is_inactive']) or row['is_inactive']==0) and (row['is_graduated']==0 or pd.isnull(row['is_graduated'])):
-        return "yes"
-    return "no"
+    if kind not in ("beneficiary", "groupe"):
+        raise ValueError("kind doit être 'beneficiary' ou 'groupe'.")
+    graduated_col = "graduated" if kind == "beneficiary" else "is_graduated"
+    date_cols = [c for c in ACTIVITY_DATE_COLS if kind == "beneficiary" or c != "abandoned_date"]
+    required = date_cols + ["is_inactive", graduated_col] + (["office_name"] if kind == "groupe" else [])
+    manquantes = [c for c in required if c not in df.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans df: {manquantes}")
+
+    start = pd.to_datetime(pd.Series(np.atleast_1d(starts))).to_numpy(dtype="datetime64[ns]")[None, :]
+    end = pd.to_datetime(pd.Series(np.atleast_1d(ends))).to_numpy(dtype="datetime64[ns]")[None, :]
+    d = {c: _as_naive_datetime64(df[c])[:, None] for c in date_cols}
+    never = np.zeros((len(df), 1), dtype=bool)
+
+    # Les comparaisons avec NaT sont fausses : une date manquante ne déclenche aucune règle
+    conditions = [
+        df["office_name"].isin(excluded_offices).to_numpy()[:, None] if kind == "groupe" else never,
+        d["closed_date"] < start,
+        d["creation_date"] > end,
+        d["graduation_date"] > start,
+        d["abandoned_date"] > start if kind == "beneficiary" else never,
+        d["inactive_date"] > start,
+        d["inactive_date"] < start,
+        d["graduation_date"] < start,
+        (_is_unset_flag(df["is_inactive"]) & _is_unset_flag(df[graduated_col]))[:, None],
+    ]
+    choices = [False, False, False, True, True, True, False, False, True]
+    shape = (len(df), start.shape[1])
+    return np.select([np.broadcast_to(c, shape) for c in conditions], choices, default=False)
+
+
+def is_beneficiary_active(df: pd.DataFrame, start_date, end_date) -> pd.Series:
+    """
+    Statut d'activité ('yes'/'no') des bénéficiaires sur la période [start_date, end_date].
+    Version vectorisée de l'ancienne fonction ligne à ligne (plus de variables globales).
+    """
+    active = activity_matrix(df, start_date, end_date, kind="beneficiary")[:, 0]
+    return pd.Series(np.where(active, "yes", "no"), index=df.index)
+
+
+def is_groupe_active(df: pd.DataFrame, start_date, end_date, excluded_offices=("CAY", "JER")) -> pd.Series:
+    """
+    Statut d'activité ('yes'/'no') des groupes MUSO sur la période [start_date, end_date].
+    Les groupes des offices `excluded_offices` sont toujours inactifs.
+    """
+    active = activity_matrix(df, start_date, end_date, kind="groupe", excluded_offices=excluded_offices)[:, 0]
+    return pd.Series(np.where(active, "yes", "no"), index=df.index)
+
+
+def activity_history(
+    df: pd.DataFrame,
+    start_date,
+    end_date,
+    kind: str = "groupe",
+    id_col: str = "caseid",
+    freq: str = "M",
+    excluded_offices=("CAY", "JER")
+) -> pd.DataFrame:
+    """
+    Historique d'activité par période (mensuel par défaut) en un seul appel.
+
+    Returns:
+        DataFrame long : id_col, period ('YYYY-MM'), period_start, period_end, active ('yes'/'no')
+    """
+    periods = pd.period_range(start=start_date, end=end_date, freq=freq)
+    starts, ends = periods.start_time, periods.end_time
+    active = activity_matrix(df, starts, ends, kind=kind, excluded_offices=excluded_offices)
+    n, p = active.shape
+    return pd.DataFrame({
+        id_col: np.repeat(df[id_col].to_numpy(), p),
+        "period": np.tile(periods.astype(str), n),
+        "period_start": np.tile(starts, n),
+        "period_end": np.tile(ends, n),
+        "active": np.where(active.ravel(), "yes", "no"),
+    })
 #=============================================================================================================
 def is_screened_in_period(df, date_col, start_date, end_date, ref_date):
     """
@@ -596,16 +1046,55 @@ def save_dataframes_excel(output_name="output", df1=None, df2=None, df3=None, df
     
 #===========================================================================================
 import pandas as pd
-import unicodedata
 from rapidfuzz import process, fuzz
 
+def _cdist_topk(queries: List[str], choices: List[str], scorer, top_k: int = 1, workers: int = -1):
+    """
+    Top-k des `choices` pour chaque requête via rapidfuzz.process.cdist (multi-threads),
+    par tranches de requêtes pour borner la matrice de scores à FUZZY_MAX_CELLS cellules.
+
+    Returns:
+        (indices, scores) : deux tableaux (len(queries), k), triés par score décroissant
+    """
+    k = min(top_k, len(choices))
+    idx = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0 or not queries:
+        return idx, scores
+    n_threads = (os.cpu_count() or 1) if workers == -1 else workers
+    if k == 1 and n_threads == 1:
+        # Mono-cœur : extractOne élague via son score_cutoff croissant, plus rapide qu'une matrice complète
+        for i, q in enumerate(queries):
+            _, score, j = process.extractOne(q, choices, scorer=scorer)
+            idx[i, 0], scores[i, 0] = j, score
+        return idx, scores
+    step = max(1, FUZZY_MAX_CELLS // len(choices))
+    for start in range(0, len(queries), step):
+        mat = process.cdist(queries[start:start + step], choices, scorer=scorer,
+                            dtype=np.float32, workers=workers)
+        if k == 1:
+            part = mat.argmax(axis=1)[:, None]  # premier maximum, comme extractOne
+        elif k < len(choices):
+            part = np.argpartition(-mat, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(len(choices)), (len(mat), 1))
+        part_scores = np.take_along_axis(mat, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        idx[start:start + step] = np.take_along_axis(part, order, axis=1)
+        scores[start:start + step] = np.take_along_axis(part_scores, order, axis=1)
+    return idx, scores
+
+
 def commcare_match_person(
     df_reference: pd.DataFrame,
     df_commcare: pd.DataFrame,
     name_column: str = "name",
     threshold: int = 85,
     return_df: str = "reference",  # "reference" ou "commcare"
-    scorer=fuzz.token_set_ratio
+    scorer=fuzz.token_set_ratio,
+    top_k: int = 1,
+    block_on: Optional[str] = None,
+    workers: int = -1
 ) -> pd.DataFrame:
     """
     Apparier flou sur une colonne de noms entre df_reference et df_commcare.
@@ -618,65 +1107,72 @@ def commcare_match_person(
         return_df: 'reference' => retourne df_reference enrichi;
                    'commcare'     => retourne df_commcare enrichi (recherche inversée).
         scorer: fonction de similarité rapidfuzz (par défaut token_set_ratio).
+        top_k: nombre de candidats conservés par nom (colonne 'candidates' si > 1).
+        block_on: colonne présente des deux côtés (ex. 'office', 'commune') ; seuls les
+                  noms partageant la même valeur sont comparés.
+        workers: threads rapidfuzz (-1 = tous les cœurs).
 
     Returns:
         Le DataFrame demandé, avec 3 colonnes ajoutées:
           - 'best_match'    : le nom correspondant le plus proche
           - 'score'         : le score de similarité (0..100)
           - 'correspondance': 'yes' si score >= threshold, 'no' sinon
+        et, si top_k > 1, 'candidates' : liste [(nom, score), ...] par score décroissant.
     """
 
-    if "name" not in df_reference.columns or "name" not in df_commcare.columns:
-        raise ValueError("Les deux DataFrames doivent contenir la colonne 'name'.")
+    if name_column not in df_reference.columns or name_column not in df_commcare.columns:
+        raise ValueError(f"Les deux DataFrames doivent contenir la colonne '{name_column}'.")
+    if block_on and (block_on not in df_reference.columns or block_on not in df_commcare.columns):
+        raise ValueError(f"Les deux DataFrames doivent contenir la colonne de blocage '{block_on}'.")
 
-    def _normalize(s: str) -> str:
-        if pd.isna(s):
-            return ""
-        s = str(s).strip().lower()
-        s = " ".join(s.split())  # collapse espaces multiples
-        # retirer les accents
-        s = unicodedata.normalize("NFKD", s)
-        s = "".join(ch for ch in s if not unicodedata.combining(ch))
-        return s
+    def _normalize(s: pd.Series) -> pd.Series:
+        # minuscules, espaces réduits, accents retirés ; NaN -> ""
+        return _normalize_text_series(s.fillna("").astype(str))
 
     def _match(source_df: pd.DataFrame, target_df: pd.DataFrame) -> pd.DataFrame:
-        # Prépare les choix (normalisés) et un mapping -> original
-        target_norm = target_df[name_column].map(_normalize).fillna("")
-        choices = target_norm.tolist()
-        orig_by_norm = target_norm.to_frame("norm").join(
-            target_df[name_column]
-        ).drop_duplicates(subset=["norm"]).set_index("norm")[name_column].to_dict()
-
-        # Calcul du meilleur match pour chaque source
-        best_matches = []
-        scores = []
-
-        for name in source_df[name_column].fillna(""):
-            q = _normalize(name)
-            if not q:
-                best_matches.append(None)
-                scores.append(0)
-                continue
+        src = pd.DataFrame({"norm": _normalize(source_df[name_column]).to_numpy()})
+        tgt = pd.DataFrame({"norm": _normalize(target_df[name_column]).to_numpy(),
+                            "orig": target_df[name_column].to_numpy()})
+        if block_on:
+            src["block"] = _normalize_text_series(source_df[block_on]).to_numpy()
+            tgt["block"] = _normalize_text_series(target_df[block_on]).to_numpy()
+        else:
+            src["block"] = tgt["block"] = ""
 
-            # extractOne renvoie (match_norm, score, index)
-            match = process.extractOne(q, choices, scorer=scorer)
-            if match is None:
-                best_matches.append(None)
-                scores.append(0)
-                continue
+        # Nom original par (bloc, nom normalisé) : première occurrence
+        tgt = tgt[tgt["norm"] != ""].drop_duplicates(subset=["block", "norm"])
 
-            match_norm, score, _ = match
-            if score >= threshold:
-                best_matches.append(orig_by_norm.get(match_norm, None))
-                scores.append(int(score))
-            else:
-                best_matches.append(None)
-                scores.append(int(score))
+        best_matches = [None] * len(src)
+        scores = [0] * len(src)
+        candidates = [[] for _ in range(len(src))]
+        tgt_groups = {b: g for b, g in tgt.groupby("block", sort=False)}
+
+        # Une seule requête cdist par (bloc, nom distinct) côté source
+        queries = src[src["norm"] != ""].drop_duplicates(subset=["block", "norm"])
+        for block, q in queries.groupby("block", sort=False):
+            choices_df = tgt_groups.get(block)
+            if choices_df is None:
+                continue
+            choices = choices_df["norm"].tolist()
+            origs = choices_df["orig"].tolist()
+            idx, sc = _cdist_topk(q["norm"].tolist(), choices, scorer, top_k=top_k, workers=workers)
+            results = {
+                norm: [(origs[j], int(s)) for j, s in zip(row_idx.tolist(), row_sc.tolist())]
+                for norm, row_idx, row_sc in zip(q["norm"], idx, sc)
+            }
+            rows = src.index[(src["block"] == block) & src["norm"].isin(results.keys())]
+            for i in rows:
+                cands = results[src.at[i, "norm"]]
+                candidates[i] = cands
+                scores[i] = cands[0][1]
+                best_matches[i] = cands[0][0] if cands[0][1] >= threshold else None
 
         out = source_df.copy()
         out["best_match"] = best_matches
         out["score"] = scores
         out["correspondance"] = ["yes" if score >= threshold else "no" for score in scores]
+        if top_k > 1:
+            out["candidates"] = candidates
         return out
 
     if return_df not in ("reference", "commcare"):
@@ -1026,18 +1522,95 @@ def get_age_flag(df: pd.DataFrame, end_date: str, min_months: int = 180, max_mon
     return df
 #================================================================================================
 def _normalize_text_series(s: pd.Series) -> pd.Series:
-    s = s.astype(str).str.lower().str.strip().str.replace(r"\s+", " ", regex=True)
-    return s.apply(lambda x: unicodedata.normalize("NFKD", x).encode("ascii","ignore").decode("ascii"))
+    # Normalisation sur les valeurs distinctes uniquement, puis réindexation par code
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    u = pd.Series(uniques, dtype=object).map(str).str.lower().str.strip().str.replace(r"\s+", " ", regex=True)
+    u = u.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+    return pd.Series(u.to_numpy()[codes], index=s.index, dtype=object)
+
+#================================================================================================
+# MOTEUR FUZZY PAR BLOCS (blocking + rapidfuzz.cdist)
+#================================================================================================
+
+# Nombre max de cellules (lignes x colonnes) d'une matrice de scores cdist (~80 Mo en float32)
+FUZZY_MAX_CELLS = int(os.getenv("CARIS_FUZZY_MAX_CELLS", "20000000"))
 
-def _similar(a: str, b: str) -> float:
-    return 100.0 * SequenceMatcher(None, a, b).ratio()
+_SOUNDEX_TABLE = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+
+def _phonetic_key(value: str, length: int = 4) -> str:
+    """
+    Clé phonétique de type Soundex du premier mot (ex. 'jean pierre' -> 'j500').
+    Les voyelles séparent deux consonnes de même code ; h/w sont transparents.
+    """
+    word = re.sub(r"[^a-z ]", "", value).strip().split(" ")[0]
+    if not word:
+        return ""
+    codes = word.translate(_SOUNDEX_TABLE)
+    key, prev = word[0], codes[0]
+    for ch in codes[1:]:
+        if ch in "hw":
+            continue
+        if ch.isdigit() and ch != prev:
+            key += ch
+            if len(key) == length:
+                break
+        prev = ch
+    return key.ljust(length, "0")
+
+def _blocking_keys(df: pd.DataFrame, df_cmp: pd.DataFrame, colonnes: List[str],
+                   block_on: Optional[List[str]], phonetic_block: bool) -> pd.Series:
+    """
+    Clé de bloc par ligne : valeurs exactes (normalisées) de `block_on`
+    + clé phonétique de la première colonne comparée si `phonetic_block`.
+    Seules les lignes d'un même bloc sont comparées entre elles.
+    """
+    parts = [_normalize_text_series(df[c]) for c in (block_on or [])]
+    if phonetic_block:
+        first = df_cmp[colonnes[0]]
+        keys = {v: _phonetic_key(v) for v in first.unique()}
+        parts.append(first.map(keys))
+    if not parts:
+        return pd.Series("", index=df.index, dtype=object)
+    return parts[0].str.cat(parts[1:], sep="|") if len(parts) > 1 else parts[0]
+
+def _blocking_codes(df: pd.DataFrame, df_cmp: pd.DataFrame, colonnes: List[str],
+                    block_on: Optional[List[str]], phonetic_block: bool) -> np.ndarray:
+    """Code entier de bloc par ligne (voir _blocking_keys)."""
+    codes, _ = pd.factorize(_blocking_keys(df, df_cmp, colonnes, block_on, phonetic_block))
+    return codes
+
+def _fuzzy_block_pairs(cols: List[np.ndarray], members: np.ndarray, threshold: float, scorer):
+    """
+    Paires (i, j), i < j, d'un bloc dont le score minimal sur toutes les colonnes
+    atteint `threshold`. Scores calculés par rapidfuzz.cdist (multi-cœurs),
+    par tranches de lignes pour borner la mémoire.
+    """
+    m = len(members)
+    step = max(1, FUZZY_MAX_CELLS // m)
+    for start in range(0, m, step):
+        rows = members[start:start + step]
+        ok = None
+        for values in cols:
+            scores = process.cdist(values[rows], values[members], scorer=scorer,
+                                   score_cutoff=threshold, workers=-1)
+            ok = scores >= threshold if ok is None else ok & (scores >= threshold)
+            if not ok.any():
+                break
+        # Triangle supérieur : ne garder que j > i (position globale dans le bloc)
+        ok = np.triu(ok, k=start + 1)
+        ii, jj = np.nonzero(ok)
+        if len(ii):
+            yield rows[ii], members[jj]
 
 def detect_duplicates_with_groups(
     df: pd.DataFrame,
     colonnes: List[str],
     threshold: int = 100,
     return_only_duplicates: int = 1,   # 0=uniques, 1=doublons, 2=tous
-    keep_most_na: bool = False
+    keep_most_na: bool = False,
+    block_on: Optional[List[str]] = None,
+    phonetic_block: bool = False,
+    scorer=None
 ) -> pd.DataFrame:
     """
     Détecte des doublons (stricts si threshold=100, sinon fuzzy) sur `colonnes`,
@@ -1056,6 +1629,15 @@ def detect_duplicates_with_groups(
         2 => retourner toutes les lignes (uniques + doublons)
     keep_most_na : si True, dans chaque groupe de doublons, ne garder qu'un 
                    enregistrement (celui avec le plus de N/A) puis appliquer le mode
+    block_on : (fuzzy) colonnes de blocage comparées à l'identique, ex. ["office", "annee_naissance"]
+               (sans perte si ces colonnes font partie de `colonnes` et qu'une différence
+               de valeur suffit à passer sous `threshold`)
+    phonetic_block : (fuzzy) bloquer aussi sur la clé phonétique de colonnes[0] (le nom).
+                     Plus rapide, mais une faute sur la première lettre ou une consonne du premier mot
+                     change la clé, donc le bloc : 75 à 90% seulement des paires de la comparaison
+                     exhaustive retrouvées selon l'échantillon (others/benchmark_dedup.py).
+                     Désactivé par défaut.
+    scorer : (fuzzy) scorer rapidfuzz, par défaut fuzz.ratio (équivalent de SequenceMatcher.ratio)
 
     Returns
     -------
@@ -1081,15 +1663,15 @@ def detect_duplicates_with_groups(
     for c in colonnes:
         df_cmp[c] = _normalize_text_series(df_cmp[c])
 
-    # 2) Cas strict (exact)
+    # 2) Cas strict (exact) : hash 64 bits par ligne des colonnes normalisées
     if threshold >= 100:
-        keys = df_cmp.apply(lambda r: tuple(r.values.tolist()), axis=1)
-        codes, _ = pd.factorize(keys, sort=True)
-        sizes = pd.Series(codes).map(pd.Series(pd.Series(codes).value_counts()))
-        group_id = np.where(sizes.values >= 2, codes + 1, 0)
+        keys = pd.util.hash_pandas_object(df_cmp, index=False).to_numpy()
+        codes, _ = pd.factorize(keys)
+        sizes = np.bincount(codes)[codes]
+        group_id = np.where(sizes >= 2, codes + 1, 0)
         out = df.copy()
         out["duplicate_group_id"] = group_id
-        out["duplicate_group_size"] = np.where(group_id > 0, sizes.values, 1)
+        out["duplicate_group_size"] = np.where(group_id > 0, sizes, 1)
 
         if keep_most_na:
             return _process_keep_most_na(out, return_mode=return_only_duplicates)
@@ -1102,7 +1684,13 @@ def detect_duplicates_with_groups(
         else:
             return out.reset_index(drop=True)
 
-    # 3) Cas fuzzy : union-find
+    # 3) Cas fuzzy : blocs -> paires candidates (cdist vectorisé) -> union-find
+    if block_on:
+        manquantes = [c for c in block_on if c not in df.columns]
+        if manquantes:
+            raise ValueError(f"Colonnes de blocage manquantes dans df: {manquantes}")
+    scorer = scorer or fuzz.ratio
+
     parent = list(range(n))
     def find(x):
         while parent[x] != x:
@@ -1114,19 +1702,15 @@ def detect_duplicates_with_groups(
         if ra != rb:
             parent[rb] = ra
 
-    vals = df_cmp.values.astype(str)
-    for i in range(n):
-        vi = vals[i]
-        for j in range(i+1, n):
-            vj = vals[j]
-            smin = 100.0
-            for k in range(len(colonnes)):
-                s = _similar(vi[k], vj[k])
-                if s < smin:
-                    smin = s
-                if smin < threshold:
-                    break
-            if smin >= threshold:
+    cols = [df_cmp[c].to_numpy(dtype=object) for c in colonnes]
+    blocks = _blocking_codes(df, df_cmp, colonnes, block_on, phonetic_block)
+    order = np.argsort(blocks, kind="stable")
+    bounds = np.flatnonzero(np.diff(blocks[order])) + 1
+    for members in np.split(order, bounds):
+        if len(members) < 2:
+            continue
+        for left, right in _fuzzy_block_pairs(cols, members, threshold, scorer):
+            for i, j in zip(left.tolist(), right.tolist()):
                 union(i, j)
 
     roots = [find(i) for i in range(n)]
@@ -1228,6 +1812,244 @@ def _process_keep_most_na(df_with_groups: pd.DataFrame, return_mode: int = 1) ->
 
     return result
 #=================================================================================================
+# INDEX D'IDENTITÉ PERSISTANT (dédoublonnage incrémental entre exécutions)
+#=================================================================================================
+IDENTITY_INDEX_DIR = Path(os.environ.get("CARIS_IDENTITY_INDEX_DIR") or Path(__file__).resolve().parent.parent / "data" / ".identity_index")
+
+
+def _identity_paths(index_name: str):
+    base = IDENTITY_INDEX_DIR / index_name
+    return base / "records.parquet", base / "pairs.parquet", base / "state.json"
+
+
+def _load_identity_pairs(pairs_path: Path) -> pd.DataFrame:
+    if pairs_path.exists():
+        # clés en objets Python : isin() sur des chaînes Arrow est très lent
+        return pd.read_parquet(pairs_path).astype({"key_a": object, "key_b": object, "source": object})
+    return pd.DataFrame({"key_a": pd.Series(dtype=object), "key_b": pd.Series(dtype=object),
+                         "source": pd.Series(dtype=object)})
+
+
+def _write_identity_parquet(df: pd.DataFrame, path: Path) -> None:
+    """Écriture atomique (tmp + os.replace) : un arrêt en cours d'écriture ne corrompt pas l'index."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _write_identity_state(state: dict, path: Path) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _ordered_pairs(a, b, source: str) -> pd.DataFrame:
+    """Paires non orientées (key_a < key_b), sans doublon ni boucle."""
+    a, b = np.asarray(a, dtype=object), np.asarray(b, dtype=object)
+    lo, hi = np.where(a < b, a, b), np.where(a < b, b, a)
+    pairs = pd.DataFrame({"key_a": lo, "key_b": hi, "source": source})
+    return pairs[pairs["key_a"] != pairs["key_b"]].drop_duplicates(subset=["key_a", "key_b"])
+
+
+def confirm_duplicate_pairs(index_name: str, pairs: pd.DataFrame,
+                            col_a: str = "caseid_a", col_b: str = "caseid_b") -> int:
+    """
+    Enregistre des paires de doublons confirmées manuellement (ex. issues de la revue
+    de input/doublons_identifies.xlsx). Elles sont conservées d'une exécution à
+    l'autre et fusionnent les groupes au prochain update_identity_index.
+
+    Returns:
+        int: nombre de paires manuelles dans l'index
+    """
+    _, pairs_path, _ = _identity_paths(index_name)
+    pairs_path.parent.mkdir(parents=True, exist_ok=True)
+    new = _ordered_pairs(pairs[col_a].astype(str), pairs[col_b].astype(str), "manual")
+    stored = _load_identity_pairs(pairs_path)
+    merged = pd.concat([stored, new], ignore_index=True)
+    # une confirmation manuelle prime sur une paire détectée automatiquement
+    merged["_rank"] = (merged["source"] == "manual").astype(int)
+    merged = (merged.sort_values("_rank").drop_duplicates(subset=["key_a", "key_b"], keep="last")
+              .drop(columns="_rank").reset_index(drop=True))
+    _write_identity_parquet(merged, pairs_path)
+    n_manual = int((merged["source"] == "manual").sum())
+    print(f"✅ {index_name}: {len(new)} paire(s) confirmée(s), {n_manual} au total")
+    return n_manual
+
+
+def duplicate_pairs_from_list(df: pd.DataFrame, listed_keys, match_on: List[str],
+                              key_col: str = "caseid") -> pd.DataFrame:
+    """
+    Paires confirmées à partir d'une liste manuelle de doublons (ex. feuille « doublons » de
+    input/liste_muso.xlsx, qui ne donne que le caseid à écarter) : chaque caseid listé est
+    apparié aux autres enregistrements de `df` de mêmes valeurs normalisées sur `match_on`.
+
+    Returns:
+        DataFrame (caseid_a, caseid_b) à passer à confirm_duplicate_pairs
+    """
+    keyed = pd.DataFrame({"key": df[key_col].astype(str).to_numpy()})
+    keyed["match"] = pd.DataFrame({c: _normalize_text_series(df[c]).to_numpy() for c in match_on}).agg("|".join, axis=1)
+    listed = keyed[keyed["key"].isin(pd.Series(listed_keys).dropna().astype(str))]
+    pairs = listed.merge(keyed, on="match", suffixes=("_a", "_b"))
+    pairs = pairs[pairs["key_a"] != pairs["key_b"]]
+    return pd.DataFrame({"caseid_a": pairs["key_a"].to_numpy(), "caseid_b": pairs["key_b"].to_numpy()})
+
+
+def update_identity_index(
+    df: pd.DataFrame,
+    index_name: str,
+    colonnes: List[str],
+    key_col: str = "caseid",
+    threshold: int = 95,
+    block_on: Optional[List[str]] = None,
+    phonetic_block: bool = False,
+    scorer=None,
+    return_only_duplicates: int = 1,
+    rebuild: bool = False
+) -> pd.DataFrame:
+    """
+    Dédoublonnage incrémental : seuls les `key_col` nouveaux ou modifiés (sur les
+    colonnes comparées / de blocage) sont comparés, bloc par bloc, à l'index stocké
+    dans IDENTITY_INDEX_DIR/<index_name>. Le coût dépend du volume de changements
+    du jour, pas de la taille cumulée de la cohorte.
+
+    L'index conserve :
+      - records.parquet : clé, colonnes normalisées, clé de bloc, empreinte, identity_id
+      - pairs.parquet   : paires de doublons (source 'auto' ou 'manual')
+      - state.json      : configuration, prochain identifiant, compteurs
+
+    Les identity_id sont stables : un groupe garde le plus petit identifiant déjà
+    attribué à l'un de ses membres. Changer `colonnes`, `block_on`, `phonetic_block`
+    ou `threshold` (ou rebuild=True) reconstruit l'index (les paires manuelles restent).
+
+    Returns:
+        DataFrame au format de detect_duplicates_with_groups
+        (duplicate_group_id = identity_id si groupe >= 2, sinon 0 ; duplicate_group_size),
+        filtré selon `return_only_duplicates` (0 uniques, 1 doublons, 2 tous)
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if return_only_duplicates not in (0, 1, 2):
+        raise ValueError("return_only_duplicates doit être 0, 1 ou 2.")
+    manquantes = [c for c in [key_col, *colonnes, *(block_on or [])] if c not in df.columns]
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans df: {manquantes}")
+    scorer = scorer or fuzz.ratio
+
+    records_path, pairs_path, state_path = _identity_paths(index_name)
+    records_path.parent.mkdir(parents=True, exist_ok=True)
+    config = {"colonnes": list(colonnes), "block_on": list(block_on or []),
+              "phonetic_block": phonetic_block, "threshold": threshold}
+
+    state = {}
+    if state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    if rebuild or state.get("config") != config or not records_path.exists():
+        if state:
+            print(f"♻️ {index_name}: reconstruction de l'index")
+        old = pd.DataFrame(columns=["key", "fingerprint", "identity_id"])
+        state = {"next_id": state.get("next_id", 1)}
+    else:
+        old = pd.read_parquet(records_path).astype({"key": object})
+
+    # 1) Enregistrements courants : colonnes normalisées, bloc et empreinte
+    cur_src = df.drop_duplicates(subset=[key_col], keep="last")
+    cmp_cols = [f"cmp_{i}" for i in range(len(colonnes))]
+    cur = pd.DataFrame({"key": pd.Series(cur_src[key_col].astype(str).to_numpy(), dtype=object)})
+    df_cmp = pd.DataFrame({c: _normalize_text_series(cur_src[c]) for c in colonnes})
+    for c, col in zip(cmp_cols, colonnes):
+        cur[c] = df_cmp[col].to_numpy()
+    cur["block"] = _blocking_keys(cur_src, df_cmp, colonnes, block_on, phonetic_block).to_numpy()
+    cur["fingerprint"] = pd.util.hash_pandas_object(cur[cmp_cols + ["block"]], index=False).to_numpy()
+
+    # 2) Nouveaux ou modifiés depuis la dernière exécution
+    # comparaison en objets Python : un map avec manquants passerait les hash uint64 en float64
+    prev = old.set_index("key")["fingerprint"].astype(object)
+    changed = (cur["fingerprint"].astype(object) != cur["key"].map(prev)).to_numpy(dtype=bool)
+    removed = ~old["key"].isin(cur["key"]).to_numpy()
+    print(f"🔎 {index_name}: {int(changed.sum())} nouveau(x)/modifié(s), "
+          f"{int(removed.sum())} retiré(s), {len(cur) - int(changed.sum())} inchangé(s)")
+
+    # 3) Paires : on garde les manuelles et les auto entre enregistrements inchangés
+    pairs = _load_identity_pairs(pairs_path)
+    stale = set(cur.loc[changed, "key"]) | set(old.loc[removed, "key"])
+    pairs = pairs[(pairs["source"] == "manual") |
+                  ~(pairs["key_a"].isin(stale) | pairs["key_b"].isin(stale))]
+
+    # 4) Comparaison des seuls enregistrements modifiés avec leur bloc
+    new_a, new_b = [], []
+    if changed.any():
+        keys = cur["key"].to_numpy(dtype=object)
+        cols = [cur[c].to_numpy(dtype=object) for c in cmp_cols]
+        block_codes, _ = pd.factorize(cur["block"])
+        touched = np.isin(block_codes, np.unique(block_codes[changed]))
+        order = np.flatnonzero(touched)[np.argsort(block_codes[touched], kind="stable")]
+        bounds = np.flatnonzero(np.diff(block_codes[order])) + 1
+        for members in np.split(order, bounds):
+            queries = members[changed[members]]
+            if len(members) < 2 or len(queries) == 0:
+                continue
+            step = max(1, FUZZY_MAX_CELLS // len(members))
+            for start in range(0, len(queries), step):
+                rows = queries[start:start + step]
+                ok = None
+                for values in cols:
+                    sc = process.cdist(values[rows], values[members], scorer=scorer,
+                                       score_cutoff=threshold, workers=-1)
+                    ok = sc >= threshold if ok is None else ok & (sc >= threshold)
+                    if not ok.any():
+                        break
+                ii, jj = np.nonzero(ok)
+                new_a.append(keys[rows[ii]])
+                new_b.append(keys[members[jj]])
+    if new_a:
+        new_pairs = _ordered_pairs(np.concatenate(new_a), np.concatenate(new_b), "auto")
+        pairs = pd.concat([pairs, new_pairs], ignore_index=True).drop_duplicates(subset=["key_a", "key_b"])
+
+    # 5) Composantes connexes sur toutes les paires connues
+    pos = pd.Series(np.arange(len(cur)), index=cur["key"])
+    live = pairs[pairs["key_a"].isin(pos.index) & pairs["key_b"].isin(pos.index)]
+    a, b = pos[live["key_a"]].to_numpy(), pos[live["key_b"]].to_numpy()
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(len(cur), len(cur)))
+    _, comp = connected_components(graph, directed=False)
+
+    # 6) Identifiants stables : plus petit identity_id existant du groupe, sinon nouveau
+    cur["identity_id"] = cur["key"].map(old.set_index("key")["identity_id"]).to_numpy()
+    comp_id = pd.Series(cur["identity_id"].to_numpy(), dtype="float64").groupby(comp).min()
+    reuse = comp_id.notna() & ~comp_id.duplicated(keep="first")
+    next_id = int(state.get("next_id", 1))
+    fresh = comp_id.index[~reuse]
+    comp_id[~reuse] = np.arange(next_id, next_id + len(fresh))
+    next_id += len(fresh)
+    cur["identity_id"] = comp_id.astype("int64").to_numpy()[comp]
+    sizes = np.bincount(comp)[comp]
+
+    # records et paires d'abord, state en dernier : un state à jour implique un index complet
+    _write_identity_parquet(cur, records_path)
+    _write_identity_parquet(pairs, pairs_path)
+    state.update(config=config, next_id=next_id, rows=len(cur), pairs=len(pairs),
+                 last_changed=int(changed.sum()), updated_at=datetime.now().isoformat(timespec="seconds"))
+    _write_identity_state(state, state_path)
+
+    # 7) Restitution au format detect_duplicates_with_groups
+    by_key = pd.DataFrame({"gid": np.where(sizes >= 2, cur["identity_id"], 0),
+                           "size": np.where(sizes >= 2, sizes, 1)}, index=cur["key"])
+    keys = df[key_col].astype(str)
+    out = df.copy()
+    out["duplicate_group_id"] = keys.map(by_key["gid"]).to_numpy()
+    out["duplicate_group_size"] = keys.map(by_key["size"]).to_numpy()
+    n_dup = int((out["duplicate_group_id"] > 0).sum())
+    print(f"✅ {index_name}: {n_dup} enregistrement(s) en doublon, {len(pairs)} paire(s) dans l'index")
+
+    if return_only_duplicates == 0:
+        return out[out["duplicate_group_id"] == 0].reset_index(drop=True)
+    elif return_only_duplicates == 1:
+        return out[out["duplicate_group_id"] > 0].reset_index(drop=True)
+    else:
+        return out.reset_index(drop=True)
+#=================================================================================================
 from openpyxl import load_workbook
 from openpyxl.utils.cell import range_boundaries
 from pathlib import Path
@@ -1618,21 +2440,684 @@ def compute_nut_filtered(
     return nut_filtered, stats
 
 #=================================================================================================
-def execute_sql_query(env_path: str, sql_file_path: str) -> pd.DataFrame:
-    load_dotenv(env_path)
-    user = os.getenv('MYSQL_USER')
-    password = os.getenv('MYSQL_PASSWORD')
-    host = os.getenv('MYSQL_HOST')
-    db = os.getenv('MYSQL_DB')
+# MOTEUR SQL PARTAGÉ
+# Un engine SQLAlchemy par base, créé une seule fois par processus et partagé par tous les
+# extraits (utils, caris_fonctions, ptme_fonction, executor, ptme_pipeline) :
+# - pool de connexions réutilisées entre requêtes (plus de handshake TCP/TLS par extrait)
+# - pool_pre_ping : les connexions coupées par le serveur sont détectées et remplacées
+# - thread-safe : plusieurs extraits indépendants peuvent tourner en parallèle
+#=================================================================================================
+import atexit
+import threading
+from concurrent.futures import as_completed
+
+SQL_POOL_SIZE = int(os.getenv("CARIS_SQL_POOL_SIZE", "5"))
+SQL_MAX_OVERFLOW = int(os.getenv("CARIS_SQL_MAX_OVERFLOW", "5"))
+SQL_POOL_RECYCLE = int(os.getenv("CARIS_SQL_POOL_RECYCLE", "1800"))
+_SQL_ENGINES = {}
+_SQL_ENGINES_LOCK = Lock()
+
+
+def mysql_uri(db_config: Optional[dict] = None, env_path: Optional[str] = None) -> str:
+    """
+    URI MySQL à partir d'un db_config {'user','password','host','database'}
+    ou, à défaut, des variables MYSQL_* (chargées depuis env_path si fourni).
+    """
+    if db_config is None:
+        if env_path:
+            load_dotenv(env_path)
+        db_config = {
+            "user": os.getenv("MYSQL_USER"),
+            "password": os.getenv("MYSQL_PASSWORD"),
+            "host": os.getenv("MYSQL_HOST"),
+            "database": os.getenv("MYSQL_DB"),
+        }
+    return (f"mysql+pymysql://{db_config['user']}:{db_config['password']}"
+            f"@{db_config['host']}/{db_config['database']}")
+
+
+def get_engine(db_uri: Optional[str] = None, db_config: Optional[dict] = None,
+               env_path: Optional[str] = None):
+    """
+    Engine partagé pour une base (une instance par URI et par processus).
+    Taille du pool : CARIS_SQL_POOL_SIZE / CARIS_SQL_MAX_OVERFLOW.
+    """
+    uri = db_uri or mysql_uri(db_config, env_path)
+    with _SQL_ENGINES_LOCK:
+        engine = _SQL_ENGINES.get(uri)
+        if engine is None:
+            options = {"pool_pre_ping": True}
+            if not uri.startswith("sqlite"):
+                options.update(pool_size=SQL_POOL_SIZE, max_overflow=SQL_MAX_OVERFLOW,
+                               pool_recycle=SQL_POOL_RECYCLE)
+            engine = create_engine(uri, **options)
+            _SQL_ENGINES[uri] = engine
+    return engine
+
+
+#=================================================================================================
+# CACHE DE RÉSULTATS SQL (sur demande)
+# Clé = version du cache + base (URI sans mot de passe) + SQL normalisé + paramètres liés.
+# Désactivé par défaut : run_query(..., cache_ttl=N) ou CARIS_SQL_CACHE_TTL=N (secondes) l'active.
+# Charge utile en Parquet, un fichier par clé : âge = date de modification, dernier usage = date
+# d'accès (posée explicitement à chaque lecture). Pas d'index partagé : plusieurs processus peuvent
+# lire, écrire et évincer en même temps. Éviction LRU au-delà de CARIS_SQL_CACHE_MAX_MB.
+# CARIS_SQL_CACHE_BYPASS=1 (ou refresh=True) force la requête.
+#=================================================================================================
+SQL_CACHE_DIR = Path(os.environ.get("CARIS_SQL_CACHE_DIR") or Path(__file__).resolve().parent.parent / "data" / ".sql_cache")
+SQL_CACHE_TTL = int(os.getenv("CARIS_SQL_CACHE_TTL", "0"))
+SQL_CACHE_MAX_MB = int(os.getenv("CARIS_SQL_CACHE_MAX_MB", "500"))
+SQL_CACHE_BYPASS = os.getenv("CARIS_SQL_CACHE_BYPASS", "0") in {"1", "true", "yes"}
+SQL_CACHE_VERSION = 1  # à incrémenter si le format des résultats change
+SQL_CACHE_SUFFIXES = (".parquet", ".pkl")
+
+# Littéraux conservés tels quels ; commentaires supprimés ; blancs réduits à un espace
+_SQL_TOKEN_RE = re.compile(
+    r"(?P<lit>'(?:''|\\.|[^'\\])*'|\"(?:\"\"|\\.|[^\"\\])*\"|`[^`]*`)"
+    r"|(?P<gap>(?:\s+|--[^\n]*|#[^\n]*|/\*.*?\*/)+)",
+    re.DOTALL,
+)
+
+
+def normalize_sql(sql) -> str:
+    """Texte SQL canonique : sans commentaires, blancs compactés, sans ';' final."""
+    text_sql = _SQL_TOKEN_RE.sub(lambda m: m.group("lit") or " ", str(sql))
+    return text_sql.strip().rstrip(";").strip()
+
+
+def _sql_cache_key(sql, engine, params) -> str:
+    db = engine.url.render_as_string(hide_password=True)
+    payload = json.dumps(params, sort_keys=True, default=str) if params is not None else ""
+    return hashlib.sha1(f"v{SQL_CACHE_VERSION}\n{db}\n{normalize_sql(sql)}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def _sql_cache_files():
+    """Fichiers de résultats présents (os.DirEntry) ; les .tmp en cours d'écriture sont ignorés."""
+    try:
+        with os.scandir(SQL_CACHE_DIR) as it:
+            return [e for e in it if e.is_file() and e.name.endswith(SQL_CACHE_SUFFIXES)]
+    except FileNotFoundError:
+        return []
+
+
+def _sql_cache_get(key: str, ttl: int) -> Optional[pd.DataFrame]:
+    for suffix in SQL_CACHE_SUFFIXES:
+        path = SQL_CACHE_DIR / f"{key}{suffix}"
+        try:
+            st = path.stat()
+            if time.time() - st.st_mtime > ttl:
+                return None
+            # Dernier usage pour l'éviction LRU (indépendant de l'option noatime du disque)
+            os.utime(path, (time.time(), st.st_mtime))
+            return pd.read_parquet(path) if suffix == ".parquet" else pd.read_pickle(path)
+        except FileNotFoundError:
+            # absent, ou évincé par un autre processus entre-temps
+            continue
+    return None
+
+
+def _sql_cache_put(key: str, df: pd.DataFrame, ttl: int) -> None:
+    SQL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    target = SQL_CACHE_DIR / f"{key}.parquet"
+    tmp = SQL_CACHE_DIR / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(tmp, index=False)
+    except Exception:
+        # types non gérés par Arrow (Decimal mixtes, objets) : pickle à l'identique
+        target = SQL_CACHE_DIR / f"{key}.pkl"
+        df.to_pickle(tmp)
+    os.replace(tmp, target)
+    # Une seule copie par clé : l'autre format d'une version précédente est retiré
+    for suffix in SQL_CACHE_SUFFIXES:
+        if suffix != target.suffix:
+            (SQL_CACHE_DIR / f"{key}{suffix}").unlink(missing_ok=True)
+    _evict_sql_cache(ttl)
+
+
+def _evict_sql_cache(ttl: int) -> None:
+    """
+    Supprime les résultats expirés puis les moins récemment utilisés au-delà de SQL_CACHE_MAX_MB,
+    d'après un parcours du dossier (sans état partagé entre processus).
+    """
+    now = time.time()
+    entries = []
+    for e in _sql_cache_files():
+        try:
+            st = e.stat()
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime > ttl:
+            Path(e.path).unlink(missing_ok=True)
+        else:
+            entries.append((st.st_atime, st.st_size, e.path))
+    budget = SQL_CACHE_MAX_MB * 1024 * 1024
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        Path(path).unlink(missing_ok=True)
+        total -= size
+
+
+def clear_sql_cache() -> int:
+    """Vide le cache de résultats SQL. Returns: nombre de fichiers supprimés."""
+    removed = 0
+    if SQL_CACHE_DIR.exists():
+        for p in SQL_CACHE_DIR.iterdir():
+            if p.is_file():
+                p.unlink(missing_ok=True)
+                removed += 1
+    return removed
+
+
+def run_query(sql, db_uri: Optional[str] = None, db_config: Optional[dict] = None,
+              env_path: Optional[str] = None, params=None,
+              cache_ttl: Optional[int] = None, refresh: bool = False) -> pd.DataFrame:
+    """
+    Exécute une requête sur une connexion empruntée au pool partagé et renvoie un DataFrame.
+    La connexion est rendue au pool (pas fermée) à la fin.
+
+    Le résultat est servi depuis le cache s'il a moins de `cache_ttl` secondes
+    (défaut CARIS_SQL_CACHE_TTL, 0 : pas de cache). À réserver aux requêtes dont un résultat
+    un peu ancien est acceptable. refresh=True ignore le cache et le met à jour.
+    """
+    engine = get_engine(db_uri, db_config, env_path)
+    ttl = SQL_CACHE_TTL if cache_ttl is None else cache_ttl
+    key = _sql_cache_key(sql, engine, params) if ttl > 0 else None
+    if key and not (refresh or SQL_CACHE_BYPASS):
+        cached = _sql_cache_get(key, ttl)
+        if cached is not None:
+            print(f"♻️ Résultat SQL servi depuis le cache ({len(cached):,} lignes)")
+            return cached
+    with engine.connect() as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    if key:
+        _sql_cache_put(key, df, ttl)
+    return df
 
-    conn_text = f'mysql+pymysql://{user}:{password}@{host}/{db}'
-    engine = create_engine(conn_text)
 
+def fetch_text_cached(url: str, headers: Optional[dict] = None, timeout: int = 30) -> str:
+    """
+    Télécharge un texte (ex. SQL hébergé sur un gist) avec revalidation ETag / Last-Modified :
+    le corps n'est re-téléchargé que s'il a changé (sinon réponse 304) ; en cas d'erreur
+    réseau, la dernière copie connue est renvoyée.
+    """
+    meta_path = SQL_CACHE_DIR / "http" / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+    cached = None
+    if meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+
+    headers = dict(headers or {})
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        r = requests.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304 and cached:
+            print("♻️ Texte distant inchangé (304), copie locale utilisée")
+            return cached["body"]
+        r.raise_for_status()
+    except requests.RequestException as e:
+        if cached:
+            print(f"⚠️ Téléchargement impossible ({e}), copie locale utilisée")
+            return cached["body"]
+        raise
+
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = meta_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+                   "fetched_at": datetime.now().isoformat(timespec="seconds"), "body": r.text}, f)
+    os.replace(tmp_path, meta_path)
+    return r.text
+
+
+def dispose_engines() -> None:
+    """Ferme toutes les connexions des engines partagés (appelé automatiquement en fin de processus)."""
+    with _SQL_ENGINES_LOCK:
+        for engine in _SQL_ENGINES.values():
+            engine.dispose()
+        _SQL_ENGINES.clear()
+
+
+atexit.register(dispose_engines)
+
+
+def run_extracts(extracts: dict, max_workers: Optional[int] = None):
+    """
+    Lance des extraits indépendants en parallèle (pool de threads borné, connexions du
+    pool partagé) et collecte les DataFrames au fil de l'eau avec la latence de chaque requête.
+
+    Args:
+        extracts: {nom: fonction sans argument renvoyant un DataFrame}
+        max_workers: extraits en vol simultanément (défaut : CARIS_SQL_POOL_SIZE)
+
+    Returns:
+        (résultats {nom: DataFrame}, latences {nom: secondes}) ; un extrait en erreur
+        renvoie un DataFrame vide.
+    """
+    max_workers = max(1, min(max_workers or SQL_POOL_SIZE, len(extracts) or 1))
+    results, timings = {}, {}
+    t_start = time.perf_counter()
+
+    def _timed(fn):
+        t0 = time.perf_counter()
+        try:
+            return fn(), time.perf_counter() - t0, None
+        except Exception as e:
+            return pd.DataFrame(), time.perf_counter() - t0, e
+
+    print(f"🚀 {len(extracts)} extraits SQL en parallèle ({max_workers} connexions)...")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_timed, fn): name for name, fn in extracts.items()}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            df, elapsed, error = fut.result()
+            results[name], timings[name] = df, elapsed
+            if error is not None:
+                print(f"❌ {name} : erreur après {elapsed:.1f}s — {error}")
+            else:
+                print(f"⏱️ {name} : {len(df):,} lignes en {elapsed:.1f}s")
+    total = time.perf_counter() - t_start
+    print(f"✅ Extraits terminés en {total:.1f}s (somme des requêtes : {sum(timings.values()):.1f}s)")
+    return results, timings
+
+
+def read_sql_file(sql_file_path: str) -> str:
+    """Texte d'un fichier sql/*.sql, sans l'instruction `use caris_db;`."""
     with open(sql_file_path, 'r') as file:
-        sql_query = file.read().replace('use caris_db;', '')
+        return file.read().replace('use caris_db;', '')
+
+
+#=================================================================================================
+# REQUÊTES SQL PARAMÉTRÉES
+# Les modèles (sql/*.sql, requêtes par défaut des extraits) sont compilés une seule fois en
+# objets text() à paramètres liés : les dates ne sont plus collées dans le texte, qui reste
+# identique d'une fenêtre à l'autre (cache de compilation SQLAlchemy de l'engine partagé,
+# cache de résultats, statistiques serveur par requête). Syntaxes de paramètres acceptées :
+#   :start_date (natif)   @start_date (variable MySQL)   {start_date} (ancien str.format)
+# Les instructions `SET @x = littéral;` deviennent les valeurs par défaut des paramètres et
+# `USE base;` est retiré : il ne reste qu'une seule instruction SELECT.
+#=================================================================================================
+from sqlalchemy import text as sql_text
+
+SQL_DIR = Path(os.environ.get("CARIS_SQL_DIR") or Path(__file__).resolve().parent.parent / "sql")
+_SQL_COMPILED = {}
+_SQL_COMPILED_LOCK = Lock()
+
+_SQL_PARAM_RE = re.compile(
+    r"(?P<lit>'(?:''|\\.|[^'\\])*'|\"(?:\"\"|\\.|[^\"\\])*\"|`[^`]*`)"
+    r"|(?P<comment>--[^\n]*|#[^\n]*|/\*.*?\*/)"
+    r"|(?P<set>\bSET\s+@(?P<set_name>\w+)\s*:?=\s*(?P<set_value>'[^']*'|-?\d+(?:\.\d+)?)\s*;)"
+    r"|(?P<use>\bUSE\s+`?\w+`?\s*;)"
+    r"|(?P<sysvar>@@\w+)"
+    r"|@(?P<var>\w+)"
+    r"|\{(?P<fmt>\w+)\}",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def _sql_literal_value(raw: str):
+    """Valeur Python d'un littéral SET (chaîne entre quotes ou nombre)."""
+    if raw.startswith("'"):
+        return raw[1:-1]
+    return float(raw) if "." in raw else int(raw)
+
+
+def compile_sql(sql: str):
+    """
+    Compile un modèle SQL en (TextClause, valeurs par défaut des paramètres).
+    Le résultat est mis en cache sur le texte : un même modèle donne toujours le même objet.
+    """
+    with _SQL_COMPILED_LOCK:
+        compiled = _SQL_COMPILED.get(sql)
+    if compiled is not None:
+        return compiled
+
+    defaults = {}
+
+    def _sub(m):
+        if m.group("lit") or m.group("comment"):
+            # ':' échappé pour que text() ne voie pas de paramètre dans '12:30' ou un commentaire
+            return (m.group("lit") or m.group("comment")).replace(":", "\\:")
+        if m.group("set"):
+            defaults[m.group("set_name")] = _sql_literal_value(m.group("set_value"))
+            return ""
+        if m.group("use"):
+            return ""
+        if m.group("sysvar"):
+            return m.group("sysvar")
+        return ":" + (m.group("var") or m.group("fmt"))
+
+    body = _SQL_PARAM_RE.sub(_sub, sql).strip().rstrip(";").strip()
+    compiled = (sql_text(body), defaults)
+    with _SQL_COMPILED_LOCK:
+        compiled = _SQL_COMPILED.setdefault(sql, compiled)
+    return compiled
+
+
+def prepare_sql(sql: str, **params):
+    """
+    (requête compilée, paramètres liés) prêts pour run_query / stream_query_to_parquet.
+    `params` remplace les valeurs par défaut issues des `SET @x` du modèle ; les paramètres
+    inconnus du modèle sont ignorés, un paramètre sans valeur lève ValueError.
+    """
+    statement, defaults = compile_sql(sql)
+    names = set(statement._bindparams)
+    bound = {k: v for k, v in {**defaults, **params}.items() if k in names}
+    missing = sorted(names - set(bound))
+    if missing:
+        raise ValueError(f"Paramètres SQL manquants : {', '.join(missing)}")
+    return statement, bound
+
+
+def load_sql(name: str, **params):
+    """prepare_sql sur un modèle du dossier sql/ (CARIS_SQL_DIR), lu une seule fois par version du fichier."""
+    path = Path(name) if Path(name).is_absolute() or Path(name).exists() else SQL_DIR / name
+    stat = path.stat()
+    cache_key = ("file", str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    with _SQL_COMPILED_LOCK:
+        sql = _SQL_COMPILED.get(cache_key)
+    if sql is None:
+        sql = read_sql_file(str(path))
+        with _SQL_COMPILED_LOCK:
+            _SQL_COMPILED[cache_key] = sql
+    return prepare_sql(sql, **params)
 
-    df = pd.read_sql_query(sql_query, engine)
-    engine.dispose()
 
+#=================================================================================================
+# LECTURE SQL EN STREAMING (curseur serveur + schéma déclaré + dataset Parquet)
+# Le résultat n'est jamais matérialisé en entier : chaque morceau de `chunksize` lignes est typé
+# (dates en datetime64, codes en category, drapeaux en int8/bool) puis écrit tel quel.
+#=================================================================================================
+SQL_CHUNK_SIZE = int(os.getenv("CARIS_SQL_CHUNK_SIZE", "50000"))
+
+
+def apply_sql_schema(df: pd.DataFrame, schema: Optional[dict]) -> pd.DataFrame:
+    """
+    Type les colonnes d'un résultat SQL selon un schéma déclaré
+    {colonne: "date" | "category" | "int8" | "int" | "bool" | "float" | "string"}.
+    Les valeurs invalides (ex. dates '0000-00-00') deviennent manquantes.
+    """
+    if not schema:
+        return df
+    df = df.copy()
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        if kind == "date":
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif kind == "category":
+            df[col] = df[col].astype("category")
+        elif kind == "int8":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int8")
+        elif kind == "int":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        elif kind == "bool":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("boolean")
+        elif kind == "float":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        elif kind == "string":
+            df[col] = df[col].astype("string")
+        else:
+            raise ValueError(f"Type de colonne inconnu pour {col}: {kind}")
     return df
 
+
+def iter_query_chunks(sql, schema: Optional[dict] = None, chunksize: int = SQL_CHUNK_SIZE,
+                      db_uri: Optional[str] = None, db_config: Optional[dict] = None,
+                      env_path: Optional[str] = None, params=None):
+    """
+    Générateur de DataFrames typés de `chunksize` lignes, lus avec un curseur côté serveur
+    (stream_results) : la mémoire reste bornée par la taille d'un morceau.
+    """
+    engine = get_engine(db_uri, db_config, env_path)
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+        for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+            yield apply_sql_schema(chunk, schema)
+
+
+def _arrow_schema(table, schema: Optional[dict]):
+    """Schéma Arrow figé sur le premier morceau (types déclarés, colonnes vides en string)."""
+    import pyarrow as pa
+    declared = {
+        "date": pa.timestamp("ns"), "category": pa.dictionary(pa.int32(), pa.string()),
+        "int8": pa.int8(), "int": pa.int64(), "bool": pa.bool_(), "float": pa.float64(), "string": pa.string(),
+    }
+    fields = []
+    for field in table.schema:
+        kind = (schema or {}).get(field.name)
+        if kind:
+            fields.append(pa.field(field.name, declared[kind]))
+        elif pa.types.is_null(field.type):
+            fields.append(pa.field(field.name, pa.string()))
+        else:
+            fields.append(field)
+    return pa.schema(fields)
+
+
+def stream_query_to_parquet(sql, dest_dir, schema: Optional[dict] = None, chunksize: int = SQL_CHUNK_SIZE,
+                            db_uri: Optional[str] = None, db_config: Optional[dict] = None,
+                            env_path: Optional[str] = None, params=None) -> int:
+    """
+    Écrit le résultat d'une requête en dataset Parquet (un fichier part-NNNNN.parquet par morceau)
+    sans jamais le charger en entier. Le dataset est remplacé atomiquement à la fin.
+    Relecture : pd.read_parquet(dest_dir).
+
+    Returns:
+        int: nombre de lignes écrites
+    """
+    import shutil
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dest_dir = Path(dest_dir)
+    tmp_dir = dest_dir.with_name(dest_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    arrow_schema, rows = None, 0
+    for i, chunk in enumerate(iter_query_chunks(sql, schema, chunksize, db_uri, db_config, env_path, params)):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if arrow_schema is None:
+            arrow_schema = _arrow_schema(table, schema)
+        pq.write_table(table.cast(arrow_schema), tmp_dir / f"part-{i:05d}.parquet")
+        rows += len(chunk)
+
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    os.replace(tmp_dir, dest_dir)
+    print(f"💾 {rows:,} lignes écrites en streaming dans {dest_dir}")
+    return rows
+
+
+def execute_sql_query(env_path: str, sql_file_path: str, schema: Optional[dict] = None,
+                      chunksize: Optional[int] = None, params: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Exécute un fichier sql/*.sql sur le pool partagé, en paramètres liés (load_sql) :
+    `params` remplace les `SET @x = ...` du fichier.
+    Avec `schema` ou `chunksize`, la lecture se fait en streaming et chaque morceau est typé.
+    """
+    sql, bound = load_sql(sql_file_path, **(params or {}))
+    if schema is None and chunksize is None:
+        return run_query(sql, env_path=env_path, params=bound)
+    chunks = list(iter_query_chunks(sql, schema, chunksize or SQL_CHUNK_SIZE, env_path=env_path, params=bound))
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    # pd.concat perd le type category quand les morceaux n'ont pas les mêmes modalités
+    return apply_sql_schema(df, {c: k for c, k in (schema or {}).items() if k == "category"})
+
+#=================================================================================================
+# EXTRACTION SQL INCRÉMENTALE PAR FENÊTRE
+# Les extraits datés (sessions de club, PCR) sont gardés localement en partitions mensuelles
+# Parquet ; chaque passage ne ré-interroge que les `refresh_days` derniers jours (pour capter
+# les saisies tardives) et remplace cette fenêtre dans le store. Le coût de la requête ne
+# grandit donc plus avec l'année.
+#=================================================================================================
+SQL_STORE_DIR = Path(os.environ.get("CARIS_SQL_STORE_DIR") or Path(__file__).resolve().parent.parent / "data" / ".sql_store")
+SQL_REFRESH_DAYS = int(os.getenv("CARIS_SQL_REFRESH_DAYS", "14"))
+# Ré-extraction complète périodique (0 = jamais) : rattrape les suppressions anciennes
+SQL_FULL_REFRESH_DAYS = int(os.getenv("CARIS_SQL_FULL_REFRESH_DAYS", "30"))
+_UNDATED_PARTITION = "undated"
+
+
+def _partition_labels(dates: pd.Series) -> pd.Series:
+    """Libellé de partition mensuelle (YYYY-MM) d'une colonne de dates."""
+    parsed = pd.to_datetime(dates, errors="coerce")
+    return parsed.dt.strftime("%Y-%m").fillna(_UNDATED_PARTITION)
+
+
+def _key_index(df: pd.DataFrame, key_cols: List[str]) -> pd.Index:
+    return pd.MultiIndex.from_frame(df[key_cols].astype(str)) if len(key_cols) > 1 else pd.Index(df[key_cols[0]].astype(str))
+
+
+def _write_partition(df: pd.DataFrame, path: Path) -> None:
+    tmp = path.with_suffix(".tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+    except Exception:
+        # colonnes mixtes : normalisées en texte
+        df.astype({c: "string" for c in df.columns if df[c].dtype == object}).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _refresh_from_window(history: pd.DataFrame, delta: pd.DataFrame, refresh_cols: Optional[dict]) -> pd.DataFrame:
+    """
+    Colonnes calculées sur tout l'historique côté serveur (ex. dernière présence d'un patient) :
+    pour chaque groupe présent dans la fenêtre, la valeur reçue fait foi et est reportée
+    sur ses lignes plus anciennes du store.
+
+    Args:
+        refresh_cols: {colonne: [colonnes de groupe]}
+    """
+    if history.empty or delta.empty or not refresh_cols:
+        return history
+    history = history.copy()
+    for col, group_cols in refresh_cols.items():
+        if col not in delta.columns or not set(group_cols) <= set(delta.columns):
+            continue
+        latest = delta.groupby([delta[g].astype(str) for g in group_cols])[col].first()
+        mapped = latest.reindex(_key_index(history, group_cols))
+        mask = mapped.notna().to_numpy()
+        history.loc[mask, col] = mapped.to_numpy()[mask]
+    return history
+
+
+def sync_sql_window(
+    store_name: str,
+    fetch,
+    start_date: str,
+    end_date: str,
+    date_col: str,
+    key_cols: Optional[List[str]] = None,
+    refresh_days: int = SQL_REFRESH_DAYS,
+    refresh_cols: Optional[dict] = None,
+    full_refresh: bool = False,
+) -> pd.DataFrame:
+    """
+    Synchronise un extrait SQL daté par fenêtre glissante et renvoie tout l'historique demandé.
+
+    Args:
+        store_name (str): nom du store local (dossier sous SQL_STORE_DIR)
+        fetch (callable): fetch(window_start) -> DataFrame des lignes datées de window_start à end_date ;
+                          doit lever une exception en cas d'erreur (une fenêtre vide est légitime)
+        start_date, end_date (str): période couverte par l'extrait ('YYYY-MM-DD')
+        date_col (str): colonne de date servant au partitionnement et à la fenêtre
+        key_cols (list): clés d'unicité ; une ligne stockée dont la clé revient dans la fenêtre est
+                         remplacée même si sa date est antérieure (ex. dernier PCR d'un enfant)
+        refresh_days (int): profondeur de la fenêtre ré-interrogée (CARIS_SQL_REFRESH_DAYS, 14 par défaut)
+        refresh_cols (dict): colonnes calculées sur tout l'historique à reporter depuis la fenêtre
+                             {colonne: [colonnes de groupe]} (voir _refresh_from_window)
+        full_refresh (bool): si True (ou CARIS_SQL_SYNC_FULL=1), ré-extrait toute la période ;
+                             c'est aussi le cas tous les CARIS_SQL_FULL_REFRESH_DAYS jours
+
+    Returns:
+        pd.DataFrame: lignes du store dont `date_col` est dans [start_date, end_date]
+    """
+    store_dir = SQL_STORE_DIR / store_name
+    state_path = store_dir / "state.json"
+    full_refresh = full_refresh or os.getenv("CARIS_SQL_SYNC_FULL", "0") in {"1", "true", "yes"}
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    state = {}
+    if state_path.exists() and not full_refresh:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    if state and pd.Timestamp(state["start_date"]) > start:
+        state = {}  # historique demandé plus ancien que le store
+    if state and SQL_FULL_REFRESH_DAYS > 0:
+        if datetime.now() - datetime.fromisoformat(state["full_synced_at"]) >= timedelta(days=SQL_FULL_REFRESH_DAYS):
+            state = {}
+
+    if state:
+        covered = min(pd.Timestamp(state["covered_until"]), end)
+        window_start = max(start, covered - timedelta(days=refresh_days))
+        print(f"🔄 {store_name}: fenêtre {window_start:%Y-%m-%d} → {end:%Y-%m-%d}")
+    else:
+        window_start = start
+        print(f"📥 {store_name}: extraction complète {start:%Y-%m-%d} → {end:%Y-%m-%d}")
+
+    t0 = time.perf_counter()
+    delta = fetch(window_start.strftime("%Y-%m-%d"))
+    print(f"⏱️ {store_name}: {len(delta):,} ligne(s) extraite(s) en {time.perf_counter() - t0:.1f}s")
+
+    if not state:
+        import shutil
+        shutil.rmtree(store_dir, ignore_errors=True)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    existing = {p.stem: p for p in store_dir.glob("*.parquet")}
+    delta_parts = _partition_labels(delta[date_col]) if not delta.empty else pd.Series(dtype=object)
+    window_label = window_start.strftime("%Y-%m")
+    affected = {label for label in existing if label == _UNDATED_PARTITION or label >= window_label}
+    affected |= set(delta_parts.unique())
+
+    delta_keys = None
+    if key_cols and not delta.empty:
+        delta_keys = _key_index(delta, key_cols)
+        for label, path in existing.items():
+            if label not in affected:
+                stored_keys = _key_index(pd.read_parquet(path, columns=key_cols), key_cols)
+                if stored_keys.isin(delta_keys).any():
+                    affected.add(label)
+
+    for label in sorted(affected):
+        kept = pd.DataFrame()
+        if label in existing:
+            kept = pd.read_parquet(existing[label])
+            dates = pd.to_datetime(kept[date_col], errors="coerce")
+            drop = (dates >= window_start) | dates.isna()
+            if delta_keys is not None:
+                drop |= _key_index(kept, key_cols).isin(delta_keys)
+            kept = kept[~drop]
+        fresh = delta[delta_parts == label] if not delta.empty else delta
+        part = pd.concat([kept, fresh], ignore_index=True) if not kept.empty else fresh.reset_index(drop=True)
+        path = store_dir / f"{label}.parquet"
+        if part.empty:
+            path.unlink(missing_ok=True)
+        else:
+            _write_partition(part, path)
+
+    partitions = [pd.read_parquet(p) for p in sorted(store_dir.glob("*.parquet"))]
+    history = pd.concat(partitions, ignore_index=True) if partitions else delta.iloc[0:0]
+    if not history.empty:
+        dates = pd.to_datetime(history[date_col], errors="coerce")
+        history = history[((dates >= start) & (dates < end + timedelta(days=1))) | dates.isna()].reset_index(drop=True)
+
+    full_synced_at = state.get("full_synced_at") or datetime.now().isoformat(timespec="seconds")
+    state = {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "covered_until": end.strftime("%Y-%m-%d"),
+        "refresh_days": refresh_days,
+        "rows": len(history),
+        "last_window_rows": len(delta),
+        "synced_at": datetime.now().isoformat(timespec="seconds"),
+        "full_synced_at": full_synced_at,
+    }
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+    print(f"✅ {store_name}: {len(history):,} lignes d'historique ({len(delta):,} rafraîchies)")
+    return _refresh_from_window(history, delta, refresh_cols)
+
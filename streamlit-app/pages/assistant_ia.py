@@ -10,8 +10,8 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.data_loader import load_depistage, load_enrolled
-from utils.kpi_calculator import calculate_kpis
+from utils.data_loader import load_depistage, load_enrolled, load_cube
+from utils.kpi_calculator import calculate_kpis, calculate_kpis_from_cube
 from utils.ai_chatbot import (
     query_gemini, build_meal_context, get_suggested_questions,
     initialize_chat_history, add_to_chat_history, clear_chat_history,
@@ -36,8 +36,12 @@ def render_assistant():
         if 'date_enrollement' in df_enrolled.columns:
             df_enrolled = df_enrolled[(df_enrolled['date_enrollement'].dt.date >= date_min) & (df_enrolled['date_enrollement'].dt.date <= date_max)]
 
-        # Calcul des KPIs sur la sélection actuelle
-        kpis = calculate_kpis(df_depistage, df_enrolled, "all")
+        # Calcul des KPIs sur la sélection actuelle (cube agrégé si disponible)
+        cube = load_cube()
+        if not cube.empty:
+            kpis = calculate_kpis_from_cube(cube, "all", start=date_min, end=date_max)
+        else:
+            kpis = calculate_kpis(df_depistage, df_enrolled, "all")
 
         # 1b. AFFICHAGE DU DATATABLE DES BÉNÉFICIAIRES FILTRÉS
         st.markdown("### Liste des bénéficiaires filtrés")
@@ -84,19 +88,26 @@ def render_assistant():
         df_enrolled = load_enrolled()
         
         # Application des filtres de la Sidebar (Bureau, Commune, Date)
+        cube_filters, start, end = {}, None, None
         if st.session_state.get("filter_office") != "Tous les Bureaux":
             df_enrolled = df_enrolled[df_enrolled['office'] == st.session_state.filter_office]
+            cube_filters["office"] = st.session_state.filter_office
             
         if "filter_commune" in st.session_state:
             df_enrolled = df_enrolled[df_enrolled['commune'].isin(st.session_state.filter_commune)]
+            cube_filters["commune"] = list(st.session_state.filter_commune)
             
         if "filter_date_range" in st.session_state and len(st.session_state.filter_date_range) == 2:
             start, end = st.session_state.filter_date_range
             df_enrolled = df_enrolled[(df_enrolled['date_enrollement'].dt.date >= start) & 
                                      (df_enrolled['date_enrollement'].dt.date <= end)]
 
-        # Calcul des KPIs sur la sélection actuelle
-        kpis = calculate_kpis(df_depistage, df_enrolled, "all")
+        # Calcul des KPIs sur la sélection actuelle (découpage du cube agrégé si disponible)
+        cube = load_cube()
+        if not cube.empty:
+            kpis = calculate_kpis_from_cube(cube, "all", start=start, end=end, **cube_filters)
+        else:
+            kpis = calculate_kpis(df_depistage, df_enrolled, "all")
 
 
     # 1b. AFFICHAGE DU DATATABLE DES BÉNÉFICIAIRES FILTRÉS
@@ -13,10 +13,13 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.data_loader import (
-    load_depistage, load_enrolled, refresh_data
+    load_depistage, load_enrolled, load_cube, refresh_data
 )
 from utils.kpi_calculator import (
-    calculate_kpis, get_period_label, get_comparison_metrics
+    calculate_kpis, get_period_label, get_comparison_metrics,
+    get_comparison_metrics_from_cube, cube_has,
+    enrollment_summary_from_cube, impact_by_office_from_cube,
+    enrollment_trend_from_cube, enrollment_by_age_from_cube
 )
 from components.charts import (
     create_modern_area_chart, create_grouped_bar_v2
@@ -34,20 +37,42 @@ def render_dashboard():
 
     # Application des filtres de la sidebar (Synchronisation temps réel)
     df = df_all.copy()
+    # Mêmes filtres, appliqués au cube agrégé (KPIs, tendance, impact par bureau)
+    cube = load_cube()
+    cube_filters = {}
+    start = end = None
     
     if st.session_state.get("filter_office") != "Tous les Bureaux":
         df = df[df['office'] == st.session_state.filter_office]
+        cube_filters["office"] = st.session_state.filter_office
     
     if "filter_commune" in st.session_state:
         df = df[df['commune'].isin(st.session_state.filter_commune)]
+        cube_filters["commune"] = list(st.session_state.filter_commune)
     
     if "filter_date_range" in st.session_state and len(st.session_state.filter_date_range) == 2:
         start, end = st.session_state.filter_date_range
         df = df[(df['date_enrollement'].dt.date >= start) & (df['date_enrollement'].dt.date <= end)]
-        # Calcul des tendances via le comparateur temporel
-        metrics_trend = get_comparison_metrics(df_all, start, end)
+        # Calcul des tendances via le comparateur temporel (cube agrégé si disponible)
+        if not cube.empty:
+            metrics_trend = get_comparison_metrics_from_cube(cube, start, end, **cube_filters)
+        else:
+            metrics_trend = get_comparison_metrics(df_all, start, end)
     else:
         metrics_trend = {"trend_dep": 0.0, "period_label": "vs Période précédente"}
+    
+    # KPIs, tendance, âges et impact par bureau : découpage du cube ;
+    # lignes filtrées si le cube est absent ou d'une version antérieure
+    use_cube = cube_has(cube, "enrolled_exeats", "menages", "benef_indirects")
+    if use_cube:
+        cards = enrollment_summary_from_cube(cube, start, end, **cube_filters)
+    else:
+        cards = {
+            "enrolled": len(df),
+            "benef_indirects": int(df['household_number'].sum()),
+            "enrolled_actifs": int((df['actif'] == 'yes').sum()),
+            "enrolled_exeats": int((df['actif'] == 'no').sum()),
+        }
 
     # 2. SECTION HEADER & KPIs (NextAdmin Style)
     st.markdown(f'<h1 style="color:white; margin-bottom:0;">Tableau de Bord MEAL</h1>', unsafe_allow_html=True)
@@ -59,7 +84,7 @@ def render_dashboard():
         st.markdown(f"""
             <div class="kpi-card-v2">
                 <div class="kpi-title">Enrôlements</div>
-                <div class="kpi-value-v2">{len(df):,}</div>
+                <div class="kpi-value-v2">{cards['enrolled']:,}</div>
                 <div class="{"trend-up" if metrics_trend['trend_dep'] >= 0 else "trend-down"}">
                     {"▲" if metrics_trend['trend_dep'] >= 0 else "▼"} {abs(metrics_trend['trend_dep'])}% 
                     <span style="color:#94a3b8">{metrics_trend['period_label']}</span>
@@ -68,7 +93,7 @@ def render_dashboard():
         """, unsafe_allow_html=True)
 
     with col2:
-        benef_total = int(df['household_number'].sum())
+        benef_total = cards['benef_indirects']
         st.markdown(f"""
             <div class="kpi-card-v2">
                 <div class="kpi-title">Bénéficiaires Indirects</div>
@@ -78,8 +103,8 @@ def render_dashboard():
         """, unsafe_allow_html=True)
 
     with col3:
-        # On déduit les enfants actifs de la colonne 'actif' (yes/no)
-        actifs = len(df[df['actif'] == 'yes'])
+        # Enfants actifs : colonne 'actif' (yes/no) des enrôlés
+        actifs = cards['enrolled_actifs']
         st.markdown(f"""
             <div class="kpi-card-v2">
                 <div class="kpi-title">Enfants Actifs</div>
@@ -89,7 +114,7 @@ def render_dashboard():
         """, unsafe_allow_html=True)
 
     with col4:
-        exeats = len(df[df['actif'] == 'no'])
+        exeats = cards['enrolled_exeats']
         st.markdown(f"""
             <div class="kpi-card-v2">
                 <div class="kpi-title">Enfants Exeatés</div>
@@ -107,14 +132,20 @@ def render_dashboard():
         freq_choice = st.selectbox("Fréquence d'analyse", ["Jour", "Semaine", "Mois", "Année"], index=2, key="freq_selector")
         freq_map = {"Jour": "D", "Semaine": "W", "Mois": "M", "Année": "Y"}
         
-        df_ts = df.set_index('date_enrollement').resample(freq_map[freq_choice]).size().reset_index(name='Nombre')
+        if use_cube:
+            df_ts = enrollment_trend_from_cube(cube, freq_map[freq_choice], start, end, **cube_filters)
+        else:
+            df_ts = df.set_index('date_enrollement').resample(freq_map[freq_choice]).size().reset_index(name='Nombre')
         fig_ts = create_modern_area_chart(df_ts, 'date_enrollement', 'Nombre', f"Enrôlements par {freq_choice}")
         st.plotly_chart(fig_ts, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
     with col_age:
         st.markdown('<div class="chart-container-v2"><h3>👶 Par Tranche d\'Âge</h3>', unsafe_allow_html=True)
-        age_stats = df['age_range'].value_counts().reset_index()
+        if use_cube:
+            age_stats = enrollment_by_age_from_cube(cube, start, end, **cube_filters)
+        else:
+            age_stats = df['age_range'].value_counts().reset_index()
         st.bar_chart(age_stats, x='age_range', y='count', color='#7c3aed')
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -130,10 +161,13 @@ def render_dashboard():
 
     with col_impact:
         st.markdown('<div class="chart-container-v2"><h3>🏠 Impact Social par Bureau</h3>', unsafe_allow_html=True)
-        impact_stats = df.groupby('office').agg(
-            menages_comptes=('has_household', lambda x: (x == 'yes').sum()),
-            benef_indirects=('household_number', 'sum')
-        ).reset_index()
+        if use_cube:
+            impact_stats = impact_by_office_from_cube(cube, start, end, **cube_filters)
+        else:
+            impact_stats = df.groupby('office').agg(
+                menages_comptes=('has_household', lambda x: (x == 'yes').sum()),
+                benef_indirects=('household_number', 'sum')
+            ).reset_index()
         st.dataframe(impact_stats, use_container_width=True, hide_index=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
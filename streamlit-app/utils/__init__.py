@@ -7,6 +7,7 @@ from .data_loader import (
     load_waiting_list,
     load_club_data,
     load_suivi,
+    load_cube,
     get_data_path,
     filter_by_date,
     previous_week_bounds,
@@ -31,7 +32,16 @@ from .kpi_calculator import (
     calculate_malnutrition_distribution,
     get_mas_alert_data,
     format_kpi_delta,
-    get_period_label
+    get_period_label,
+    period_bounds,
+    slice_cube,
+    cube_has,
+    calculate_kpis_from_cube,
+    enrollment_summary_from_cube,
+    impact_by_office_from_cube,
+    enrollment_trend_from_cube,
+    enrollment_by_age_from_cube,
+    get_comparison_metrics_from_cube
 )
 
 from .email_service import (
@@ -59,6 +69,7 @@ __all__ = [
     'load_waiting_list',
     'load_club_data',
     'load_suivi',
+    'load_cube',
     'get_data_path',
     'filter_by_date',
     'previous_week_bounds',
@@ -83,6 +94,15 @@ __all__ = [
     'get_mas_alert_data',
     'format_kpi_delta',
     'get_period_label',
+    'period_bounds',
+    'slice_cube',
+    'cube_has',
+    'calculate_kpis_from_cube',
+    'enrollment_summary_from_cube',
+    'impact_by_office_from_cube',
+    'enrollment_trend_from_cube',
+    'enrollment_by_age_from_cube',
+    'get_comparison_metrics_from_cube',
     
     # Email service
     'send_mas_alert',
@@ -104,6 +104,25 @@ def load_suivi() -> pd.DataFrame:
     return pd.read_excel(data_path)
 
 
+@st.cache_data(ttl=3600)
+def load_cube() -> pd.DataFrame:
+    """
+    Charge le cube agrégé nutrition_cube.parquet (écrit par nutrition_pipeline.py).
+    
+    Returns:
+        DataFrame (day, office, commune, age_range, manutrition_type, enrrolled_where
+        + mesures additives), vide si le fichier n'existe pas encore
+    """
+    data_path = get_data_path() / "nutrition_cube.parquet"
+    
+    if not data_path.exists():
+        return pd.DataFrame()
+    
+    df = pd.read_parquet(data_path)
+    df['day'] = pd.to_datetime(df['day'], errors='coerce')
+    return df
+
+
 # ============================================
 # FONCTIONS DE FILTRAGE TEMPOREL
 # ============================================
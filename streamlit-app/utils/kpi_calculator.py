@@ -296,6 +296,177 @@ def get_mas_alert_data(df: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
+# ============================================
+# KPIs À PARTIR DU CUBE AGRÉGÉ
+# ============================================
+
+def period_bounds(period: str, ref_date: Optional[date] = None) -> tuple:
+    """Retourne (début, fin) de la période nommée ('all' => depuis 2020)."""
+    ref_date = ref_date or date.today()
+    bounds = {
+        "current_week": current_week_bounds,
+        "previous_week": previous_week_bounds,
+        "current_month": current_month_bounds,
+        "previous_month": previous_month_bounds,
+        "last_3_months": last_three_months_bounds,
+    }
+    if period in bounds:
+        return bounds[period](ref_date)
+    return date(2020, 1, 1), ref_date
+
+
+def slice_cube(cube: pd.DataFrame,
+               start: Optional[date] = None,
+               end: Optional[date] = None,
+               **filters) -> pd.DataFrame:
+    """
+    Découpe le cube sur [start, end] et sur des valeurs de dimensions.
+    
+    Args:
+        filters: dimension=valeur ou dimension=[valeurs], ex. office="PAP", commune=["Cap-Haïtien"]
+    """
+    if cube.empty:
+        return cube
+    mask = pd.Series(True, index=cube.index)
+    if start is not None:
+        mask &= cube['day'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= cube['day'] <= pd.Timestamp(end)
+    for dim, value in filters.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= cube[dim].isin(values)
+    return cube[mask]
+
+
+def cube_has(cube: pd.DataFrame, *measures: str) -> bool:
+    """True si le cube est chargé et contient les mesures demandées (cube d'une version antérieure sinon)."""
+    return not cube.empty and all(m in cube.columns for m in measures)
+
+
+def calculate_kpis_from_cube(cube: pd.DataFrame,
+                             period: str = "current_month",
+                             start: Optional[date] = None,
+                             end: Optional[date] = None,
+                             **filters) -> Dict[str, Any]:
+    """
+    Mêmes KPIs que calculate_kpis, calculés par découpage du cube.
+    
+    Args:
+        cube: cube chargé par load_cube()
+        period: voir calculate_kpis
+        start, end: bornes explicites (remplacent celles de la période)
+        filters: filtres de dimensions (voir slice_cube)
+    """
+    p_start, p_end = period_bounds(period)
+    start, end = start or p_start, end or p_end
+    sl = slice_cube(cube, start, end, **filters)
+    dep = sl[sl['depistages'] > 0] if not sl.empty else sl
+    
+    def _sum(col, mask=None):
+        if sl.empty:
+            return 0
+        return int(sl.loc[mask, col].sum()) if mask is not None else int(sl[col].sum())
+    
+    kpis = {
+        "period": period,
+        "period_start": start,
+        "period_end": end,
+        "total_depistages": _sum('depistages'),
+        "depistages_eligibles": _sum('eligibles'),
+        "total_enrolled": _sum('enrolled'),
+        "enrolled_actifs": _sum('enrolled_actifs'),
+        "cas_mas": _sum('depistages', sl['manutrition_type'] == 'MAS') if not sl.empty else 0,
+        "cas_mam": _sum('depistages', sl['manutrition_type'] == 'MAM') if not sl.empty else 0,
+        "cas_normal": _sum('depistages', sl['manutrition_type'] == 'Normal') if not sl.empty else 0,
+        "nb_bureaux": dep['office'].nunique() if not dep.empty else 0,
+        "nb_communes": dep['commune'].nunique() if not dep.empty else 0,
+    }
+    
+    if kpis["depistages_eligibles"] > 0:
+        kpis["taux_admission"] = round((kpis["total_enrolled"] / kpis["depistages_eligibles"]) * 100, 1)
+    else:
+        kpis["taux_admission"] = 0.0
+    
+    if kpis["total_depistages"] > 0:
+        kpis["proportion_mas"] = round((kpis["cas_mas"] / kpis["total_depistages"]) * 100, 1)
+        kpis["proportion_mam"] = round((kpis["cas_mam"] / kpis["total_depistages"]) * 100, 1)
+    else:
+        kpis["proportion_mas"] = 0.0
+        kpis["proportion_mam"] = 0.0
+    
+    return kpis
+
+
+def enrollment_summary_from_cube(cube: pd.DataFrame,
+                                 start: Optional[date] = None,
+                                 end: Optional[date] = None,
+                                 **filters) -> Dict[str, int]:
+    """Cartes du dashboard : enrôlements, bénéficiaires indirects, actifs et exeatés de la sélection."""
+    sl = slice_cube(cube, start, end, **filters)
+    return {m: int(sl[m].sum()) if not sl.empty else 0
+            for m in ("enrolled", "benef_indirects", "enrolled_actifs", "enrolled_exeats")}
+
+
+def impact_by_office_from_cube(cube: pd.DataFrame,
+                               start: Optional[date] = None,
+                               end: Optional[date] = None,
+                               **filters) -> pd.DataFrame:
+    """Impact social par bureau (ménages comptés, bénéficiaires indirects) des enrôlés de la sélection."""
+    sl = slice_cube(cube, start, end, **filters)
+    if sl.empty:
+        return pd.DataFrame(columns=['office', 'menages_comptes', 'benef_indirects'])
+    sl = sl[sl['enrolled'] > 0]
+    impact = sl.groupby('office', as_index=False).agg(
+        menages_comptes=('menages', 'sum'),
+        benef_indirects=('benef_indirects', 'sum'),
+    )
+    return impact.astype({'menages_comptes': int, 'benef_indirects': int})
+
+
+def enrollment_trend_from_cube(cube: pd.DataFrame,
+                               freq: str = "M",
+                               start: Optional[date] = None,
+                               end: Optional[date] = None,
+                               **filters) -> pd.DataFrame:
+    """Enrôlements par période (`freq` pandas : D, W, M, Y) ; mêmes colonnes que le resample des lignes."""
+    sl = slice_cube(cube, start, end, **filters)
+    sl = sl[sl['enrolled'] > 0] if not sl.empty else sl
+    if sl.empty:
+        return pd.DataFrame(columns=['date_enrollement', 'Nombre'])
+    trend = sl.set_index('day')['enrolled'].resample(freq).sum()
+    return trend.rename_axis('date_enrollement').reset_index(name='Nombre')
+
+
+def enrollment_by_age_from_cube(cube: pd.DataFrame,
+                                start: Optional[date] = None,
+                                end: Optional[date] = None,
+                                **filters) -> pd.DataFrame:
+    """Enrôlements par tranche d'âge (colonnes age_range, count), tranche inconnue ("---") exclue."""
+    sl = slice_cube(cube, start, end, **filters)
+    if sl.empty:
+        return pd.DataFrame(columns=['age_range', 'count'])
+    by_age = sl[sl['age_range'] != '---'].groupby('age_range')['enrolled'].sum()
+    by_age = by_age[by_age > 0].astype(int).sort_values(ascending=False)
+    return by_age.reset_index(name='count')
+
+
+def get_comparison_metrics_from_cube(cube: pd.DataFrame, start_date, end_date,
+                                     measure: str = 'enrolled', **filters) -> Dict[str, Any]:
+    """Équivalent de get_comparison_metrics (période courante vs précédente de même durée) sur le cube."""
+    delta = end_date - start_date
+    prev_start = start_date - delta - pd.Timedelta(days=1)
+    prev_end = start_date - pd.Timedelta(days=1)
+    curr_total = int(slice_cube(cube, start_date, end_date, **filters)[measure].sum())
+    prev_total = int(slice_cube(cube, prev_start, prev_end, **filters)[measure].sum())
+    return {
+        "depistages": curr_total,
+        "trend_dep": calculate_trend(curr_total, prev_total),
+        "period_label": f"vs {prev_start.strftime('%d/%m')} - {prev_end.strftime('%d/%m')}"
+    }
+
+
 def format_kpi_delta(current: float, previous: float) -> tuple:
     """
     Calcule le delta entre deux valeurs pour affichage.